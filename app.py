@@ -1,31 +1,56 @@
 import os
 import logging
 import json
-import datetime
-from openai import OpenAI  # Import OpenAI client
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, Response, stream_with_context, g
 from pathlib import Path
 
 # Import utils
-from utils.promptlayer_api import get_all_templates, get_template_details, check_api_connection
-from utils.openai_api import generate_completion, suggest_prompt_improvements, call_jija_comp_gpt, client
-from config import OPENAI_API_KEY
-
-# Use the pre-initialized client from openai_api.py
+from utils.promptlayer_api import get_all_templates, get_template_details, parse_template_id, check_api_connection, invalidate_template_cache, get_template_cache_stats, start_template_refresher, start_template_warmup, get_warmup_status
+from utils.completion_cache import completion_cache
+from utils.batch_runner import start_batch_job, start_jija_batch_job, get_batch_job, JijaBatchJob
+from utils.rate_limiter import get_limiter_stats
+from utils.openai_api import generate_completion, call_jija_comp_gpt, stream_completion, stream_jija_comp_gpt, improve_prompt_fields, iter_prompt_improvements, validate_messages, get_client
+from utils.template_normalizer import normalize_message_roles
+from utils.health import start_readiness_checks, run_readiness_checks, get_health, get_readiness
+from utils.diff_engine import diff_texts, diff_template_fields, GRANULARITIES, TEMPLATE_DIFF_FIELDS
+from utils.job_queue import job_queue, TERMINAL_STATES
+from utils.export_store import export_store
+from utils.csv_ingest import ingest_chat_csv, get_chat_page, iter_chat_markdown, chat_csv_store
+from utils.version_history import version_index, sync_template_versions, get_template_version, diff_template_versions
+from utils.metrics import record_http_request, render_metrics
+from utils.structured_logging import configure_logging, log_event
 
 # Import config
-from config import PORT, PROMPTLAYER_API_KEY, OPENAI_API_KEY
+from config import PORT, PROMPTLAYER_API_KEY, OPENAI_API_KEY, GENERATION_MAX_WORKERS, GENERATION_BATCH_LIMIT
+from config import TEMPLATE_WARMUP_ON_START, TEMPLATE_WARMUP_LIMIT, TEMPLATE_WARMUP_CONCURRENCY, BATCH_DIR, BATCH_CONCURRENCY
+from config import STARTUP_CHECKS, READINESS_RETRY_INTERVAL, DIFF_MAX_CHARS, TEMPLATE_VERSION_DIFF_LIMIT, CSV_UPLOAD_PAGE_SIZE
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (LOG_FORMAT, LOG_LEVEL, LOG_ASYNC and LOG_SAMPLE_RATES in config)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Time every request under its route pattern (not the raw path) so label counts stay bounded."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        record_http_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+# Shared pool for running OpenAI generations side by side (bounded so a burst can't spawn unlimited threads)
+generation_executor = ThreadPoolExecutor(max_workers=GENERATION_MAX_WORKERS, thread_name_prefix="generation")
+
 # Check if API keys are set
 if not PROMPTLAYER_API_KEY:
     logger.error("PromptLayer API key is not set")
@@ -35,10 +60,26 @@ if not OPENAI_API_KEY:
     logger.error("OpenAI API key is not set")
     raise ValueError("OpenAI API key is not set. Please set OPENAI_API_KEY in .env file.")
 
-# Check if PromptLayer API is accessible
-if not check_api_connection():
-    logger.error("PromptLayer API is not accessible")
-    raise ConnectionError("PromptLayer API is not accessible. Please check your API key and connection.")
+# Check that PromptLayer is accessible and load the OpenAI SDK. By default this runs in the background
+# so the app serves (and reports progress at /ready) immediately
+readiness_checks = {
+    "promptlayer": check_api_connection,
+    "openai_client": get_client
+}
+if STARTUP_CHECKS == "blocking":
+    if not run_readiness_checks(readiness_checks):
+        failed = [name for name, result in get_readiness()["checks"].items() if result["state"] != "ok"]
+        logger.error(f"Startup checks failed: {', '.join(failed)}")
+        raise ConnectionError(f"Startup checks failed: {', '.join(failed)}. Please check your API keys and connection.")
+else:
+    start_readiness_checks(readiness_checks, READINESS_RETRY_INTERVAL)
+
+# Keep cached templates fresh in the background
+start_template_refresher()
+
+# Optionally prefetch every template so the first user doesn't pay the cold fetch
+if TEMPLATE_WARMUP_ON_START:
+    start_template_warmup(TEMPLATE_WARMUP_LIMIT or None, TEMPLATE_WARMUP_CONCURRENCY)
 
 # Routes
 @app.route('/')
@@ -71,403 +112,520 @@ def markdown_compare():
         logger.error(f"Error loading markdown comparison interface: {str(e)}")
         return render_template('markdown_compare.html', error_message=f"Error: {str(e)}")
 
+def template_version_details(template_name, version):
+    """Details of one version of a named template from the version index, as (body, status)."""
+    template_id = parse_template_id(template_name)
+    if not template_id:
+        return {'error': f"No template ID found in: {template_name}"}, 400
+    template = get_template_version(template_id, version)
+    if template is None:
+        return {'error': f"Template {template_id} has no version {version}"}, 404
+    return template, 200
+
 @app.route('/template/<template_name>')
 def get_template(template_name):
-    """Get template details."""
+    """Get template details (the latest version, or ?version=N)."""
     try:
+        version = request.args.get('version', type=int)
+        if version:
+            body, status = template_version_details(template_name, version)
+            return jsonify(body), status
         template_details = get_template_details(template_name)
         return jsonify(template_details)
     except Exception as e:
         logger.error(f"Error getting template details: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def request_flag(data, name):
+    """A boolean request field, or None when it was not sent (so the default policy applies)."""
+    value = (data or {}).get(name)
+    if value is None:
+        return None
+    return value not in [False, 'false', 'False', 0, '0']
+
+def wants_coalescing(data):
+    """
+    A request's "coalesce" choice: True to share an identical in-flight call even when sampling,
+    False to never share, or None (not sent) for the default (see utils.single_flight.should_coalesce).
+    """
+    return request_flag(data, 'coalesce')
+
+def build_generation_params(data):
+    """
+    Turn a generation request body into keyword arguments for generate_completion.
+    A "messages" list, when given, is passed through as the full conversation.
+    Raises ValueError/TypeError if a numeric parameter cannot be converted or messages is malformed.
+    """
+    # Extract required fields
+    system_message = data.get('system_message', '')
+    user_message = data.get('user_message', '')
+    assistant_message = data.get('assistant_message', '')
+    
+    # Full multi-turn conversation (takes precedence over the single message fields)
+    messages = data.get('messages')
+    if messages is not None:
+        messages = normalize_message_roles(messages)
+        validate_messages(messages)
+    
+    # Get model (allow custom GPT selection)
+    model = data.get('model', 'gpt-4o')
+    
+    # Deterministic requests are cached by default; "use_cache" skips the cache, or opts a sampled request in
+    use_cache = request_flag(data, 'use_cache')
+    coalesce = wants_coalescing(data)
+    
+    # Get numeric parameters with proper type conversion and validation
+    temperature = float(data.get('temperature', 0.7))
+    max_tokens = int(data.get('max_tokens', 500))
+    
+    # Get additional numeric parameters if they exist
+    top_p = float(data.get('top_p', 1.0)) if 'top_p' in data else 1.0
+    frequency_penalty = float(data.get('frequency_penalty', 0.0)) if 'frequency_penalty' in data else 0.0
+    presence_penalty = float(data.get('presence_penalty', 0.0)) if 'presence_penalty' in data else 0.0
+    
+    # Add these parameters directly to a clean params dictionary
+    params = {
+        'top_p': top_p,
+        'frequency_penalty': frequency_penalty,
+        'presence_penalty': presence_penalty
+    }
+    
+    # Add any other parameters that aren't already handled
+    for key, value in data.items():
+        if key not in ['system_message', 'user_message', 'assistant_message', 'model', 'temperature', 'max_tokens', 
+                      'version', 'id', 'top_p', 'frequency_penalty', 'presence_penalty', 'use_cache', 'coalesce', 'messages',
+                      'background']:
+            params[key] = value
+    
+    # Only names and sizes are logged, never message text
+    log_event(logger, "generation.params", model=model, temperature=temperature, max_tokens=max_tokens,
+              top_p=top_p, frequency_penalty=frequency_penalty, presence_penalty=presence_penalty,
+              messages=len(messages) if messages else None, extra_params=sorted(params))
+    
+    return {
+        'user_message': user_message,
+        'system_message': system_message,
+        'assistant_message': assistant_message,
+        'model': model,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+        'use_cache': use_cache,
+        'coalesce': coalesce,
+        'messages': messages,
+        **params
+    }
+
+# How the OpenAI helpers report a failed call in place of the response text
+ERROR_RESPONSE_PREFIXES = ("Error generating response:", "Error calling JiJa simulation:")
+
+def fail_on_error_text(response):
+    """Raise a failure reported as response text, so the job queue marks the job failed with it."""
+    if isinstance(response, str) and response.startswith(ERROR_RESPONSE_PREFIXES):
+        raise RuntimeError(response)
+    return response
+
+def run_generation_job(data):
+    """Generate one response for a request body (run by the job queue; a failed generation fails the job)."""
+    return {'response': fail_on_error_text(generate_completion(**build_generation_params(data)))}
+
+def wants_background(data):
+    """Whether a request asked to run as a background job ("background": true or Prefer: respond-async)."""
+    return bool((data or {}).get('background')) or 'respond-async' in request.headers.get('Prefer', '')
+
+def enqueue_job(kind, data):
+    """Queue a job for a request body and answer 202 with where to follow it."""
+    payload = {key: value for key, value in (data or {}).items() if key != 'background'}
+    job = job_queue.submit(kind, payload)
+    response = jsonify({
+        **job,
+        'status_url': url_for('job_status', job_id=job['job_id']),
+        'events_url': url_for('job_events', job_id=job['job_id'])
+    })
+    response.headers['Location'] = url_for('job_status', job_id=job['job_id'])
+    return response, 202
+
 @app.route('/generate_response', methods=['POST'])
 def generate_response():
     """Generate a single response for a template."""
     try:
         data = request.json
-        logger.info(f"Received generation request data: {data}")
+        log_event(logger, "generation.request", fields=sorted(data or {}))
         
-        # Extract required fields
-        system_message = data.get('system_message', '')
-        user_message = data.get('user_message', '')
-        assistant_message = data.get('assistant_message', '')
+        try:
+            generation_params = build_generation_params(data)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Parameter conversion error: {str(e)}")
+            return jsonify({'error': f"Parameter error: {str(e)}"}), 400
         
-        # Get model (allow custom GPT selection)
-        model = data.get('model', 'gpt-4o')
+        if wants_background(data):
+            return enqueue_job('generate_response', data)
+        
+        # Generate response
+        response = generate_completion(**generation_params)
+        
+        return jsonify({
+            'response': response
+        })
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def sse_response(events):
+    """Wrap a generator of event dicts as a Server-Sent Events response."""
+    def encode():
+        for event in events:
+            yield f"data: {json.dumps(event)}\n\n"
+    
+    return Response(
+        stream_with_context(encode()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+        }
+    )
+
+@app.route('/generate_response_stream', methods=['POST'])
+def generate_response_stream():
+    """Stream a single response for a template as Server-Sent Events."""
+    try:
+        data = request.json
+        logger.info("Received streaming generation request")
         
-        # Get numeric parameters with proper type conversion and validation
         try:
-            temperature = float(data.get('temperature', 0.7))
-            max_tokens = int(data.get('max_tokens', 500))
-            
-            # Get additional numeric parameters if they exist
-            top_p = float(data.get('top_p', 1.0)) if 'top_p' in data else 1.0
-            frequency_penalty = float(data.get('frequency_penalty', 0.0)) if 'frequency_penalty' in data else 0.0
-            presence_penalty = float(data.get('presence_penalty', 0.0)) if 'presence_penalty' in data else 0.0
-            
-            logger.info(f"Params - Temp: {temperature}, Max Tokens: {max_tokens}, Top P: {top_p}, " +
-                      f"Freq Penalty: {frequency_penalty}, Presence Penalty: {presence_penalty}")
+            generation_params = build_generation_params(data)
         except (ValueError, TypeError) as e:
             logger.error(f"Parameter conversion error: {str(e)}")
             return jsonify({'error': f"Parameter error: {str(e)}"}), 400
         
-        # Add these parameters directly to a clean params dictionary
-        params = {
-            'top_p': top_p,
-            'frequency_penalty': frequency_penalty,
-            'presence_penalty': presence_penalty
+        return sse_response(stream_completion(**generation_params))
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def run_generations(requests_data):
+    """
+    Run several generate_completion calls at the same time on the shared pool.
+    Results come back in the same order as the requests, each with its own timing.
+    """
+    def timed_generation(generation_params):
+        started = time.perf_counter()
+        response = generate_completion(**generation_params)
+        return {
+            'response': response,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
         }
+    
+    # Validate everything up front so a bad side doesn't waste an API call on the other
+    all_params = [build_generation_params(item or {}) for item in requests_data]
+    
+    futures = [generation_executor.submit(timed_generation, params) for params in all_params]
+    return [future.result() for future in futures]
+
+@app.route('/generate_pair', methods=['POST'])
+def generate_pair():
+    """Generate the left and right responses concurrently."""
+    try:
+        data = request.json
+        logger.info("Received pair generation request")
         
-        # Add any other parameters that aren't already handled
-        for key, value in data.items():
-            if key not in ['system_message', 'user_message', 'assistant_message', 'model', 'temperature', 'max_tokens', 
-                          'version', 'id', 'top_p', 'frequency_penalty', 'presence_penalty']:
-                params[key] = value
+        started = time.perf_counter()
+        try:
+            left_result, right_result = run_generations([data.get('left', {}), data.get('right', {})])
+        except (ValueError, TypeError) as e:
+            logger.error(f"Parameter conversion error: {str(e)}")
+            return jsonify({'error': f"Parameter error: {str(e)}"}), 400
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
         
-        # Log the parameters we're using
-        logger.info(f"Final generation parameters: {params}")
+        logger.info(f"Pair generation finished in {elapsed_ms}ms " +
+                    f"(left {left_result['elapsed_ms']}ms, right {right_result['elapsed_ms']}ms)")
         
-        # Generate response
-        response = generate_completion(
-            user_message=user_message,
-            system_message=system_message,
-            assistant_message=assistant_message,
-            model=model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            **params
-        )
+        return jsonify({
+            'left': left_result,
+            'right': right_result,
+            'elapsed_ms': elapsed_ms
+        })
+    except Exception as e:
+        logger.error(f"Error generating response pair: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """Generate responses for a list of requests concurrently."""
+    try:
+        data = request.json
+        requests_data = data.get('requests', [])
+        
+        if not isinstance(requests_data, list) or not requests_data:
+            return jsonify({'error': 'requests must be a non-empty list'}), 400
+        
+        if len(requests_data) > GENERATION_BATCH_LIMIT:
+            return jsonify({'error': f"At most {GENERATION_BATCH_LIMIT} requests are allowed per batch"}), 400
+        
+        logger.info(f"Received batch generation request with {len(requests_data)} items")
+        
+        started = time.perf_counter()
+        try:
+            results = run_generations(requests_data)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Parameter conversion error: {str(e)}")
+            return jsonify({'error': f"Parameter error: {str(e)}"}), 400
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        
+        logger.info(f"Batch generation of {len(results)} items finished in {elapsed_ms}ms")
         
         return jsonify({
-            'response': response
+            'results': results,
+            'elapsed_ms': elapsed_ms
         })
     except Exception as e:
-        logger.error(f"Error generating response: {str(e)}")
+        logger.error(f"Error generating response batch: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def prepare_suggestion_request(data):
+    """
+    Read a suggestion request body.
+    Returns the message fields, model and which fields to improve.
+    """
+    system_message = data.get('system_message', '')
+    user_message = data.get('user_message', '')
+    assistant_message = data.get('assistant_message', '')
+    model = data.get('model', 'gpt-3.5-turbo')
+    message_type = data.get('message_type', 'all')  # Default to all if not specified
+    
+    logger.info(f"Generating prompt improvement suggestions for {message_type} message")
+    
+    # Ensure we have some content to work with
+    if not system_message and message_type != 'system':
+        logger.warning("Empty system message provided, using default")
+        system_message = "You are a helpful AI assistant."
+        
+    if not user_message and message_type != 'user':
+        logger.warning("Empty user message provided, using default")
+        user_message = "Please help me with my task."
+    
+    # A single field, or all three for "all" (and anything unrecognised)
+    fields = [message_type] if message_type in ['system', 'user', 'assistant'] else ['system', 'user', 'assistant']
+    
+    return system_message, user_message, assistant_message, model, fields
+
+def run_suggestion_job(data):
+    """Improve the requested prompt fields of a request body (used inline and by the job queue)."""
+    system_message, user_message, assistant_message, model, fields = prepare_suggestion_request(data)
+    
+    # Create a response object with the original values
+    improved = {
+        'system_message': system_message,
+        'user_message': user_message,
+        'assistant_message': assistant_message
+    }
+    
+    # Improve the requested fields concurrently; each comes back as structured JSON
+    for field, text in improve_prompt_fields(fields, system_message, user_message, assistant_message, model, wants_coalescing(data)).items():
+        improved[f'{field}_message'] = text
+    
+    return improved
+
 @app.route('/suggest_improvements', methods=['POST'])
 def suggest_improvements():
     """Suggest improvements for specific prompt components."""
     try:
         data = request.json
-        logger.info(f"Received suggestion request data: {data}")
-        
-        system_message = data.get('system_message', '')
-        user_message = data.get('user_message', '')
-        assistant_message = data.get('assistant_message', '')
-        model = data.get('model', 'gpt-3.5-turbo')
-        message_type = data.get('message_type', 'all')  # Default to all if not specified
-        
-        logger.info(f"Generating prompt improvement suggestions for {message_type} message")
-        
-        # Ensure we have some content to work with
-        if not system_message and message_type != 'system':
-            logger.warning("Empty system message provided, using default")
-            system_message = "You are a helpful AI assistant."
-            
-        if not user_message and message_type != 'user':
-            logger.warning("Empty user message provided, using default")
-            user_message = "Please help me with my task."
-            
-        # Create a response object with the original values
-        improved = {
-            'system_message': system_message,
-            'user_message': user_message,
-            'assistant_message': assistant_message
-        }
+        log_event(logger, "suggestion.request", fields=sorted(data or {}))
         
-        # If focusing on a specific message type, customize the prompt
-        if message_type == 'system':
-            # Get suggestion just for system message
-            suggestion_prompt = f"""
-            I need to improve a system message for an AI prompt. The system message sets the overall behavior and instructions for the AI.
-            
-            Current system message:
-            {system_message}
-            
-            Please suggest a significantly improved version of this system message that is more effective, clear, and specific.
-            Your improvements should be substantial and creative, not minor tweaks.
-            Return ONLY the improved system message with no additional commentary.
-            """
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": suggestion_prompt}],
-                temperature=0.8,
-                max_tokens=800
-            )
-            
-            improved['system_message'] = response.choices[0].message.content.strip()
-            
-        elif message_type == 'user':
-            # Get suggestion just for user message
-            suggestion_prompt = f"""
-            I need to improve a user message for an AI prompt. The user message is the specific query or instruction.
-            
-            Current system context: {system_message}
-            Current user message:
-            {user_message}
-            
-            Please suggest a significantly improved version of this user message that is more clear, specific, and likely to get a better response.
-            Your improvements should be substantial and creative, not minor tweaks.
-            Return ONLY the improved user message with no additional commentary.
-            """
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": suggestion_prompt}],
-                temperature=0.8,
-                max_tokens=800
-            )
-            
-            improved['user_message'] = response.choices[0].message.content.strip()
-            
-        elif message_type == 'assistant':
-            # Get suggestion just for assistant message
-            suggestion_prompt = f"""
-            I need to improve an assistant message for an AI prompt. The assistant message is the example response or previous message from the AI.
-            
-            Current system context: {system_message}
-            Current user context: {user_message}
-            Current assistant message:
-            {assistant_message}
-            
-            Please suggest a significantly improved version of this assistant message that better sets up the conversation or provides a better example.
-            Your improvements should be substantial and creative, not minor tweaks.
-            Return ONLY the improved assistant message with no additional commentary.
-            """
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": suggestion_prompt}],
-                temperature=0.8,
-                max_tokens=800
-            )
-            
-            improved['assistant_message'] = response.choices[0].message.content.strip()
-            
-        else:
-            # For "all", get suggestions for all messages
-            suggestion = suggest_prompt_improvements(
-                system_message=system_message,
-                user_message=user_message,
-                assistant_message=assistant_message,
-                model=model
-            )
-            
-            try:
-                # Try to parse the suggestion into the different message types
-                system_found = False
-                user_found = False
-                assistant_found = False
-                
-                for line in suggestion.split('\n'):
-                    line = line.strip()
-                    if line.startswith('SYSTEM:'):
-                        improved['system_message'] = line[7:].strip()
-                        system_found = True
-                    elif line.startswith('USER:'):
-                        improved['user_message'] = line[5:].strip()
-                        user_found = True
-                    elif line.startswith('ASSISTANT:'):
-                        improved['assistant_message'] = line[10:].strip()
-                        assistant_found = True
-                
-                # Ensure all messages are present
-                if not (system_found and user_found and assistant_found):
-                    logger.warning("Missing some message types in response, using defaults where needed")
-                    if not system_found:
-                        improved['system_message'] = system_message or "You are a helpful assistant."
-                    if not user_found:
-                        improved['user_message'] = user_message or "Please help me with my task."
-                    if not assistant_found:
-                        improved['assistant_message'] = assistant_message or "I'll help you with your task."
-            except Exception as parse_error:
-                logger.error(f"Error parsing suggestions: {str(parse_error)}")
-                # If parsing fails, use the original messages
-                improved['system_message'] = system_message or "You are a helpful assistant."
-                improved['user_message'] = user_message or "Please help me with my task."
-                improved['assistant_message'] = assistant_message or "I'll help you with your task."
-        
-        return jsonify(improved)
+        if wants_background(data):
+            return enqueue_job('suggest_improvements', data)
+        
+        return jsonify(run_suggestion_job(data))
     except Exception as e:
         logger.error(f"Error suggesting improvements: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/suggest_improvements_stream', methods=['POST'])
+def suggest_improvements_stream():
+    """Stream each improved prompt field as Server-Sent Events as soon as it is ready."""
+    try:
+        data = request.json
+        system_message, user_message, assistant_message, model, fields = prepare_suggestion_request(data)
+        coalesce = wants_coalescing(data)
+        
+        def events():
+            started = time.perf_counter()
+            for field, text in iter_prompt_improvements(fields, system_message, user_message, assistant_message, model, coalesce):
+                yield {'field': f'{field}_message', 'improved': text,
+                       'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+            yield {'done': True, 'total_ms': round((time.perf_counter() - started) * 1000, 1)}
+        
+        return sse_response(events())
+    except Exception as e:
+        logger.error(f"Error streaming improvements: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def archive_export(kind, data):
+    """Store an export in the archive and return where to download it."""
+    stored = export_store.append(kind, data)
+    return {
+        'success': True,
+        'export_id': stored['export_id'],
+        'filename': stored['filename'],
+        'download_url': f"/download_comparison/{stored['export_id']}"  # Built by hand: job workers have no request context
+    }
+
+def write_comparison_export(data):
+    """Archive a template comparison export (used inline and by the job queue)."""
+    return archive_export('comparison', data)
+
 @app.route('/export_comparison', methods=['POST'])
 def export_comparison():
     """Export the comparison results to a markdown file."""
     try:
         data = request.json
-        template_name = data.get('template_name', 'comparison')
-        left_params = data.get('left_params', {})
-        right_params = data.get('right_params', {})
-        left_response = data.get('left_response', '')
-        right_response = data.get('right_response', '')
-        
-        # Create markdown content
-        markdown_content = f"""# Prompt Comparison: {template_name}
-
-## Date
-{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-## Left Side (Previous)
-- **Model**: {left_params.get('model', 'gpt-3.5-turbo')}
-- **Temperature**: {left_params.get('temperature', 0.7)}
-- **Max Tokens**: {left_params.get('max_tokens', 500)}
-
-### System Message
-```
-{left_params.get('system_message', '')}
-```
-
-### User Message
-```
-{left_params.get('user_message', '')}
-```
-
-### Assistant Message
-```
-{left_params.get('assistant_message', '')}
-```
-
-### Response
-```
-{left_response}
-```
-
-## Right Side (Current)
-- **Model**: {right_params.get('model', 'gpt-3.5-turbo')}
-- **Temperature**: {right_params.get('temperature', 0.7)}
-- **Max Tokens**: {right_params.get('max_tokens', 500)}
-
-### System Message
-```
-{right_params.get('system_message', '')}
-```
-
-### User Message
-```
-{right_params.get('user_message', '')}
-```
-
-### Assistant Message
-```
-{right_params.get('assistant_message', '')}
-```
-
-### Response
-```
-{right_response}
-```
-"""
-        
-        # Add additional parameters if any
-        additional_left = False
-        additional_right = False
-        
-        additional_content = "\n## Additional Parameters\n"
-        
-        additional_content += "\n### Left Side (Previous)\n"
-        for key, value in left_params.items():
-            if key not in ['system_message', 'user_message', 'assistant_message', 'model', 'temperature', 'max_tokens']:
-                additional_content += f"- **{key}**: {value}\n"
-                additional_left = True
-        
-        additional_content += "\n### Right Side (Current)\n"
-        for key, value in right_params.items():
-            if key not in ['system_message', 'user_message', 'assistant_message', 'model', 'temperature', 'max_tokens']:
-                additional_content += f"- **{key}**: {value}\n"
-                additional_right = True
-        
-        if additional_left or additional_right:
-            markdown_content += additional_content
-        
-        # Create filename
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"comparison_{template_name.replace(' ', '_')}_{timestamp}.md"
-        filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
-        
-        # Write to file
-        with open(filepath, 'w') as f:
-            f.write(markdown_content)
+        if wants_background(data):
+            return enqueue_job('export_comparison', data)
         
-        return jsonify({
-            'success': True,
-            'filename': filename,
-            'filepath': filepath
-        })
+        return jsonify(write_comparison_export(data))
     except Exception as e:
         logger.error(f"Error exporting comparison: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/export_markdown_comparison', methods=['POST'])
 def export_markdown_comparison():
-    """Export the markdown comparison results to a file."""
+    """
+    Export the markdown comparison results to the export archive. A parsed CSV upload on the
+    right is sent as right_upload_id, and every one of its rows is exported.
+    """
     try:
         data = request.json
-        left_content = data.get('left_content', '')
-        right_content = data.get('right_content', '')
+        export = {'left_content': data.get('left_content', '')}
+        if data.get('right_upload_id'):
+            if chat_csv_store.get_upload(data['right_upload_id']) is None:
+                return jsonify({'error': f"Unknown upload {data['right_upload_id']}"}), 404
+            export['right_upload_id'] = data['right_upload_id']
+        else:
+            export['right_content'] = data.get('right_content', '')
+        return jsonify(archive_export('markdown_comparison', export))
+    except Exception as e:
+        logger.error(f"Error exporting markdown comparison: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/diff', methods=['POST'])
+def diff():
+    """
+    Diff two responses, or each message field of two template versions.
+    Body: {"old": text or template, "new": text or template, "granularity": "line" | "word" | "token"}
+    """
+    try:
+        data = request.json or {}
+        old = data.get('old', '')
+        new = data.get('new', '')
+        granularity = data.get('granularity', 'word')
         
-        # Check if the right content is already formatted (from CSV)
-        is_formatted_csv = right_content.startswith('# JiJa Response')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
         
-        # Create markdown content
-        if is_formatted_csv:
-            # For CSV data, we want to preserve the rendering
-            markdown_content = f"""# Markdown Comparison - JiJa
-
-## Date
-{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-## Left Side (New Version)
-```markdown
-{left_content}
-```
-
-## Right Side (JiJa)
-{right_content}
-"""
+        if isinstance(old, dict) and isinstance(new, dict):
+            fields = data.get('fields') or TEMPLATE_DIFF_FIELDS
+            size = sum(len(str(side.get(field) or '')) for side in (old, new) for field in fields)
+        elif isinstance(old, str) and isinstance(new, str):
+            size = len(old) + len(new)
         else:
-            # For regular markdown files
-            markdown_content = f"""# Markdown Comparison - JiJa
-
-## Date
-{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            return jsonify({'error': 'old and new must both be strings or both be templates'}), 400
+        
+        if size > DIFF_MAX_CHARS:
+            return jsonify({'error': f"Inputs are too large to diff (limit {DIFF_MAX_CHARS} characters)"}), 413
+        
+        if isinstance(old, dict):
+            return jsonify({'granularity': granularity, 'fields': diff_template_fields(old, new, granularity, fields)})
+        return jsonify(diff_texts(old, new, granularity))
+    except Exception as e:
+        logger.error(f"Error diffing responses: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-## Left Side (New Version)
-```markdown
-{left_content}
-```
+@app.route('/templates/<int:template_id>/versions', methods=['GET'])
+def template_versions(template_id):
+    """
+    Index every version of a template (fetching the ones not indexed yet, concurrently)
+    and list them. ?latest=N overrides the latest version number reported by the API.
+    """
+    try:
+        return jsonify(sync_template_versions(template_id, latest=request.args.get('latest', type=int)))
+    except Exception as e:
+        logger.error(f"Error indexing versions of template {template_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-## Right Side (JiJa)
-```markdown
-{right_content}
-```
-"""
-        
-        # Create filename
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"jija_comparison_{timestamp}.md"
-        filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+@app.route('/templates/<int:template_id>/versions/diff', methods=['POST'])
+def template_versions_diff(template_id):
+    """
+    Diff two or more versions of a template from the version index.
+    Body: {"versions": [12, 15, 17], "granularity": "line" | "word" | "token", "fields": [...]}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        versions = [int(version) for version in data.get('versions') or []]
+        granularity = data.get('granularity', 'word')
         
-        # Write to file
-        with open(filepath, 'w') as f:
-            f.write(markdown_content)
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+        if not 2 <= len(versions) <= TEMPLATE_VERSION_DIFF_LIMIT:
+            return jsonify({'error': f"Between 2 and {TEMPLATE_VERSION_DIFF_LIMIT} versions are required"}), 400
         
-        return jsonify({
-            'success': True,
-            'filename': filename,
-            'filepath': filepath
-        })
+        return jsonify(diff_template_versions(template_id, versions, granularity, data.get('fields') or TEMPLATE_DIFF_FIELDS))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f"Parameter error: {str(e)}"}), 400
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
     except Exception as e:
-        logger.error(f"Error exporting markdown comparison: {str(e)}")
+        logger.error(f"Error diffing versions of template {template_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/templates/<int:template_id>/versions/clear', methods=['POST'])
+def clear_template_versions(template_id):
+    """Drop a template's indexed versions so the next request refetches them."""
+    try:
+        return jsonify({'success': True, 'removed': version_index.remove(template_id)})
+    except Exception as e:
+        logger.error(f"Error clearing versions of template {template_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def jija_response(data):
+    """Call the JiJa AI simulation for a request body and return its response text."""
+    prompt = data.get('prompt', '')
+    temperature = float(data.get('temperature', 0.7))
+    max_tokens = int(data.get('max_tokens', 1000))
+    
+    # Call the JiJa AI simulation
+    logger.info(f"Calling JiJa AI with prompt: {prompt[:100]}...")
+    response = call_jija_comp_gpt(
+        message=prompt,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        coalesce=wants_coalescing(data)
+    )
+    return response
+
+def run_jija_job(data):
+    """Run a JiJa request for the job queue; a failed call fails the job."""
+    return {'response': fail_on_error_text(jija_response(data))}
+
 @app.route('/call_jija_comp', methods=['POST'])
 def call_jija_comp():
     """Call the JiJa AI with the provided prompt."""
+    try:
+        data = request.json
+        if not data.get('prompt', ''):
+            return jsonify({'error': 'Prompt cannot be empty'}), 400
+        
+        if wants_background(data):
+            return enqueue_job('call_jija_comp', data)
+        
+        return jsonify({'response': jija_response(data)})
+    except Exception as e:
+        logger.error(f"Error calling JiJa AI: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/call_jija_comp_stream', methods=['POST'])
+def call_jija_comp_stream():
+    """Stream the JiJa AI response as Server-Sent Events."""
     try:
         data = request.json
         prompt = data.get('prompt', '')
@@ -477,30 +635,302 @@ def call_jija_comp():
         if not prompt:
             return jsonify({'error': 'Prompt cannot be empty'}), 400
         
-        # Call the JiJa AI simulation
-        logger.info(f"Calling JiJa AI with prompt: {prompt[:100]}...")
-        response = call_jija_comp_gpt(
+        logger.info(f"Streaming JiJa AI with prompt: {prompt[:100]}...")
+        return sse_response(stream_jija_comp_gpt(
             message=prompt,
             temperature=temperature,
             max_tokens=max_tokens
-        )
+        ))
+    except Exception as e:
+        logger.error(f"Error streaming JiJa AI: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jija/uploads', methods=['POST'])
+def upload_jija_csv():
+    """
+    Parse a JiJa chat export (CSV with sender and value columns) on the server.
+    Accepts a multipart "file" field or a raw CSV body. Re-uploading the same file is served from the cache.
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            summary = ingest_chat_csv(upload.stream, upload.filename)
+        else:
+            summary = ingest_chat_csv(request.stream, request.args.get('filename'))
+        return jsonify(summary), 200 if summary['cached'] else 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error parsing JiJa CSV upload: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jija/uploads/<upload_id>', methods=['GET'])
+def jija_csv_page(upload_id):
+    """One page of a parsed JiJa chat export (?page=1&page_size=50), with the page rendered as markdown."""
+    page = request.args.get('page', 1, type=int)
+    page_size = min(max(request.args.get('page_size', CSV_UPLOAD_PAGE_SIZE, type=int), 1), 1000)
+    result = get_chat_page(upload_id, page, page_size)
+    if result is None:
+        return jsonify({'error': f"Unknown upload {upload_id}"}), 404
+    return jsonify(result)
+
+@app.route('/jija/uploads/<upload_id>/markdown', methods=['GET'])
+def jija_csv_markdown(upload_id):
+    """Every row of a parsed JiJa chat export as markdown, streamed."""
+    if chat_csv_store.get_upload(upload_id) is None:
+        return jsonify({'error': f"Unknown upload {upload_id}"}), 404
+    return Response(stream_with_context(iter_chat_markdown(upload_id)), mimetype='text/markdown')
+
+@app.route('/cache/completions', methods=['GET'])
+def completion_cache_stats():
+    """Report completion cache hit/miss counters."""
+    return jsonify(completion_cache.get_stats())
+
+@app.route('/cache/completions/clear', methods=['POST'])
+def clear_completion_cache():
+    """Empty the completion cache."""
+    try:
+        completion_cache.clear()
+        return jsonify({'success': True})
+    except Exception as e:
+        logger.error(f"Error clearing completion cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/cache/templates', methods=['GET'])
+def template_cache_stats():
+    """Report template cache counters and entry ages."""
+    return jsonify(get_template_cache_stats())
+
+@app.route('/cache/templates/invalidate', methods=['POST'])
+def invalidate_templates():
+    """Invalidate one cached template (template_id in the body) or the whole template cache."""
+    try:
+        data = request.get_json(silent=True) or {}
+        removed = invalidate_template_cache(data.get('template_id'))
+        return jsonify({'success': True, 'removed': removed})
+    except Exception as e:
+        logger.error(f"Error invalidating template cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/cache/templates/warmup', methods=['GET', 'POST'])
+def template_warmup():
+    """Start a template cache warm-up (POST) or report its progress (GET)."""
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            limit = int(data.get('limit', TEMPLATE_WARMUP_LIMIT)) or None
+            concurrency = int(data.get('concurrency', TEMPLATE_WARMUP_CONCURRENCY))
+            started = start_template_warmup(limit, concurrency)
+            return jsonify({'started': started, **get_warmup_status()})
+        return jsonify(get_warmup_status())
+    except Exception as e:
+        logger.error(f"Error warming template cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch/jobs', methods=['POST'])
+def create_batch_job():
+    """Start a batch evaluation over an uploaded CSV/JSONL file of input rows."""
+    try:
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'error': 'An input file is required'}), 400
         
-        return jsonify({
-            'response': response
-        })
+        extension = '.csv' if upload.filename.lower().endswith('.csv') else '.jsonl'
+        template_id = int(request.form['template_id'])
+        previous_version = int(request.form['previous_version']) if request.form.get('previous_version') else None
+        current_version = int(request.form['current_version']) if request.form.get('current_version') else None
+        concurrency = int(request.form.get('concurrency', BATCH_CONCURRENCY))
+        
+        # Save the upload next to the job's output so the job can be resumed later
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        job_id = uuid.uuid4().hex[:12]
+        input_path = os.path.join(BATCH_DIR, f"{job_id}_input{extension}")
+        upload.save(input_path)
+        
+        job = start_batch_job(template_id, input_path, previous_version=previous_version,
+                              current_version=current_version, concurrency=concurrency, job_id=job_id)
+        return jsonify(job.get_status()), 202
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f"Parameter error: {str(e)}"}), 400
     except Exception as e:
-        logger.error(f"Error calling JiJa AI: {str(e)}")
+        logger.error(f"Error starting batch job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch/jija', methods=['POST'])
+def create_jija_batch_job():
+    """
+    Compare JiJa with plain ChatGPT for every prompt in an uploaded file (CSV/JSONL with a
+    prompt column, or text with one prompt per line). Send the job_id of an earlier job
+    instead of a file to resume it with the settings it started with.
+    """
+    try:
+        temperature = request.form.get('temperature')
+        temperature = float(temperature) if temperature not in (None, '') else None
+        max_tokens = request.form.get('max_tokens')
+        max_tokens = int(max_tokens) if max_tokens not in (None, '') else None
+        concurrency = int(request.form.get('concurrency', BATCH_CONCURRENCY))
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        
+        job_id = request.form.get('job_id')
+        if job_id:
+            inputs = [name for name in os.listdir(BATCH_DIR) if job_id.isalnum() and name.startswith(f"{job_id}_input")]
+            if not inputs:
+                return jsonify({'error': f"Unknown job {job_id}"}), 404
+            current = get_batch_job(job_id)
+            if current and current.get_status()['state'] == 'running':
+                return jsonify({'error': f"Job {job_id} is still running"}), 409
+            input_path = os.path.join(BATCH_DIR, inputs[0])
+        else:
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                return jsonify({'error': 'An input file is required'}), 400
+            extension = os.path.splitext(upload.filename.lower())[1]
+            if extension not in ('.csv', '.jsonl', '.txt'):
+                extension = '.txt'
+            job_id = uuid.uuid4().hex[:12]
+            input_path = os.path.join(BATCH_DIR, f"{job_id}_input{extension}")
+            upload.save(input_path)
+        
+        job = start_jija_batch_job(input_path, temperature=temperature, max_tokens=max_tokens,
+                                   concurrency=concurrency, job_id=job_id)
+        return jsonify(job.get_status()), 202
+    except ValueError as e:
+        return jsonify({'error': f"Parameter error: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"Error starting JiJa batch job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch/jobs/<job_id>', methods=['GET'])
+def batch_job_status(job_id):
+    """Report progress for a batch evaluation job."""
+    job = get_batch_job(job_id)
+    if not job:
+        return jsonify({'error': f"Unknown job {job_id}"}), 404
+    return jsonify(job.get_status())
+
+@app.route('/batch/jobs/<job_id>/results', methods=['GET'])
+def batch_job_results(job_id):
+    """Download the JSONL results written so far for a batch job."""
+    job = get_batch_job(job_id)
+    if not job or not os.path.exists(job.output_path):
+        return jsonify({'error': f"No results for job {job_id}"}), 404
+    return send_file(job.output_path, as_attachment=True, download_name=f"batch_{job_id}.jsonl")
+
+@app.route('/batch/jobs/<job_id>/report', methods=['GET'])
+def batch_job_report(job_id):
+    """Download the consolidated markdown report of a JiJa batch job (rebuilt from the results while it runs)."""
+    job = get_batch_job(job_id)
+    if not isinstance(job, JijaBatchJob) or not os.path.exists(job.output_path):
+        return jsonify({'error': f"No report for job {job_id}"}), 404
+    try:
+        if job.get_status()['state'] == 'running' or not os.path.exists(job.report_path):
+            job.write_report()
+        return send_file(job.report_path, as_attachment=True, download_name=f"jija_batch_{job_id}.md")
+    except Exception as e:
+        logger.error(f"Error writing report for job {job_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Recent background jobs and queue counters."""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify({'jobs': job_queue.list_jobs(limit), **job_queue.get_stats()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status, timing and (once finished) the result of a background job."""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream a background job's status as Server-Sent Events until it finishes, fails or is cancelled."""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': f"Unknown job {job_id}"}), 404
+    
+    def events():
+        current = job
+        yield current
+        while current['state'] not in TERMINAL_STATES:
+            changed = job_queue.wait_for_change(job_id, current['state'])
+            if changed is None:
+                return
+            if changed['state'] != current['state']:
+                yield changed
+            else:
+                yield {'job_id': job_id, 'state': changed['state'], 'heartbeat': True}  # Keep proxies from closing the stream
+            current = changed
+    
+    return sse_response(events())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running background job."""
+    job = job_queue.cancel(job_id)
+    if not job:
+        return jsonify({'error': f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness check: the process is up."""
+    return jsonify(get_health())
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check: 200 once the startup checks have passed, 503 until then."""
+    readiness = get_readiness()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
+@app.route('/limits', methods=['GET'])
+def rate_limits():
+    """Report OpenAI rate limiter state for each model."""
+    return jsonify(get_limiter_stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, upstream and token metrics in the Prometheus text format."""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/exports', methods=['GET'])
+def list_exports():
+    """The newest archived exports and archive counters."""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify({'exports': export_store.list_exports(limit), **export_store.get_stats()})
+
 @app.route('/download_comparison/<filename>')
 def download_comparison(filename):
-    """Download the exported comparison file."""
+    """Download an exported comparison, by export id or filename, rendered from the export archive."""
     try:
-        filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
-        return send_file(filepath, as_attachment=True)
+        rendered = export_store.render(filename)
+        if rendered is None:
+            # Reports exported before the archive existed were written next to the app
+            legacy_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.basename(filename))
+            if filename.endswith('.md') and os.path.isfile(legacy_path):
+                return send_file(legacy_path, as_attachment=True)
+            return jsonify({'error': f"Unknown export {filename}"}), 404
+        
+        download_name, sections = rendered
+        return Response(
+            stream_with_context(export_store.iter_download(sections)),
+            mimetype='text/markdown',
+            headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+        )
     except Exception as e:
         logger.error(f"Error downloading comparison: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Background jobs: the heavy routes queue their work here when the request asks for it
+job_queue.register('generate_response', run_generation_job)
+job_queue.register('suggest_improvements', run_suggestion_job)
+job_queue.register('call_jija_comp', run_jija_job)
+job_queue.register('export_comparison', write_comparison_export)
+
 if __name__ == '__main__':
+    # The reloader runs this block in a watcher process as well; only the serving child runs jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.start()
     app.run(host='0.0.0.0', port=PORT, debug=True)
\ No newline at end of file
@@ -0,0 +1,308 @@
+import asyncio
+import functools
+import json
+import logging
+import re
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route, Mount
+
+# Importing the Flask app runs the same startup checks and starts the template refresher
+from app import app as flask_app, build_generation_params, prepare_suggestion_request, template_version_details, wants_coalescing
+from utils.async_openai_api import (
+    agenerate_completion, astream_completion, acall_jija_comp_gpt, astream_jija_comp_gpt,
+    aiter_prompt_improvements
+)
+from utils.async_promptlayer_api import aget_template_details, async_http_client
+from utils.job_queue import job_queue
+from utils.metrics import record_http_request
+from config import GENERATION_BATCH_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# ASGI entry point for production: the generation, suggestion and JiJa routes run natively
+# on the event loop, so a slow OpenAI call holds a coroutine instead of a worker thread.
+# Every other route (pages, exports, caches, batch jobs) is served by the Flask app.
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 9999
+
+def sse_response(events):
+    """Wrap an async generator of event dicts as a Server-Sent Events response."""
+    async def encode():
+        async for event in events:
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        encode(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+        }
+    )
+
+def flask_route_label(path):
+    """A Starlette route path written the way Flask writes its rules ({name:int} -> <int:name>)."""
+    return re.sub(r'\{(\w+)(?::(\w+))?\}',
+                  lambda match: f"<{match.group(2)}:{match.group(1)}>" if match.group(2) else f"<{match.group(1)}>",
+                  path)
+
+def timed_route(path, endpoint):
+    """
+    Record a native route's latency the same way the Flask hooks do (up to the response
+    headers for streams), labelled like the Flask rule for the same path so both servers
+    report one series. Requests that fall through to the Flask mount are timed by Flask.
+    """
+    route = flask_route_label(path)
+
+    @functools.wraps(endpoint)
+    async def timed(request):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await endpoint(request)
+            status = response.status_code
+            return response
+        finally:
+            record_http_request(route, request.method, status, time.perf_counter() - started)
+    return timed
+
+def background_job(request, kind, data):
+    """
+    Queue the request as a background job when it asks for one ("background": true or
+    Prefer: respond-async) and return the 202 response, otherwise None.
+    """
+    if not (data.get('background') or 'respond-async' in request.headers.get('prefer', '')):
+        return None
+    job = job_queue.submit(kind, {key: value for key, value in data.items() if key != 'background'})
+    status_url = f"/jobs/{job['job_id']}"
+    return JSONResponse({**job, 'status_url': status_url, 'events_url': f"{status_url}/events"},
+                        status_code=202, headers={'Location': status_url})
+
+async def get_template(request):
+    """Get template details (the latest version, or ?version=N from the version index)."""
+    try:
+        version = request.query_params.get('version')
+        if version and version.isdigit():
+            body, status = await asyncio.get_running_loop().run_in_executor(
+                None, template_version_details, request.path_params['template_name'], int(version))
+            return JSONResponse(body, status_code=status)
+        template_details = await aget_template_details(request.path_params['template_name'])
+        return JSONResponse(template_details)
+    except Exception as e:
+        logger.error(f"Error getting template details: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def generate_response(request):
+    """Generate a single response for a template."""
+    try:
+        data = await request.json()
+        logger.info("Received generation request")
+
+        try:
+            generation_params = build_generation_params(data)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Parameter conversion error: {str(e)}")
+            return JSONResponse({'error': f"Parameter error: {str(e)}"}, status_code=400)
+
+        queued = background_job(request, 'generate_response', data)
+        if queued:
+            return queued
+
+        response = await agenerate_completion(**generation_params)
+        return JSONResponse({'response': response})
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def generate_response_stream(request):
+    """Stream a single response for a template as Server-Sent Events."""
+    try:
+        data = await request.json()
+        logger.info("Received streaming generation request")
+
+        try:
+            generation_params = build_generation_params(data)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Parameter conversion error: {str(e)}")
+            return JSONResponse({'error': f"Parameter error: {str(e)}"}, status_code=400)
+
+        return sse_response(astream_completion(**generation_params))
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def run_generations(requests_data):
+    """
+    Run several completions at the same time on the event loop.
+    Results come back in the same order as the requests, each with its own timing.
+    """
+    async def timed_generation(generation_params):
+        started = time.perf_counter()
+        response = await agenerate_completion(**generation_params)
+        return {
+            'response': response,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    # Validate everything up front so a bad side doesn't waste an API call on the other
+    all_params = [build_generation_params(item or {}) for item in requests_data]
+    return await asyncio.gather(*(timed_generation(params) for params in all_params))
+
+async def generate_pair(request):
+    """Generate the left and right responses concurrently."""
+    try:
+        data = await request.json()
+        logger.info("Received pair generation request")
+
+        started = time.perf_counter()
+        try:
+            left_result, right_result = await run_generations([data.get('left', {}), data.get('right', {})])
+        except (ValueError, TypeError) as e:
+            logger.error(f"Parameter conversion error: {str(e)}")
+            return JSONResponse({'error': f"Parameter error: {str(e)}"}, status_code=400)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        logger.info(f"Pair generation finished in {elapsed_ms}ms " +
+                    f"(left {left_result['elapsed_ms']}ms, right {right_result['elapsed_ms']}ms)")
+        return JSONResponse({'left': left_result, 'right': right_result, 'elapsed_ms': elapsed_ms})
+    except Exception as e:
+        logger.error(f"Error generating response pair: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def generate_batch(request):
+    """Generate responses for a list of requests concurrently."""
+    try:
+        data = await request.json()
+        requests_data = data.get('requests', [])
+
+        if not isinstance(requests_data, list) or not requests_data:
+            return JSONResponse({'error': 'requests must be a non-empty list'}, status_code=400)
+
+        if len(requests_data) > GENERATION_BATCH_LIMIT:
+            return JSONResponse({'error': f"At most {GENERATION_BATCH_LIMIT} requests are allowed per batch"}, status_code=400)
+
+        logger.info(f"Received batch generation request with {len(requests_data)} items")
+
+        started = time.perf_counter()
+        try:
+            results = await run_generations(requests_data)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Parameter conversion error: {str(e)}")
+            return JSONResponse({'error': f"Parameter error: {str(e)}"}, status_code=400)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        logger.info(f"Batch generation of {len(results)} items finished in {elapsed_ms}ms")
+        return JSONResponse({'results': results, 'elapsed_ms': elapsed_ms})
+    except Exception as e:
+        logger.error(f"Error generating response batch: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def suggest_improvements(request):
+    """Suggest improvements for specific prompt components."""
+    try:
+        data = await request.json()
+        queued = background_job(request, 'suggest_improvements', data)
+        if queued:
+            return queued
+        system_message, user_message, assistant_message, model, fields = prepare_suggestion_request(data)
+
+        improved = {
+            'system_message': system_message,
+            'user_message': user_message,
+            'assistant_message': assistant_message
+        }
+        async for field, text in aiter_prompt_improvements(fields, system_message, user_message, assistant_message, model,
+                                                           wants_coalescing(data)):
+            improved[f'{field}_message'] = text
+
+        return JSONResponse(improved)
+    except Exception as e:
+        logger.error(f"Error suggesting improvements: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def suggest_improvements_stream(request):
+    """Stream each improved prompt field as Server-Sent Events as soon as it is ready."""
+    try:
+        data = await request.json()
+        system_message, user_message, assistant_message, model, fields = prepare_suggestion_request(data)
+
+        async def events():
+            started = time.perf_counter()
+            async for field, text in aiter_prompt_improvements(fields, system_message, user_message, assistant_message, model,
+                                                               wants_coalescing(data)):
+                yield {'field': f'{field}_message', 'improved': text,
+                       'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+            yield {'done': True, 'total_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+        return sse_response(events())
+    except Exception as e:
+        logger.error(f"Error streaming improvements: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+def jija_params(data):
+    """Return (prompt, temperature, max_tokens) from a parsed JiJa request body."""
+    return data.get('prompt', ''), float(data.get('temperature', 0.7)), int(data.get('max_tokens', 1000))
+
+async def call_jija_comp(request):
+    """Call the JiJa AI with the provided prompt."""
+    try:
+        data = await request.json()
+        prompt, temperature, max_tokens = jija_params(data)
+        if not prompt:
+            return JSONResponse({'error': 'Prompt cannot be empty'}, status_code=400)
+
+        queued = background_job(request, 'call_jija_comp', data)
+        if queued:
+            return queued
+
+        logger.info(f"Calling JiJa AI with prompt: {prompt[:100]}...")
+        response = await acall_jija_comp_gpt(message=prompt, temperature=temperature, max_tokens=max_tokens,
+                                             coalesce=wants_coalescing(data))
+        return JSONResponse({'response': response})
+    except Exception as e:
+        logger.error(f"Error calling JiJa AI: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def call_jija_comp_stream(request):
+    """Stream the JiJa AI response as Server-Sent Events."""
+    try:
+        prompt, temperature, max_tokens = jija_params(await request.json())
+        if not prompt:
+            return JSONResponse({'error': 'Prompt cannot be empty'}, status_code=400)
+
+        logger.info(f"Streaming JiJa AI with prompt: {prompt[:100]}...")
+        return sse_response(astream_jija_comp_gpt(message=prompt, temperature=temperature, max_tokens=max_tokens))
+    except Exception as e:
+        logger.error(f"Error streaming JiJa AI: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def startup():
+    # Each server worker runs jobs; leases keep them from picking up each other's running jobs
+    job_queue.start()
+
+async def shutdown():
+    await async_http_client.aclose()
+
+native_routes = [
+    ('/template/{template_name}', get_template, ['GET']),
+    ('/generate_response', generate_response, ['POST']),
+    ('/generate_response_stream', generate_response_stream, ['POST']),
+    ('/generate_pair', generate_pair, ['POST']),
+    ('/generate_batch', generate_batch, ['POST']),
+    ('/suggest_improvements', suggest_improvements, ['POST']),
+    ('/suggest_improvements_stream', suggest_improvements_stream, ['POST']),
+    ('/call_jija_comp', call_jija_comp, ['POST']),
+    ('/call_jija_comp_stream', call_jija_comp_stream, ['POST'])
+]
+
+app = Starlette(
+    routes=[Route(path, timed_route(path, endpoint), methods=methods) for path, endpoint, methods in native_routes] + [
+        Mount('/', WSGIMiddleware(flask_app))
+    ],
+    on_startup=[startup],
+    on_shutdown=[shutdown]
+)
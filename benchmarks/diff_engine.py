@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for utils.diff_engine on long responses.
+
+    python -m benchmarks.diff_engine [--tokens 10000] [--edits 50]
+
+Diffs a synthetic response of about --tokens words against a copy with --edits scattered
+word changes (the usual case: two runs of similar prompts), and against an unrelated shuffle
+of the same words (the worst case), at every granularity.
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.diff_engine import diff_texts, GRANULARITIES
+
+VOCABULARY = ["the", "prompt", "model", "response", "revenue", "customers", "growth", "quarter",
+              "objective", "target", "points", "deadline", "business", "mission", "pets", "owners"]
+
+def build_response(word_count, rng):
+    """Words in short lines with some punctuation, roughly like a model response."""
+    words = [rng.choice(VOCABULARY) + rng.choice(["", "", "", ",", "."]) for _ in range(word_count)]
+    return words, "\n".join(" ".join(words[i:i + 12]) for i in range(0, len(words), 12))
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the response diff engine on long inputs.")
+    parser.add_argument("--tokens", type=int, default=10000, help="Words in each response")
+    parser.add_argument("--edits", type=int, default=50, help="Words changed in the similar response")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (best is reported)")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    words, old = build_response(args.tokens, rng)
+    edited = list(words)
+    for _ in range(args.edits):
+        edited[rng.randrange(len(edited))] = rng.choice(VOCABULARY).upper()
+    similar = "\n".join(" ".join(edited[i:i + 12]) for i in range(0, len(edited), 12))
+    shuffled = list(words)
+    rng.shuffle(shuffled)
+    unrelated = "\n".join(" ".join(shuffled[i:i + 12]) for i in range(0, len(shuffled), 12))
+
+    for name, new in (("similar", similar), ("unrelated", unrelated)):
+        for granularity in GRANULARITIES:
+            best = min(timeit.repeat(lambda: diff_texts(old, new, granularity), number=1, repeat=args.repeat))
+            stats = diff_texts(old, new, granularity)["stats"]
+            print(f"{name:9} {granularity:5} {stats['old_tokens']:6} tokens: {best * 1000:7.1f} ms "
+                  f"(similarity {stats['similarity']:.3f})")
+
+if __name__ == "__main__":
+    main()
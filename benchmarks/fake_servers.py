@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Local stand-ins for the OpenAI chat completions API and the PromptLayer endpoints the app uses,
+so the app can be load-tested without API keys, network or cost.
+
+    python -m benchmarks.fake_servers [--openai-port 8801] [--promptlayer-port 8802]
+        [--openai-latency 0.4] [--ttft 0.2] [--chunks 40] [--chunk-delay 0.01]
+        [--promptlayer-latency 0.05] [--error-rate 0.0] [--rate-limit-rate 0.0]
+
+Then start the app against them:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8801/v1 PROMPTLAYER_BASE_URL=http://127.0.0.1:8802 ./run.sh
+
+OpenAI: POST /v1/chat/completions answers after --openai-latency (plus up to --jitter) with a
+canned reply and usage, or, for "stream": true, sends the first chunk after --ttft and then
+--chunks chunks --chunk-delay apart (and a usage chunk when stream_options.include_usage is set).
+JSON-mode requests get {"improved": ...}.
+
+PromptLayer: GET /prompt-templates lists --templates templates, POST /prompt-templates/<id>
+and GET /workspace/<workspace>/prompt/<id> return one, each after --promptlayer-latency.
+
+Either server fails a request with a 500 at --error-rate, and the OpenAI server answers 429
+(with retry-after-ms) at --rate-limit-rate.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeConfig:
+    """Latency, streaming and error settings shared by both servers."""
+
+    def __init__(self, openai_latency=0.4, jitter=0.05, ttft=0.2, chunks=40, chunk_delay=0.01,
+                 promptlayer_latency=0.05, templates=50, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.openai_latency = openai_latency
+        self.jitter = jitter
+        self.ttft = ttft
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.promptlayer_latency = promptlayer_latency
+        self.templates = templates
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def roll(self):
+        with self._lock:
+            return self._random.random()
+
+    def delay(self, seconds):
+        """Sleep for seconds plus up to jitter."""
+        time.sleep(max(0.0, seconds + self.jitter * self.roll()))
+
+def fake_template(template_id, version=None):
+    """A PromptLayer template in the prompt_template/metadata shape the normalizer reads."""
+    return {
+        "id": template_id,
+        "prompt_name": f"Benchmark template {template_id}",
+        "version": version or 3,
+        "prompt_template": {
+            "type": "chat",
+            "messages": [
+                {"role": "system", "content": [{"type": "text", "text": "You are a concise business analyst."}]},
+                {"role": "user", "content": [{"type": "text", "text": f"Summarise the quarter for account {template_id} in five bullet points."}]}
+            ]
+        },
+        "metadata": {"model": {"name": "gpt-4o", "provider": "openai", "parameters": {"temperature": 0.2, "max_tokens": 300}}}
+    }
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+    config = None
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate a load test
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def injected_error(self, rate_limit=False):
+        """Send an injected 500 (or 429) and return True, or return False to answer normally."""
+        roll = self.config.roll()
+        if roll < self.config.error_rate:
+            self.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return True
+        if rate_limit and roll < self.config.error_rate + self.config.rate_limit_rate:
+            self.send_json(429, {"error": {"message": "Injected rate limit", "type": "rate_limit_error"}},
+                           {"retry-after-ms": "100"})
+            return True
+        return False
+
+class FakeOpenAIHandler(FakeHandler):
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            return self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+        request = self.read_json()
+        if self.injected_error(rate_limit=True):
+            return
+        if request.get("stream"):
+            return self.stream_reply(request)
+
+        self.config.delay(self.config.openai_latency)
+        content = self.reply_text(request)
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in request.get("messages", []))
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split()),
+                      "total_tokens": prompt_tokens + len(content.split())}
+        })
+
+    def reply_text(self, request):
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"improved": "You are a precise assistant. Answer in short, numbered steps."})
+        return " ".join(["word"] * max(1, self.config.chunks))
+
+    def stream_reply(self, request):
+        """Server-Sent Events in the chat.completion.chunk format, ending with [DONE]."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = request.get("model", "gpt-4o")
+
+        def send(delta, finish_reason=None):
+            chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        self.config.delay(self.config.ttft)
+        send({"role": "assistant", "content": ""})
+        for number in range(self.config.chunks):
+            if number:
+                time.sleep(self.config.chunk_delay)
+            send({"content": "word "})
+        send({}, "stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in request.get("messages", []))
+            usage = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": self.config.chunks,
+                                              "total_tokens": prompt_tokens + self.config.chunks}}
+            self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+class FakePromptLayerHandler(FakeHandler):
+    def do_GET(self):
+        if self.injected_error():
+            return
+        self.config.delay(self.config.promptlayer_latency)
+        if self.path.split("?")[0].rstrip("/") == "/prompt-templates":
+            return self.send_json(200, {"items": [fake_template(number) for number in range(1, self.config.templates + 1)]})
+        match = re.fullmatch(r"/workspace/\d+/prompt/(\d+)", self.path.split("?")[0])
+        if match:
+            return self.send_json(200, fake_template(int(match.group(1))))
+        self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        request = self.read_json()
+        if self.injected_error():
+            return
+        self.config.delay(self.config.promptlayer_latency)
+        match = re.fullmatch(r"/prompt-templates/(\d+)", self.path.split("?")[0])
+        if match:
+            return self.send_json(200, {"id": int(match.group(1)), "template": fake_template(int(match.group(1)), request.get("version"))})
+        self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Load generators drop connections at the end of a run
+
+def start_fake_servers(config, openai_port=0, promptlayer_port=0, host="127.0.0.1"):
+    """
+    Serve both fakes from background threads. Port 0 picks a free port.
+    Returns (openai_base_url, promptlayer_base_url, servers); call shutdown() on each server to stop it.
+    """
+    servers = []
+    for handler, port in ((FakeOpenAIHandler, openai_port), (FakePromptLayerHandler, promptlayer_port)):
+        server = FakeServer((host, port), type(handler.__name__, (handler,), {"config": config}))
+        threading.Thread(target=server.serve_forever, name=f"{handler.__name__}-server", daemon=True).start()
+        servers.append(server)
+    openai_server, promptlayer_server = servers
+    return (f"http://{host}:{openai_server.server_address[1]}/v1",
+            f"http://{host}:{promptlayer_server.server_address[1]}", servers)
+
+def add_fake_server_arguments(parser):
+    """The latency, streaming and error options shared with the load test."""
+    parser.add_argument("--openai-latency", type=float, default=0.4, help="Seconds before a non-streamed reply")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first streamed chunk")
+    parser.add_argument("--chunks", type=int, default=40, help="Chunks per streamed reply (and words per reply)")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Seconds between streamed chunks")
+    parser.add_argument("--promptlayer-latency", type=float, default=0.05, help="Seconds before a PromptLayer reply")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--templates", type=int, default=50, help="Templates in the PromptLayer list")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of OpenAI requests answered with a 429")
+
+def config_from_args(args):
+    return FakeConfig(openai_latency=args.openai_latency, jitter=args.jitter, ttft=args.ttft, chunks=args.chunks,
+                      chunk_delay=args.chunk_delay, promptlayer_latency=args.promptlayer_latency,
+                      templates=args.templates, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake OpenAI and PromptLayer APIs for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--openai-port", type=int, default=8801)
+    parser.add_argument("--promptlayer-port", type=int, default=8802)
+    add_fake_server_arguments(parser)
+    args = parser.parse_args()
+
+    openai_url, promptlayer_url, servers = start_fake_servers(config_from_args(args), args.openai_port,
+                                                              args.promptlayer_port, args.host)
+    print(f"OPENAI_BASE_URL={openai_url}")
+    print(f"PROMPTLAYER_BASE_URL={promptlayer_url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Cold-start budget check: how long a fresh interpreter takes to import the app.
+
+    python -m benchmarks.import_time [--budget 1.0] [--runs 5] [--top 10]
+
+Each run starts a new Python process, so nothing is cached in memory between runs.
+The wall time covers interpreter start-up plus the import. Startup checks run in the
+background (STARTUP_CHECKS=background), and placeholder API keys are used when none
+are set, so no request blocks the import. Exits with status 1 when the median wall
+time of any module is over the budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_import(module, env, importtime=False):
+    """Import module in a fresh interpreter. Returns (wall seconds, import seconds, stderr)."""
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=APP_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return wall, float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(importtime_output, top):
+    """Top-level packages with the largest cumulative import time, from -X importtime output."""
+    totals = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth != 1:  # Keep direct imports of the module only
+            continue
+        totals.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(totals, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the app's cold import time against a budget.")
+    parser.add_argument("--modules", nargs="+", default=["app", "asgi"], help="Modules to import")
+    parser.add_argument("--budget", type=float, default=1.0, help="Median wall time allowed, in seconds")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters started per module")
+    parser.add_argument("--top", type=int, default=8, help="Slowest direct imports to list")
+    args = parser.parse_args()
+
+    env = dict(os.environ, STARTUP_CHECKS="background", TEMPLATE_WARMUP_ON_START="false")
+    env.setdefault("OPENAI_API_KEY", "sk-import-time-benchmark")
+    env.setdefault("PROMPTLAYER_API_KEY", "pl-import-time-benchmark")
+
+    over_budget = False
+    for module in args.modules:
+        runs = [run_import(module, env) for _ in range(args.runs)]
+        wall = statistics.median(run[0] for run in runs)
+        imported = statistics.median(run[1] for run in runs)
+        status = "ok" if wall <= args.budget else "OVER BUDGET"
+        over_budget = over_budget or wall > args.budget
+        print(f"{module:8} median wall {wall * 1000:7.1f} ms, import {imported * 1000:7.1f} ms "
+              f"(budget {args.budget * 1000:.0f} ms) {status}")
+
+        for seconds, name in slowest_imports(run_import(module, env, importtime=True)[2], args.top):
+            print(f"    {seconds * 1000:7.1f} ms  {name}")
+
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
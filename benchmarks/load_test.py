@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+"""
+Load test for the app's main routes against local fake OpenAI and PromptLayer servers.
+
+    python -m benchmarks.load_test [--server asgi|flask] [--concurrency 1 8 32] [--duration 10]
+        [--scenarios index template generate suggest jija] [--baseline benchmarks/baselines/load_test.json]
+        [--save-baseline] [--tolerance 0.25] [fake server options, see benchmarks.fake_servers]
+
+The fake servers (benchmarks.fake_servers) and the app run in their own processes, so
+the load generator doesn't share a GIL with either. The app gets placeholder API keys,
+its caches and queues in a temporary directory, the completion cache turned off (every
+generation reaches the fake OpenAI server) and rate limits high enough not to throttle.
+Template details are still served from the template cache after the first request,
+as in production.
+
+For each scenario and concurrency level, that many threads send requests back to back for
+--duration seconds. Throughput and p50/p95/p99 latency are reported. A response counts as
+an error when its status is 4xx/5xx or its body is an error.
+
+The results are compared with the stored baseline: a p95 or p99 more than --tolerance
+slower, throughput more than --tolerance lower or a higher error rate is a regression,
+and the command exits with status 1. --save-baseline records this run as the new baseline.
+Baselines are absolute numbers for one machine and one set of run settings, so they are
+not checked in: record one locally, and re-record it after changing the settings. A
+baseline from another machine or with other settings (--duration, fake server options...)
+is reported and skipped rather than compared.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import requests
+
+from benchmarks.fake_servers import add_fake_server_arguments
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(APP_DIR, "benchmarks", "baselines", "load_test.json")
+
+# Scenario name -> (method, path, JSON body)
+SCENARIOS = {
+    "index": ("GET", "/", None),
+    "template": ("GET", "/template/" + urllib.parse.quote("Benchmark template 7 id 7"), None),
+    "generate": ("POST", "/generate_response", {
+        "system_message": "You are a concise business analyst.",
+        "user_message": "Summarise the quarter in five bullet points.",
+        "model": "gpt-4o", "temperature": 0.2, "max_tokens": 300
+    }),
+    "suggest": ("POST", "/suggest_improvements", {
+        "system_message": "You are a helpful assistant.",
+        "user_message": "Tell me about revenue.",
+        "assistant_message": "",
+        "model": "gpt-4o"
+    }),
+    "jija": ("POST", "/call_jija_comp", {"prompt": "Compare Q1 and Q2 revenue by region.", "temperature": 0.7, "max_tokens": 300})
+}
+
+# Run settings a baseline is only comparable under
+BASELINE_SETTINGS = ("server", "duration", "warmup", "openai_latency", "ttft", "chunks", "chunk_delay",
+                     "promptlayer_latency", "jitter", "error_rate", "rate_limit_rate")
+
+# Metrics compared with the baseline: name -> True when higher is better
+COMPARED_METRICS = {"rps": True, "p95_ms": False, "p99_ms": False}
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def wait_until_up(url, process, timeout=60):
+    """Poll url until it answers, failing early if the process exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def start_fake_servers(args):
+    """Run benchmarks.fake_servers in a subprocess. Returns (process, openai_url, promptlayer_url)."""
+    openai_port, promptlayer_port = free_port(), free_port()
+    command = [sys.executable, "-m", "benchmarks.fake_servers",
+               "--openai-port", str(openai_port), "--promptlayer-port", str(promptlayer_port),
+               "--openai-latency", str(args.openai_latency), "--ttft", str(args.ttft),
+               "--chunks", str(args.chunks), "--chunk-delay", str(args.chunk_delay),
+               "--promptlayer-latency", str(args.promptlayer_latency), "--jitter", str(args.jitter),
+               "--templates", str(args.templates), "--error-rate", str(args.error_rate),
+               "--rate-limit-rate", str(args.rate_limit_rate)]
+    process = subprocess.Popen(command, cwd=APP_DIR, stdout=subprocess.DEVNULL)
+    promptlayer_url = f"http://127.0.0.1:{promptlayer_port}"
+    wait_until_up(f"{promptlayer_url}/prompt-templates", process)
+    return process, f"http://127.0.0.1:{openai_port}/v1", promptlayer_url
+
+def start_app(args, openai_url, promptlayer_url, state_dir):
+    """Run the app (uvicorn + asgi, or the threaded Flask server) against the fakes. Returns (process, base URL)."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-load-test", PROMPTLAYER_API_KEY="pl-load-test",
+        OPENAI_BASE_URL=openai_url, PROMPTLAYER_BASE_URL=promptlayer_url,
+        STARTUP_CHECKS="background", TEMPLATE_WARMUP_ON_START="false",
+        COMPLETION_CACHE_ENABLED="false", LOG_LEVEL="WARNING",
+        OPENAI_DEFAULT_RPM="1000000", OPENAI_DEFAULT_TPM="1000000000", OPENAI_MAX_CONCURRENCY="256",
+        OPENAI_MODEL_LIMITS="gpt-4o=1000000:1000000000,gpt-3.5-turbo=1000000:1000000000",
+        COMPLETION_CACHE_PATH=os.path.join(state_dir, "completions.sqlite"),
+        BATCH_DIR=os.path.join(state_dir, "batch"),
+        TEMPLATE_VERSION_INDEX_PATH=os.path.join(state_dir, "template_versions.sqlite"),
+        CSV_UPLOAD_CACHE_PATH=os.path.join(state_dir, "chat_uploads.sqlite"),
+        JOB_QUEUE_PATH=os.path.join(state_dir, "jobs.sqlite"),
+        EXPORT_STORE_PATH=os.path.join(state_dir, "exports.sqlite")
+    )
+    if args.server == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning", "--no-access-log"]
+    else:
+        command = [sys.executable, "-c", f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_up(f"{base_url}/health", process)
+    return process, base_url
+
+def is_error(response):
+    """4xx/5xx, or a 200 whose JSON body reports an error (the generation routes answer errors in-band)."""
+    if response.status_code >= 400:
+        return True
+    if not response.headers.get("Content-Type", "").startswith("application/json"):
+        return False
+    body = response.json()
+    return isinstance(body, dict) and ("error" in body or str(body.get("response", "")).startswith("Error"))
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))]
+
+def run_level(base_url, scenario, concurrency, duration, warmup):
+    """Drive one scenario with concurrency threads for duration seconds. Returns its summary."""
+    method, path, body = SCENARIOS[scenario]
+    url = base_url + path
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    window = {}
+
+    def start_clock():
+        window["started"] = time.perf_counter()
+        window["deadline"] = window["started"] + duration
+
+    # Every thread finishes its warm-up requests before the clock starts
+    barrier = threading.Barrier(concurrency, action=start_clock)
+
+    def worker():
+        session = requests.Session()
+        for _ in range(warmup):
+            try:
+                session.request(method, url, json=body, timeout=120)
+            except requests.RequestException:
+                pass
+        barrier.wait()
+        while time.perf_counter() < window["deadline"]:
+            started = time.perf_counter()
+            try:
+                failed = is_error(session.request(method, url, json=body, timeout=120))
+            except requests.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - window["started"]
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "error_rate": round(errors[0] / len(latencies), 4) if latencies else None,
+        "rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None
+    }
+
+def machine_info():
+    """What a baseline's absolute numbers depend on besides the run settings."""
+    return {"host": platform.node(), "cpus": os.cpu_count(), "python": platform.python_version()}
+
+def baseline_mismatches(baseline, settings, machine):
+    """Why a baseline can't be compared with this run (empty when it can)."""
+    mismatches = []
+    recorded_machine = baseline.get("machine") or {}
+    if recorded_machine != machine:
+        mismatches.append(f"machine {recorded_machine or 'unknown'} (this run: {machine})")
+    recorded_settings = baseline.get("settings") or {}
+    for name in BASELINE_SETTINGS:
+        if recorded_settings.get(name) != settings[name]:
+            mismatches.append(f"{name} {recorded_settings.get(name)} (this run: {settings[name]})")
+    return mismatches
+
+def compare(results, baseline, tolerance):
+    """Print each result next to its baseline. Returns the list of regressions."""
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            print(f"{key:18} no baseline")
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            changes.append(f"{metric} {change:+.0%}")
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{key} {metric}: {old} -> {new}")
+        if (result.get("error_rate") or 0) > (previous.get("error_rate") or 0) + 0.01:
+            regressions.append(f"{key} error_rate: {previous.get('error_rate')} -> {result['error_rate']}")
+        print(f"{key:18} {', '.join(changes)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the app against local fake OpenAI and PromptLayer servers.")
+    parser.add_argument("--server", choices=["asgi", "flask"], default="asgi", help="uvicorn + asgi:app, or the Flask server")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32], help="Concurrency levels")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario and level")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests per thread before measuring")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    add_fake_server_arguments(parser)
+    args = parser.parse_args()
+
+    settings = {name: getattr(args, name) for name in BASELINE_SETTINGS}
+    machine = machine_info()
+    fakes = app = None
+    with tempfile.TemporaryDirectory(prefix="load-test-") as state_dir:
+        try:
+            fakes, openai_url, promptlayer_url = start_fake_servers(args)
+            app, base_url = start_app(args, openai_url, promptlayer_url, state_dir)
+
+            results = {}
+            print(f"{'scenario':18} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    key = f"{scenario}@{concurrency}"
+                    result = results[key] = run_level(base_url, scenario, concurrency, args.duration, args.warmup)
+                    print(f"{key:18} {result['requests']:>8} {result['errors']:>6} {result['rps']:>8} "
+                          f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}", flush=True)
+        finally:
+            for process in (app, fakes):
+                if process is not None:
+                    process.terminate()
+                    process.wait(timeout=10)
+
+    report = {"machine": machine, "settings": settings, "results": results}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    mismatches = baseline_mismatches(baseline, settings, machine)
+    if mismatches:
+        print(f"\nNot compared with {args.baseline}, it was recorded with a different\n  " + "\n  ".join(mismatches))
+        print("Run with --save-baseline to record a baseline for these settings on this machine")
+        return
+    print(f"\nCompared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for utils.template_normalizer against the process_specific_template
+implementation it replaced (kept below as a reference copy).
+
+    python -m benchmarks.template_normalizer [--messages 200] [--repeat 200]
+
+Logging runs at the app's INFO level into a discarded stream, so the cost of the old
+per-message log lines is included just as it is when the server runs. Before timing, both
+implementations' results are compared (COMPARED_FIELDS); any difference is printed and
+the command exits with status 1.
+"""
+import argparse
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.template_normalizer import normalize_template
+
+logger = logging.getLogger("benchmarks.legacy")
+
+# Template details both implementations must agree on
+COMPARED_FIELDS = ("system_message", "user_message", "assistant_message", "model", "provider", "temperature",
+                   "max_tokens", "top_p", "frequency_penalty", "presence_penalty", "version", "id")
+
+def differences(template):
+    """The COMPARED_FIELDS where the normalizer and the legacy implementation disagree, as {field: (legacy, current)}."""
+    legacy = legacy_process_specific_template(template)
+    current = normalize_template(template).to_dict()
+    return {field: (legacy[field], current[field]) for field in COMPARED_FIELDS if legacy[field] != current[field]}
+
+def build_template(fmt, message_count, parts_per_message=4):
+    """A large raw template in one of the PromptLayer formats, with list-of-parts content."""
+    roles = ["system"] + ["user", "assistant"] * (message_count // 2)
+    messages = [
+        {"role": role, "content": [{"type": "text", "text": f"{role} part {part} " * 20} for part in range(parts_per_message)]}
+        for role in roles[:message_count]
+    ]
+    metadata = {"model": {"name": "gpt-4o", "provider": "openai", "parameters": {"temperature": 0.3, "max_tokens": 800}}}
+    if fmt == "prompt_template":
+        return {"id": 1, "version": 2, "prompt_name": "bench", "metadata": metadata, "prompt_template": {"messages": messages}}
+    return {"id": 1, "version": 2, "prompt_name": "bench", "metadata": metadata,
+            "llm_kwargs": {"model": "gpt-4o", "temperature": 0.3, "messages": messages}}
+
+# Reference copy of the previous implementation, unchanged apart from its name
+def legacy_process_specific_template(template_data):
+    """Process a specific template from direct API response"""
+    try:
+        logger.info(f"Processing specific template: {template_data.get('prompt_name', 'Unknown')}")
+        logger.info(f"Template data keys: {list(template_data.keys())}")
+        
+        # Initialize message fields
+        system_message = ""
+        user_message = ""
+        assistant_message = ""
+        
+        # Extract basic template info
+        version = template_data.get("version", 1)
+        template_id = template_data.get("id", "unknown")
+        
+        # Extract model information
+        model = "gpt-3.5-turbo"  # Default
+        provider = "openai"      # Default
+        temperature = 0.7        # Default
+        max_tokens = 500         # Default
+        top_p = 1.0
+        frequency_penalty = 0.0
+        presence_penalty = 0.0
+        
+        # Extract from metadata if available
+        metadata = template_data.get("metadata", {})
+        if metadata and "model" in metadata:
+            model_info = metadata["model"]
+            model = model_info.get("name", model)
+            
+            # Extract provider information
+            provider = model_info.get("provider", "openai")
+            
+            # Get parameters if available
+            if "parameters" in model_info:
+                params = model_info["parameters"]
+                temperature = params.get("temperature", temperature)
+                top_p = params.get("top_p", top_p)
+                frequency_penalty = params.get("frequency_penalty", frequency_penalty)
+                presence_penalty = params.get("presence_penalty", presence_penalty)
+                if "max_tokens" in params:
+                    max_tokens = params.get("max_tokens")
+                    
+            logger.info(f"Model from metadata: {model}, Provider: {provider}")
+            logger.info(f"Params from metadata: temp={temperature}, top_p={top_p}, freq_penalty={frequency_penalty}, pres_penalty={presence_penalty}")
+        
+        # Handle different template formats
+        
+        # Format 1: Direct system, user, assistant fields
+        if "system_message" in template_data and "user_message" in template_data:
+            logger.info("Found direct message fields in template")
+            system_message = template_data.get("system_message", "")
+            user_message = template_data.get("user_message", "")
+            assistant_message = template_data.get("assistant_message", "")
+            logger.info(f"Direct fields - System: {system_message[:30]}..., User: {user_message[:30]}...")
+            
+        # Format 2: Prompt template with messages
+        elif "prompt_template" in template_data:
+            prompt_template = template_data["prompt_template"]
+            logger.info(f"Processing prompt_template with keys: {list(prompt_template.keys())}")
+            
+            # Extract messages if available
+            if "messages" in prompt_template:
+                messages = prompt_template["messages"]
+                logging.info(f"Found {len(messages)} messages in template")
+                
+                # Log message structure for debugging
+                for i, msg in enumerate(messages):
+                    logging.info(f"Message {i} role: {msg.get('role', 'unknown')}")
+                    if "content" in msg:
+                        content_type = type(msg["content"]).__name__
+                        logging.info(f"Message {i} content type: {content_type}")
+                        if content_type == "list" and len(msg["content"]) > 0:
+                            item_type = type(msg["content"][0]).__name__
+                            logging.info(f"Message {i} content item type: {item_type}")
+                
+                for msg in messages:
+                    role = msg.get("role")
+                    
+                    # Extract content from message - handle newer ChatGPT API format
+                    content_text = ""
+                    if "content" in msg:
+                        content = msg["content"]
+                        # Handle content as a string
+                        if isinstance(content, str):
+                            content_text = content
+                        # Handle content as a list of objects (newer ChatGPT API format)
+                        elif isinstance(content, list):
+                            for content_item in content:
+                                if isinstance(content_item, str):
+                                    content_text += content_item
+                                elif isinstance(content_item, dict):
+                                    # Regular format with direct text property
+                                    if "text" in content_item:
+                                        content_text += content_item["text"]
+                                    # Newer ChatGPT API format with type and text properties
+                                    elif "type" in content_item and content_item["type"] == "text" and "text" in content_item:
+                                        content_text += content_item["text"]
+                        
+                        logging.info(f"Extracted {role} message: {content_text[:50]}...")
+                    
+                    # Assign to appropriate message field
+                    if role == "system":
+                        system_message = content_text
+                    elif role == "user":
+                        user_message = content_text
+                    elif role == "assistant":
+                        assistant_message = content_text
+        
+        # Format 3: Look for llm_kwargs which contains model and messages - newer format
+        elif "llm_kwargs" in template_data:
+            logger.info("Found llm_kwargs format (newer ChatGPT API format)")
+            llm_kwargs = template_data["llm_kwargs"]
+            
+            # Extract model parameters
+            if "model" in llm_kwargs:
+                model = llm_kwargs["model"]
+            if "temperature" in llm_kwargs:
+                temperature = llm_kwargs["temperature"]
+            if "max_tokens" in llm_kwargs:
+                max_tokens = llm_kwargs.get("max_tokens", 1000)
+            if "top_p" in llm_kwargs:
+                top_p = llm_kwargs.get("top_p", 1.0)
+            if "frequency_penalty" in llm_kwargs:
+                frequency_penalty = llm_kwargs.get("frequency_penalty", 0.0)
+            if "presence_penalty" in llm_kwargs:
+                presence_penalty = llm_kwargs.get("presence_penalty", 0.0)
+                
+            # Process messages
+            if "messages" in llm_kwargs:
+                messages = llm_kwargs["messages"]
+                logger.info(f"Found {len(messages)} messages in llm_kwargs")
+                
+                for msg in messages:
+                    role = msg.get("role")
+                    content = msg.get("content")
+                    content_text = ""
+                    
+                    # Handle content as a string or list
+                    if isinstance(content, str):
+                        content_text = content
+                    elif isinstance(content, list):
+                        for content_item in content:
+                            if isinstance(content_item, str):
+                                content_text += content_item
+                            elif isinstance(content_item, dict):
+                                # Regular format with direct text property
+                                if "text" in content_item:
+                                    content_text += content_item["text"]
+                                # Newer ChatGPT API format with type and text properties
+                                elif "type" in content_item and content_item["type"] == "text" and "text" in content_item:
+                                    content_text += content_item["text"]
+                    
+                    # Assign to appropriate message field
+                    if role == "system":
+                        system_message = content_text
+                        logger.info(f"Found system message in llm_kwargs: {content_text[:50]}...")
+                    elif role == "user":
+                        # Append user messages together with newlines if there are multiple
+                        if user_message:
+                            user_message += "\n\n"
+                        user_message += content_text
+                        logger.info(f"Found user message in llm_kwargs: {content_text[:50]}...")
+                    elif role == "assistant":
+                        assistant_message = content_text
+                        logger.info(f"Found assistant message in llm_kwargs: {content_text[:50]}...")
+                
+        # Format 4: Handle direct prompt field
+        elif "prompt" in template_data:
+            logger.info("Found direct prompt field")
+            user_message = template_data.get("prompt", "")
+            system_message = "You are a helpful AI assistant."
+            logger.info(f"Using prompt as user message: {user_message[:50]}...")
+            
+        # Log what we found
+        logger.info(f"Final user message length: {len(user_message)}")
+        logger.info(f"Final system message length: {len(system_message)}")
+        
+        # If we still have no user message, try to extract it from other fields
+        if not user_message:
+            logger.warning("No user message found in normal fields, looking in complete template")
+            # Try to extract from any text fields
+            for key, value in template_data.items():
+                if isinstance(value, str) and len(value) > 20 and not user_message:
+                    logger.info(f"Found potential user message in field '{key}'")
+                    user_message = value
+                    break
+        
+        # Default model if none is specified
+        if not model:
+            model = "gpt-4o"
+        
+        # Create the final template object
+        template_details = {
+            "system_message": system_message,
+            "user_message": user_message,
+            "assistant_message": assistant_message,
+            "model": model,
+            "provider": provider if 'provider' in locals() else "openai",  # Use detected provider or default to openai
+            "temperature": float(temperature),
+            "max_tokens": int(max_tokens),
+            "top_p": float(top_p),
+            "frequency_penalty": float(frequency_penalty),
+            "presence_penalty": float(presence_penalty),
+            "version": version,
+            "id": template_id,
+            "Frequency Penalty": float(frequency_penalty),  # Renamed parameter for display
+        }
+        
+        logger.info(f"Successfully processed specific template with version {version}")
+        logger.info(f"User message length: {len(user_message)}")
+        logger.info(f"System message length: {len(system_message)}")
+        
+        return template_details
+    except Exception as e:
+        logger.error(f"Error processing specific template: {str(e)}")
+        # Return default values
+        return {
+            "system_message": "You are a helpful AI assistant.",
+            "user_message": "Please provide information about this topic.",
+            "assistant_message": "",
+            "model": "gpt-4o",
+            "provider": "openai",
+            "temperature": 0.7,
+            "max_tokens": 500,
+            "top_p": 1.0,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0,
+            "version": 1,
+            "id": "unknown",
+            "Frequency Penalty": 0.0  # Renamed parameter
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the template normalizer with the previous implementation.")
+    parser.add_argument("--messages", type=int, default=200, help="Messages per template")
+    parser.add_argument("--repeat", type=int, default=200, help="Normalizations timed per run")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    mismatched = False
+    for fmt in ("prompt_template", "llm_kwargs"):
+        template = build_template(fmt, args.messages)
+        mismatches = differences(template)
+        if mismatches:
+            mismatched = True
+            for field, (legacy, current) in mismatches.items():
+                print(f"{fmt:16} {field} differs: legacy {legacy!r:.60}, normalizer {current!r:.60}")
+            continue
+        legacy = min(timeit.repeat(lambda: legacy_process_specific_template(template), number=args.repeat, repeat=5))
+        current = min(timeit.repeat(lambda: normalize_template(template), number=args.repeat, repeat=5))
+        per_call = lambda total: total / args.repeat * 1e6
+        print(f"{fmt:16} {args.messages} messages: legacy {per_call(legacy):9.1f} us/call, "
+              f"normalizer {per_call(current):9.1f} us/call ({legacy / current:.1f}x faster)")
+    if mismatched:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
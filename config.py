@@ -8,5 +8,112 @@ load_dotenv()
 PROMPTLAYER_API_KEY = os.getenv("PROMPTLAYER_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# API endpoints (point these at local stand-ins, e.g. benchmarks/fake_servers.py, to test without the live APIs)
+PROMPTLAYER_BASE_URL = os.getenv("PROMPTLAYER_BASE_URL", "https://api.promptlayer.com").rstrip("/")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # None uses the OpenAI SDK default
+
 # App Config
-PORT = 9999
\ No newline at end of file
+PORT = 9999
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Concurrency for /generate_pair and /generate_batch
+GENERATION_MAX_WORKERS = int(os.getenv("GENERATION_MAX_WORKERS", "8"))
+GENERATION_BATCH_LIMIT = int(os.getenv("GENERATION_BATCH_LIMIT", "16"))
+
+# Completion cache (memory LRU in front of a SQLite file)
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", os.path.join(APP_DIR, ".cache", "completions.sqlite"))
+COMPLETION_CACHE_TTL = int(os.getenv("COMPLETION_CACHE_TTL", "86400"))  # Seconds
+COMPLETION_CACHE_MEMORY_ITEMS = int(os.getenv("COMPLETION_CACHE_MEMORY_ITEMS", "256"))
+COMPLETION_CACHE_DISK_ITEMS = int(os.getenv("COMPLETION_CACHE_DISK_ITEMS", "5000"))
+
+# PromptLayer template cache (seconds). Stale entries are served while they refresh in the background
+TEMPLATE_CACHE_TTL = int(os.getenv("TEMPLATE_CACHE_TTL", "300"))
+TEMPLATE_CACHE_MAX_STALE = int(os.getenv("TEMPLATE_CACHE_MAX_STALE", "86400"))
+TEMPLATE_CACHE_REFRESH_INTERVAL = int(os.getenv("TEMPLATE_CACHE_REFRESH_INTERVAL", "60"))  # 0 disables proactive refresh
+TEMPLATE_CACHE_ACTIVE_WINDOW = int(os.getenv("TEMPLATE_CACHE_ACTIVE_WINDOW", "3600"))  # Only entries read this recently are refreshed proactively
+
+# PromptLayer HTTP client
+PROMPTLAYER_CONNECT_TIMEOUT = float(os.getenv("PROMPTLAYER_CONNECT_TIMEOUT", "3.05"))  # Seconds
+PROMPTLAYER_READ_TIMEOUT = float(os.getenv("PROMPTLAYER_READ_TIMEOUT", "15"))  # Seconds
+PROMPTLAYER_MAX_RETRIES = int(os.getenv("PROMPTLAYER_MAX_RETRIES", "3"))
+PROMPTLAYER_POOL_SIZE = int(os.getenv("PROMPTLAYER_POOL_SIZE", "10"))
+PROMPTLAYER_MAX_CONCURRENCY = int(os.getenv("PROMPTLAYER_MAX_CONCURRENCY", "8"))
+
+# How get_template_directly tries its lookup strategies: "sequential" (one after the other) or
+# "race" (all at once: faster on a miss, but most lookups then cost two PromptLayer requests)
+TEMPLATE_FETCH_MODE = os.getenv("TEMPLATE_FETCH_MODE", "sequential")
+
+# Background template warm-up at startup
+TEMPLATE_WARMUP_ON_START = os.getenv("TEMPLATE_WARMUP_ON_START", "false").lower() == "true"
+TEMPLATE_WARMUP_LIMIT = int(os.getenv("TEMPLATE_WARMUP_LIMIT", "0"))  # 0 warms every template
+TEMPLATE_WARMUP_CONCURRENCY = int(os.getenv("TEMPLATE_WARMUP_CONCURRENCY", "4"))
+
+# Batch evaluation runner
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join(APP_DIR, ".cache", "batch"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # Rows run at the same time
+
+# OpenAI rate limiting (process-wide, per model)
+OPENAI_DEFAULT_RPM = int(os.getenv("OPENAI_DEFAULT_RPM", "500"))  # Requests per minute for models not listed below
+OPENAI_DEFAULT_TPM = int(os.getenv("OPENAI_DEFAULT_TPM", "30000"))  # Tokens per minute for models not listed below
+# Per-model "model=rpm:tpm" pairs, e.g. "gpt-4o=500:30000,gpt-3.5-turbo=3500:90000"
+OPENAI_MODEL_LIMITS = {
+    name.strip(): tuple(int(limit) for limit in limits.split(":"))
+    for name, limits in (item.split("=") for item in os.getenv("OPENAI_MODEL_LIMITS", "gpt-4o=500:30000,gpt-3.5-turbo=3500:90000").split(",") if "=" in item)
+}
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))  # Upper bound for adaptive concurrency per model
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "60"))  # Seconds a request may wait for capacity
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))  # Retries for timeouts/connection/5xx errors
+# Startup checks: "background" serves immediately and reports progress at /ready,
+# "blocking" checks PromptLayer before the app starts and refuses to start if it is unreachable
+STARTUP_CHECKS = os.getenv("STARTUP_CHECKS", "background").lower()
+READINESS_RETRY_INTERVAL = float(os.getenv("READINESS_RETRY_INTERVAL", "30"))  # Seconds between retries of failed checks
+
+# Response diffing
+DIFF_MAX_CHARS = int(os.getenv("DIFF_MAX_CHARS", "1000000"))  # Largest combined input /diff accepts
+
+# Template version history index (published versions never change, so entries don't expire)
+TEMPLATE_VERSION_INDEX_PATH = os.getenv("TEMPLATE_VERSION_INDEX_PATH", os.path.join(APP_DIR, ".cache", "template_versions.sqlite"))
+TEMPLATE_VERSION_FETCH_CONCURRENCY = int(os.getenv("TEMPLATE_VERSION_FETCH_CONCURRENCY", "8"))  # Versions fetched at the same time
+TEMPLATE_VERSION_DIFF_LIMIT = int(os.getenv("TEMPLATE_VERSION_DIFF_LIMIT", "20"))  # Most versions in one diff request
+
+# Server-side parsing of JiJa chat CSV exports (cached by file hash)
+CSV_UPLOAD_CACHE_PATH = os.getenv("CSV_UPLOAD_CACHE_PATH", os.path.join(APP_DIR, ".cache", "chat_uploads.sqlite"))
+CSV_UPLOAD_CACHE_ITEMS = int(os.getenv("CSV_UPLOAD_CACHE_ITEMS", "50"))  # Parsed uploads kept
+CSV_UPLOAD_PAGE_SIZE = int(os.getenv("CSV_UPLOAD_PAGE_SIZE", "50"))  # Rows per page by default
+CSV_UPLOAD_MAX_FIELD_CHARS = int(os.getenv("CSV_UPLOAD_MAX_FIELD_CHARS", str(64 * 1024 * 1024)))  # Longest single cell
+
+# Background job queue for long-running routes (jobs are kept in SQLite so they survive a restart)
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(APP_DIR, ".cache", "jobs.sqlite"))
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "4"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "86400"))  # Seconds finished jobs and their results are kept
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))  # A running job whose process stops renewing it this long is requeued
+
+# Export archive (comparison reports are stored compressed in SQLite and rendered on download)
+EXPORT_STORE_PATH = os.getenv("EXPORT_STORE_PATH", os.path.join(APP_DIR, ".cache", "exports.sqlite"))
+EXPORT_RETENTION_DAYS = int(os.getenv("EXPORT_RETENTION_DAYS", "30"))
+EXPORT_MAX_ITEMS = int(os.getenv("EXPORT_MAX_ITEMS", "5000"))
+
+# Logging: "text" (the classic format) or "json" (one structured object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"  # Write log records from a background thread
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "200"))  # Longer event fields are truncated
+# Per-event sampling rates, "event=rate" pairs, e.g. "generation.request=0.1,template.fetched=0.01".
+# Events not listed use LOG_SAMPLE_DEFAULT. Warnings and errors are always logged
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, rate in (item.split("=") for item in os.getenv("LOG_SAMPLE_RATES", "").split(",") if "=" in item)
+}
+LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", "1.0"))
+
+# Record/replay of OpenAI and PromptLayer traffic for offline profiling: "off", "record" or "replay"
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", os.path.join(APP_DIR, ".cache", "cassette.sqlite"))
+CASSETTE_SPEED = float(os.getenv("CASSETTE_SPEED", "1.0"))  # Replay pace: 1 as recorded, 10 ten times faster, 0 no waiting
+
+# In-flight request coalescing: identical concurrent requests share one upstream call.
+# Template fetches and temperature-0 generations are coalesced; sampled generations only when
+# COALESCE_SAMPLED is set or the request sends "coalesce": true
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_SAMPLED = os.getenv("COALESCE_SAMPLED", "false").lower() == "true"
@@ -15,6 +15,10 @@ if [ ! -f ".env" ]; then
     exit 1
 fi
 
-# Run the application
+# Run the application (pass --dev to use the Flask development server instead)
 echo "Starting PromptComp application on port 9999..."
-python app.py
\ No newline at end of file
+if [ "$1" == "--dev" ]; then
+    python app.py
+else
+    uvicorn asgi:app --host 0.0.0.0 --port 9999
+fi
@@ -21,6 +21,44 @@ function handleError(error, userMessage = null) {
     alert(message);
 }
 
+// POST a JSON body and read the Server-Sent Events stream, calling onEvent for each event
+async function streamEvents(url, body, onEvent) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(body),
+    });
+    
+    if (!response.ok || !response.body) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `Request failed (${response.status})`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+            if (dataLine) {
+                onEvent(JSON.parse(dataLine.slice(6)));
+            }
+            boundary = buffer.indexOf('\n\n');
+        }
+    }
+}
+
 // Format response for display
 function formatResponseForDisplay(response) {
     if (!response) return '';
@@ -260,4 +298,61 @@ function copyToClipboard(text) {
             handleError(err, 'Failed to copy to clipboard.');
         }
     );
-}
\ No newline at end of file
+}
+// Render /diff opcodes: unchanged text as is, removed text struck through, added text highlighted
+function renderDiff(container, opcodes) {
+    const fragment = document.createDocumentFragment();
+    opcodes.forEach(([op, text]) => {
+        if (op === '=') {
+            fragment.appendChild(document.createTextNode(text));
+            return;
+        }
+        const span = document.createElement(op === '+' ? 'ins' : 'del');
+        span.className = op === '+' ? 'diff-insert' : 'diff-delete';
+        span.textContent = text;
+        fragment.appendChild(span);
+    });
+    container.innerHTML = '';
+    container.appendChild(fragment);
+}
+
+// Open the page's #diffModal from button and diff the texts returned by getOld/getNew on the server
+function attachDiffButton(button, getOld, getNew) {
+    const modal = new bootstrap.Modal(document.getElementById('diffModal'));
+    const granularity = document.getElementById('diffGranularity');
+    const output = document.getElementById('diffOutput');
+    const stats = document.getElementById('diffStats');
+    
+    async function showDiff() {
+        try {
+            // Either side may be loaded from the server first (getOld/getNew can return a promise)
+            const [oldText, newText] = await Promise.all([getOld(), getNew()]);
+            const response = await fetch('/diff', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    old: oldText,
+                    new: newText,
+                    granularity: granularity.value
+                }),
+            });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to diff responses');
+            }
+            renderDiff(output, data.opcodes);
+            stats.textContent = `${Math.round(data.stats.similarity * 100)}% similar, ` +
+                `${data.stats.deleted} removed, ${data.stats.inserted} added`;
+        } catch (error) {
+            handleError(error);
+        }
+    }
+    
+    button.addEventListener('click', async function() {
+        modal.show();
+        await showDiff();
+    });
+    granularity.addEventListener('change', showDiff);
+}
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from utils import diff_engine
+from utils.diff_engine import GRANULARITIES, diff_sequences, diff_texts
+
+PAIRS = [
+    ("", ""),
+    ("", "Only new text.\n"),
+    ("Only old text.\n", ""),
+    ("You are a helpful assistant.\nAnswer briefly.\n", "You are a concise assistant.\nAnswer briefly, in English.\n"),
+    ("a b a b a b\n", "b a b a b a\n"),
+    ("{{name}}: summarise {{topic}}!", "{{name}} - summarise {{topic}} in 3 bullets?"),
+]
+
+def rebuild(opcodes):
+    old = "".join(text for op, text in opcodes if op in ("=", "-"))
+    new = "".join(text for op, text in opcodes if op in ("=", "+"))
+    return old, new
+
+@pytest.mark.parametrize("granularity", GRANULARITIES)
+@pytest.mark.parametrize("old,new", PAIRS)
+def test_opcodes_rebuild_both_texts(old, new, granularity):
+    assert rebuild(diff_texts(old, new, granularity)["opcodes"]) == (old, new)
+
+@pytest.mark.parametrize("granularity", GRANULARITIES)
+def test_opcodes_rebuild_random_edits(granularity):
+    rng = random.Random(15)
+    words = ["alpha", "beta", "gamma", "delta", "the", "a", "\n", "{{x}}", ","]
+    for _ in range(50):
+        old = " ".join(rng.choice(words) for _ in range(rng.randint(0, 60)))
+        new_words = old.split(" ")
+        for _ in range(rng.randint(0, 10)):
+            position = rng.randint(0, len(new_words))
+            if rng.random() < 0.5 and position < len(new_words):
+                del new_words[position]
+            else:
+                new_words.insert(position, rng.choice(words))
+        new = " ".join(new_words)
+        result = diff_texts(old, new, granularity)
+        assert rebuild(result["opcodes"]) == (old, new)
+        stats = result["stats"]
+        assert stats["unchanged"] + stats["deleted"] == stats["old_tokens"]
+        assert stats["unchanged"] + stats["inserted"] == stats["new_tokens"]
+
+def test_identical_texts_are_one_equal_run():
+    result = diff_texts("same words here", "same words here")
+    assert result["opcodes"] == [["=", "same words here"]]
+    assert result["stats"]["similarity"] == 1.0
+
+def test_gap_without_unique_anchors_uses_myers():
+    # Every token repeats, so patience finds no anchors and Myers finds the 2-edit script
+    ops = diff_sequences(list("abab"), list("baba"))
+    assert ops == [["delete", 0, 1, 0, 0], ["equal", 1, 4, 0, 3], ["insert", 4, 4, 3, 4]]
+
+def test_gap_over_myers_max_edits_becomes_delete_then_insert(monkeypatch):
+    monkeypatch.setattr(diff_engine, "MYERS_MAX_EDITS", 1)
+    assert diff_sequences(list("abab"), list("baba")) == [["delete", 0, 4, 0, 0], ["insert", 4, 4, 0, 4]]
+    opcodes = diff_texts("x a b a b y", "x b a b a y")["opcodes"]
+    assert [op for op, _ in opcodes] == ["=", "-", "+", "="]
+    assert rebuild(opcodes) == ("x a b a b y", "x b a b a y")
+
+def test_unknown_granularity_is_rejected():
+    with pytest.raises(ValueError):
+        diff_texts("a", "b", "character")
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from utils.job_queue import JobQueue
+
+def insert_running_job(queue, job_id, heartbeat_at, owner="other-host:1:dead"):
+    """A running job row as a process that has since stopped (or is still alive) would leave it."""
+    db = queue._connect()
+    db.execute("INSERT INTO jobs (job_id, kind, payload, state, created_at, started_at, owner, heartbeat_at) "
+               "VALUES (?, 'echo', '{\"value\": 1}', 'running', ?, ?, ?, ?)",
+               (job_id, time.time() - 120, time.time() - 120, owner, heartbeat_at))
+    db.commit()
+
+def wait_until_done(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    job = queue.get(job_id)
+    while job["state"] in ("queued", "running") and time.monotonic() < deadline:
+        job = queue.wait_for_change(job_id, job["state"], timeout=deadline - time.monotonic())
+    return job
+
+def test_running_job_with_expired_lease_is_requeued_and_run(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=1, lease_seconds=30)
+    queue.register("echo", lambda payload: {"echo": payload["value"]})
+    insert_running_job(queue, "stale", heartbeat_at=time.time() - 60)
+    insert_running_job(queue, "leased", heartbeat_at=time.time(), owner="other-host:2:alive")
+    insert_running_job(queue, "never-renewed", heartbeat_at=None)
+
+    queue.start()
+
+    for job_id in ("stale", "never-renewed"):
+        job = wait_until_done(queue, job_id)
+        assert job["state"] == "finished"
+        assert job["result"] == {"echo": 1}
+    # Another process still holds this lease, so it is left alone
+    assert queue.get("leased")["state"] == "running"
+
+def test_cancel_while_running_drops_the_result(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=1)
+    started, release, returned = threading.Event(), threading.Event(), threading.Event()
+
+    def slow(payload):
+        started.set()
+        release.wait(5)
+        returned.set()
+        return {"value": payload["value"]}
+
+    queue.register("slow", slow)
+    job_id = queue.submit("slow", {"value": 7})["job_id"]
+    assert started.wait(5)
+
+    job = queue.cancel(job_id)
+    assert job["state"] == "cancelled"
+    assert job["cancel_requested"]
+
+    release.set()
+    assert returned.wait(5)
+    # Give the worker time to try (and fail) to record its result
+    queue.wait_for_change(job_id, "cancelled", timeout=0.2)
+    job = queue.get(job_id)
+    assert job["state"] == "cancelled"
+    assert "result" not in job
+    assert queue._connect().execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone() == (None,)
+
+def test_cancel_queued_job_never_runs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=1)
+    ran = []
+    blocker = threading.Event()
+    queue.register("block", lambda payload: blocker.wait(5))
+    queue.register("record", lambda payload: ran.append(payload))
+
+    first = queue.submit("block", {})["job_id"]
+    second = queue.submit("record", {"n": 1})["job_id"]
+    assert queue.cancel(second)["state"] == "cancelled"
+    blocker.set()
+    assert wait_until_done(queue, first)["state"] == "finished"
+    assert queue.get(second)["state"] == "cancelled"
+    assert ran == []
+
+def test_cancel_unknown_job(tmp_path):
+    assert JobQueue(str(tmp_path / "jobs.db")).cancel("missing") is None
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from utils.rate_limiter import ModelLimiter, RateLimitTimeout, TokenBucket
+
+def test_token_bucket_refills_at_the_per_minute_rate():
+    bucket = TokenBucket(60)
+    bucket.updated = 100.0
+    bucket.take(60)
+    assert bucket.wait_time(1, 100.0) == pytest.approx(1.0)
+    assert bucket.wait_time(1, 100.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, 101.0) == 0.0
+    assert bucket.wait_time(10, 101.0) == pytest.approx(9.0)
+
+def test_token_bucket_never_refills_past_capacity():
+    bucket = TokenBucket(120)
+    bucket.updated = 0.0
+    bucket.take(120)
+    bucket.wait_time(1, 3600.0)
+    assert bucket.tokens == 120.0
+
+def test_token_bucket_oversized_request_waits_for_a_full_bucket():
+    bucket = TokenBucket(60)
+    bucket.updated = 0.0
+    bucket.take(30)
+    assert bucket.wait_time(500, 0.0) == pytest.approx(30.0)
+    assert bucket.wait_time(500, 30.0) == 0.0
+
+def test_rate_limit_halves_concurrency_down_to_one():
+    limiter = ModelLimiter("test-model", rpm=10_000, tpm=10_000_000, max_concurrency=8)
+    limits = []
+    for _ in range(5):
+        limiter.acquire(10, time.monotonic() + 1)
+        limiter.release(rate_limited=True, retry_after=0)
+        limits.append(limiter.concurrency_limit)
+    assert limits == [4.0, 2.0, 1.0, 1.0, 1.0]
+    assert limiter.in_flight == 0
+    assert limiter.get_stats()["rate_limited"] == 5
+
+def test_successes_grow_concurrency_back_to_the_maximum():
+    limiter = ModelLimiter("test-model", rpm=10_000, tpm=10_000_000, max_concurrency=4)
+    limiter.concurrency_limit = 1.0
+    limiter.in_flight = 1
+    limiter.release()
+    assert limiter.concurrency_limit == 2.0
+    limiter.in_flight = 1
+    limiter.release()
+    assert limiter.concurrency_limit == 2.5
+    for _ in range(50):
+        limiter.in_flight = 1
+        limiter.release()
+    assert limiter.concurrency_limit == 4.0
+
+def test_acquire_times_out_when_concurrency_is_full():
+    limiter = ModelLimiter("test-model", rpm=10_000, tpm=10_000_000, max_concurrency=1)
+    limiter.acquire(10, time.monotonic() + 1)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(10, time.monotonic() + 0.05)
+    limiter.release()
+    limiter.acquire(10, time.monotonic() + 1)
+    assert limiter.get_stats()["timeouts"] == 1
+
+def test_retry_after_pauses_new_requests():
+    limiter = ModelLimiter("test-model", rpm=10_000, tpm=10_000_000, max_concurrency=4)
+    limiter.acquire(10, time.monotonic() + 1)
+    limiter.release(rate_limited=True, retry_after=5)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(10, time.monotonic() + 0.05)
@@ -0,0 +1,82 @@
+import pytest
+
+from benchmarks.template_normalizer import build_template, differences, legacy_process_specific_template
+from utils.template_normalizer import TEMPLATE_FORMATS, normalize_message_roles, normalize_template
+
+METADATA = {"model": {"name": "gpt-4o-mini", "provider": "openai",
+                      "parameters": {"temperature": 0.2, "max_tokens": 900, "top_p": 0.9}}}
+
+# One raw template per TEMPLATE_FORMATS entry, in the shapes PromptLayer returns
+TEMPLATES = {
+    "direct fields": {"id": 3, "version": 4, "metadata": METADATA, "system_message": "Be brief.",
+                      "user_message": "Summarise {topic}.", "assistant_message": "Sure."},
+    "prompt_template": {"id": 5, "version": 2, "metadata": METADATA, "prompt_template": {"messages": [
+        {"role": "system", "content": [{"type": "text", "text": "You are "}, {"type": "text", "text": "terse."}]},
+        {"role": "user", "content": "First question"},
+        {"role": "assistant", "content": "First answer"},
+        {"role": "user", "content": ["Second ", {"text": "question"}]},
+    ]}},
+    "llm_kwargs": {"id": 7, "version": 9, "metadata": METADATA, "llm_kwargs": {
+        "model": "gpt-4o", "temperature": 0.5, "presence_penalty": 0.3, "messages": [
+            {"role": "system", "content": "System text"},
+            {"role": "user", "content": "Part one"},
+            {"role": "assistant", "content": "Reply"},
+            {"role": "user", "content": [{"type": "text", "text": "Part two"}]},
+        ]}},
+    "prompt": {"id": 8, "version": 1, "prompt": "Tell me about the quarterly numbers."},
+}
+
+def test_every_format_is_covered():
+    covered = {required for required, _, _ in TEMPLATE_FORMATS
+               for template in TEMPLATES.values() if required.issubset(template)}
+    assert covered == {required for required, _, _ in TEMPLATE_FORMATS}
+
+@pytest.mark.parametrize("name", TEMPLATES)
+def test_matches_the_legacy_implementation(name):
+    assert differences(TEMPLATES[name]) == {}
+
+@pytest.mark.parametrize("fmt", ["prompt_template", "llm_kwargs"])
+def test_matches_the_legacy_implementation_on_large_templates(fmt):
+    assert differences(build_template(fmt, 40)) == {}
+
+def test_llm_kwargs_joins_every_user_message():
+    details = normalize_template(TEMPLATES["llm_kwargs"]).to_dict()
+    assert details["user_message"] == "Part one\n\nPart two"
+    assert details["temperature"] == 0.5
+    assert details["max_tokens"] == 900
+    assert details["presence_penalty"] == 0.3
+
+def test_llm_kwargs_user_messages_without_text_are_skipped():
+    template = {"llm_kwargs": {"messages": [{"role": "user", "content": "a"}, {"role": "user", "content": None},
+                                            {"role": "user", "content": ""}, {"role": "user", "content": "b"}]}}
+    assert normalize_template(template).user_message == "a\n\nb"
+    assert normalize_template({"llm_kwargs": {"messages": [{"role": "user", "content": None}]}}).user_message == ""
+
+def test_developer_role_is_sent_as_system():
+    template = {"prompt_template": {"messages": [{"role": "developer", "content": "Rules"},
+                                                 {"role": "user", "content": "Question"}]}}
+    record = normalize_template(template)
+    assert record.system_message == "Rules"
+    assert record.to_dict()["messages"] == [{"role": "system", "content": "Rules"},
+                                            {"role": "user", "content": "Question"}]
+
+@pytest.mark.parametrize("role", ["tool", "function", "placeholder"])
+def test_roles_without_a_chat_equivalent_are_dropped(role):
+    template = {"llm_kwargs": {"messages": [{"role": "system", "content": "S"},
+                                            {"role": role, "content": "dropped"},
+                                            {"role": "user", "content": "U"}]}}
+    record = normalize_template(template)
+    assert [role for role, _ in record.messages] == ["system", "user"]
+    assert "dropped" not in record.user_message
+
+def test_normalize_message_roles():
+    messages = [{"role": "developer", "content": "D"}, {"role": "tool", "content": "T", "tool_call_id": "1"},
+                {"role": "placeholder", "content": ""}, {"role": "user", "content": "U"}]
+    assert normalize_message_roles(messages) == [{"role": "system", "content": "D"}, {"role": "user", "content": "U"}]
+    assert messages[0]["role"] == "developer"  # The caller's list is left alone
+
+def test_malformed_templates_fall_back_to_defaults():
+    legacy = legacy_process_specific_template({"prompt_template": None})
+    current = normalize_template({"prompt_template": None}).to_dict()
+    assert current["user_message"] == legacy["user_message"]
+    assert current["model"] == legacy["model"]
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import OPENAI_API_KEY, OPENAI_BASE_URL, CASSETTE_MODE
+from utils.completion_cache import completion_cache
+from utils.single_flight import AsyncSingleFlight, should_coalesce
+from utils.metrics import timed_upstream, record_upstream
+from utils.openai_api import (
+    ChatRequestAttempts, StreamProgress, StreamCollector, prepare_generation, request_key, log_completion_request,
+    completion_text, stream_request, stream_error_event, cached_stream_events, jija_request,
+    improvement_request, parse_improvement
+)
+
+logger = logging.getLogger(__name__)
+
+# Async counterparts of utils.openai_api for the ASGI server. Building requests, cache keys,
+# retries, metrics and parsing all come from utils.openai_api; only the waiting is done here.
+# They share the completion cache and the per-model rate limiters with the sync functions.
+
+# The completion cache's SQLite tier blocks (and set() holds its lock while it trims),
+# so the async functions use it from these threads instead of the event loop
+_cache_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="completion-cache")
+
+async def cache_get(key):
+    """completion_cache.get, run off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_cache_executor, completion_cache.get, key)
+
+async def cache_set(key, value):
+    """completion_cache.set, run off the event loop."""
+    await asyncio.get_running_loop().run_in_executor(_cache_executor, completion_cache.set, key, value)
+
+# Identical requests in flight at the same time share one OpenAI call (see should_coalesce)
+completion_aflight = AsyncSingleFlight("generate_completion")
+jija_aflight = AsyncSingleFlight("call_jija_comp_gpt")
+improvement_aflight = AsyncSingleFlight("improve_prompt_field")
+
+# AsyncOpenAI client, created by get_async_client on first use so importing this module doesn't load the SDK
+async_client = None
+_async_client_lock = threading.Lock()
+
+def get_async_client():
+    """Return the shared AsyncOpenAI client, creating it on first use."""
+    global async_client
+    if async_client is None:
+        with _async_client_lock:
+            if async_client is None:
+                from openai import AsyncOpenAI
+                # Retries are handled by acreate_chat_completion so 429s can feed the rate limiter
+                # In record or replay mode the SDK's HTTP traffic goes through the cassette (utils/cassette.py)
+                http_client = None
+                if CASSETTE_MODE != "off":
+                    from utils.cassette import openai_http_client
+                    http_client = openai_http_client(asynchronous=True)
+                async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0, http_client=http_client)
+    return async_client
+
+async def _release_when_done(stream, limiter):
+    """Hold the limiter slot until a streamed response has been fully read."""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        limiter.release()
+
+async def acreate_chat_completion(**request):
+    """
+    Async version of create_chat_completion: queue for rate limit capacity without
+    blocking a thread, back off on 429s and retry transient errors. Records the same metrics.
+    """
+    openai_client = get_async_client()
+    attempts = ChatRequestAttempts(request)
+
+    while True:
+        await attempts.limiter.acquire_async(attempts.estimated, attempts.deadline)
+        attempts.begin()
+        try:
+            response = await openai_client.chat.completions.create(**request)
+        except BaseException as e:
+            # Cancellation also frees the limiter slot
+            delay = attempts.failed(e)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        attempts.succeeded(response)
+        return _release_when_done(response, attempts.limiter) if attempts.stream else response
+
+@timed_upstream("openai", "generate_completion", failed=lambda result: str(result).startswith("Error generating response:"))
+async def agenerate_completion(user_message="", system_message="You are a helpful AI assistant.", assistant_message="", model="gpt-4o", temperature=0.7, max_tokens=500, use_cache=None, messages=None, coalesce=None, **kwargs):
+    """Async version of generate_completion."""
+    try:
+        request, cache_key = prepare_generation(user_message, system_message, assistant_message, model,
+                                                temperature, max_tokens, use_cache, messages, kwargs)
+        if cache_key:
+            cached = await cache_get(cache_key)
+            if cached is not None:
+                logging.info(f"Completion cache hit for model: {model}")
+                return cached
+
+        async def complete():
+            log_completion_request(request)
+            content = completion_text(await acreate_chat_completion(**request))
+            if cache_key and content is not None:
+                await cache_set(cache_key, content)
+            return content
+
+        if should_coalesce(temperature, coalesce):
+            return await completion_aflight.do(cache_key or request_key(request), complete)
+        return await complete()
+    except Exception as e:
+        logging.error(f"Error generating completion: {str(e)}")
+        return f"Error generating response: {str(e)}"
+
+async def astream_chat_completion(model, messages, temperature=0.7, max_tokens=500, **kwargs):
+    """Async version of stream_chat_completion. Yields the same events."""
+    progress = StreamProgress(model)
+    try:
+        logging.info(f"Streaming completion with model: {model}")
+        async for chunk in await acreate_chat_completion(**stream_request(model, messages, temperature, max_tokens, kwargs)):
+            delta = progress.delta(chunk)
+            if delta:
+                yield {"delta": delta}
+        outcome = "ok"
+    except Exception as e:
+        outcome = "error"
+        yield stream_error_event(e)
+    yield progress.done_event(outcome)
+
+async def astream_completion(user_message="", system_message="You are a helpful AI assistant.", assistant_message="", model="gpt-4o", temperature=0.7, max_tokens=500, use_cache=None, messages=None, coalesce=None, **kwargs):
+    """Async version of stream_completion, including the cache read and write-back."""
+    try:
+        request, cache_key = prepare_generation(user_message, system_message, assistant_message, model,
+                                                temperature, max_tokens, use_cache, messages, kwargs)
+    except Exception as e:
+        logging.error(f"Error preparing streamed completion: {str(e)}")
+        yield {"error": f"Error generating response: {str(e)}"}
+        return
+
+    if cache_key:
+        started = time.perf_counter()
+        cached = await cache_get(cache_key)
+        if cached is not None:
+            for event in cached_stream_events(model, cached, started):
+                yield event
+            return
+
+    collector = StreamCollector()
+    async for event in astream_chat_completion(**request):
+        text = collector.add(event)
+        if cache_key and text is not None:
+            await cache_set(cache_key, text)
+        yield event
+
+@timed_upstream("openai", "call_jija_comp_gpt", failed=lambda result: str(result).startswith("Error calling JiJa simulation:"))
+async def acall_jija_comp_gpt(message, temperature=0.7, max_tokens=1000, coalesce=None):
+    """Async version of call_jija_comp_gpt."""
+    try:
+        logging.info(f"Calling JiJa Comp simulation with message: {message[:100]}...")
+        request = jija_request(message, temperature, max_tokens)
+
+        async def complete():
+            return completion_text(await acreate_chat_completion(**request))
+
+        if should_coalesce(temperature, coalesce):
+            return await jija_aflight.do(request_key(request), complete)
+        return await complete()
+    except Exception as e:
+        logging.error(f"Error calling JiJa simulation: {str(e)}")
+        return f"Error calling JiJa simulation: {str(e)}"
+
+async def astream_jija_comp_gpt(message, temperature=0.7, max_tokens=1000):
+    """Async version of stream_jija_comp_gpt."""
+    logging.info(f"Streaming JiJa Comp simulation with message: {message[:100]}...")
+    async for event in astream_chat_completion(**jija_request(message, temperature, max_tokens)):
+        yield event
+
+@timed_upstream("openai", "improve_prompt_field")
+async def aimprove_prompt_field(field, system_message="", user_message="", assistant_message="", model="gpt-3.5-turbo", coalesce=None):
+    """Async version of improve_prompt_field."""
+    request, original = improvement_request(field, system_message, user_message, assistant_message, model)
+
+    async def complete():
+        return parse_improvement(await acreate_chat_completion(**request), original)
+
+    try:
+        if should_coalesce(request["temperature"], coalesce):
+            return await improvement_aflight.do(request_key(request), complete)
+        return await complete()
+    except Exception as e:
+        logging.error(f"Error improving {field} message: {str(e)}")
+        return original
+
+async def aiter_prompt_improvements(fields, system_message="", user_message="", assistant_message="", model="gpt-3.5-turbo", coalesce=None):
+    """Improve several prompt fields concurrently, yielding (field, improved_text) as each finishes."""
+    async def improve(field):
+        return field, await aimprove_prompt_field(field, system_message, user_message, assistant_message, model, coalesce)
+
+    started = time.perf_counter()
+    for next_done in asyncio.as_completed([improve(field) for field in fields]):
+        yield await next_done
+    record_upstream("openai", "improve_prompt_fields", "ok", time.perf_counter() - started)
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import random
+import time
+
+from config import (
+    PROMPTLAYER_CONNECT_TIMEOUT, PROMPTLAYER_READ_TIMEOUT, PROMPTLAYER_MAX_RETRIES,
+    PROMPTLAYER_POOL_SIZE, PROMPTLAYER_MAX_CONCURRENCY, TEMPLATE_FETCH_MODE, CASSETTE_MODE, COALESCE_ENABLED
+)
+from utils.http_client import RETRY_STATUS_CODES
+from utils.metrics import record_upstream
+from utils.single_flight import AsyncSingleFlight
+from utils.structured_logging import log_event
+from utils.promptlayer_api import (
+    BASE_URL, WORKSPACE_ID, get_headers, template_request_payload, process_specific_template,
+    fetch_template_from_index, _try_strategy, lookup_template_cache, store_template_cache, get_template_directly,
+    parse_template_id, missing_id_template_details, fallback_template_details, error_template_details
+)
+
+logger = logging.getLogger(__name__)
+
+# Async counterparts of utils.promptlayer_api for the ASGI server.
+# They read and fill the same template cache as the sync functions.
+
+class AsyncHttpClient:
+    """
+    Shared httpx.AsyncClient with the same policy as PooledHttpClient: a sized
+    connection pool, connect/read timeouts, jittered exponential backoff on 429/5xx
+    and connection errors, and a cap on concurrent requests.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=15, max_retries=3, backoff_base=0.5,
+                 backoff_max=8.0, pool_size=10, max_concurrency=8):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        """Create the client on first use so it binds to the running event loop (and httpx loads lazily)."""
+        if self._client is None:
+            import httpx
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            transport = None
+            if CASSETTE_MODE != "off":
+                from utils.cassette import AsyncCassetteTransport
+                transport = AsyncCassetteTransport(httpx.AsyncHTTPTransport(limits=limits), "promptlayer")
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=limits,
+                transport=transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _backoff_delay(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header when present."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request through the pool. After the last retry the final response is
+        returned (so callers can still inspect the status) or the last error is raised.
+        """
+        import httpx
+
+        client = self._get_client()
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying (attempt {attempt + 1}/{self.max_retries})")
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"{method} {url} failed: {str(e)}, retrying (attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(self._backoff_delay(attempt, response))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+async_http_client = AsyncHttpClient(
+    connect_timeout=PROMPTLAYER_CONNECT_TIMEOUT,
+    read_timeout=PROMPTLAYER_READ_TIMEOUT,
+    max_retries=PROMPTLAYER_MAX_RETRIES,
+    pool_size=PROMPTLAYER_POOL_SIZE,
+    max_concurrency=PROMPTLAYER_MAX_CONCURRENCY
+)
+
+async def afetch_template_by_id(template_id, version=None):
+    """Approach 1: Direct template endpoint with POST."""
+    template_url = f"{BASE_URL}/prompt-templates/{template_id}"
+
+    template_response = await async_http_client.post(template_url, json=template_request_payload(version), headers=get_headers())
+
+    if template_response.status_code == 200:
+        template_data = template_response.json()
+        if "template" in template_data:
+            log_event(logger, "template.fetched", template_id=template_id, version=version, strategy="by_id",
+                      keys=list(template_data["template"].keys()))
+            return process_specific_template(template_data["template"])
+        log_event(logger, "template.missing_key", logging.WARNING, template_id=template_id,
+                  keys=list(template_data.keys()))
+    else:
+        log_event(logger, "template.fetch_failed", logging.WARNING, template_id=template_id, strategy="by_id",
+                  status=template_response.status_code, body=template_response.text)
+    return None
+
+async def afetch_template_from_workspace(template_id, version=None):
+    """Approach 2: Workspace prompt endpoint (always the latest version)."""
+    workspace_url = f"{BASE_URL}/workspace/{WORKSPACE_ID}/prompt/{template_id}"
+
+    workspace_response = await async_http_client.get(workspace_url, headers=get_headers())
+
+    if workspace_response.status_code == 200:
+        workspace_data = workspace_response.json()
+        log_event(logger, "template.fetched", template_id=template_id, strategy="workspace", keys=list(workspace_data.keys()))
+        return process_specific_template(workspace_data)
+    log_event(logger, "template.fetch_failed", logging.WARNING, template_id=template_id, strategy="workspace",
+              status=workspace_response.status_code)
+    return None
+
+async def _atry_strategy(strategy, template_id, version):
+    """
+    Run one async lookup strategy, turning errors into a miss. Its latency is recorded under
+    the sync strategy's name (afetch_template_by_id as fetch_template_by_id), and a race
+    loser that gets cancelled is recorded as "cancelled".
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await strategy(template_id, version)
+        outcome = "hit" if result else "miss"
+        return result
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        logger.error(f"{strategy.__name__} failed for template {template_id}: {str(e)}")
+        return None
+    finally:
+        record_upstream("promptlayer", strategy.__name__[1:], outcome, time.perf_counter() - started)
+
+async def aget_template_directly(template_id, version=None):
+    """
+    Async version of get_template_directly. In race mode the network strategies run as
+    concurrent tasks and the losers are cancelled as soon as one returns a template.
+    The cached index is only consulted (in a worker thread) once the network strategies miss.
+    """
+    strategies = [afetch_template_by_id] if version is not None else [afetch_template_by_id, afetch_template_from_workspace]
+    try:
+        result = None
+        if TEMPLATE_FETCH_MODE == "race":
+            pending = {asyncio.ensure_future(_atry_strategy(strategy, template_id, version)) for strategy in strategies}
+            try:
+                while pending and not result:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    result = next((task.result() for task in done if task.result()), None)
+            finally:
+                for task in pending:
+                    task.cancel()
+        else:
+            for strategy in strategies:
+                result = await _atry_strategy(strategy, template_id, version)
+                if result:
+                    break
+
+        if not result and version is None:
+            result = await asyncio.get_running_loop().run_in_executor(None, _try_strategy, fetch_template_from_index, template_id, version)
+        if not result:
+            logger.warning(f"All approaches failed for template {template_id}")
+        return result
+    except Exception as e:
+        logger.error(f"Error getting template directly: {str(e)}")
+        return None
+
+# Concurrent cache misses for the same key share one load
+template_aflight = AsyncSingleFlight("template_fetch")
+
+async def aget_cached_template(template_id, version=None):
+    """Async version of get_cached_template, sharing the same cache entries."""
+    key = ("details", template_id, version)
+    # Background refreshes of stale entries run in a thread with the sync loader
+    cached = lookup_template_cache(key, lambda: get_template_directly(template_id, version))
+    if cached is not None:
+        return cached
+
+    async def load():
+        value = await aget_template_directly(template_id, version)
+        store_template_cache(key, value)
+        return value
+
+    return await template_aflight.do(key, load) if COALESCE_ENABLED else await load()
+
+async def aget_template_details(template_name):
+    """Async version of get_template_details."""
+    try:
+        template_id = parse_template_id(template_name)
+        if not template_id:
+            return missing_id_template_details(template_name)
+
+        logger.info(f"Fetching template ID {template_id} directly from PromptLayer API")
+        direct_template = await aget_cached_template(template_id)
+        if direct_template:
+            logger.info(f"Successfully retrieved template ID {template_id}")
+            return direct_template
+
+        return fallback_template_details(template_id)
+    except Exception as e:
+        return error_template_details(e)
@@ -0,0 +1,425 @@
+import argparse
+import asyncio
+import csv
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from config import BATCH_CONCURRENCY, BATCH_DIR
+from utils.openai_api import generate_completion, call_jija_comp_gpt, GPT_MODEL
+from utils.promptlayer_api import get_cached_template
+from utils.structured_logging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Template fields that are not generation parameters
+MESSAGE_FIELDS = ['system_message', 'user_message', 'assistant_message']
+NON_PARAM_FIELDS = MESSAGE_FIELDS + ['model', 'temperature', 'max_tokens', 'version', 'id', 'Frequency Penalty', 'messages']
+
+# Generation settings of a JiJa batch job when none are given
+JIJA_DEFAULT_SETTINGS = {"temperature": 0.7, "max_tokens": 1000}
+
+def load_rows(path):
+    """
+    Yield input rows from a CSV (header row required), JSONL or plain text file
+    (one prompt per line, as {"prompt": line}), one dict per row.
+    Rows are streamed so large inputs are never held in memory at once.
+    """
+    if path.lower().endswith('.txt'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield {'prompt': line.rstrip('\n')}
+    elif path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield row
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def load_checkpoint(output_path):
+    """Return the row numbers already completed without error in an existing output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Ignore a line cut short by a crash
+            if not record.get('error'):
+                done.add(record['row'])
+    return done
+
+def fill_placeholders(text, values):
+    """Replace {key} / {{key}} / {{ key }} placeholders in text."""
+    for key, value in values.items():
+        for placeholder in ('{{ ' + key + ' }}', '{{' + key + '}}', '{' + key + '}'):
+            text = text.replace(placeholder, value)
+    return text
+
+def fill_messages(template_messages, overrides, values):
+    """
+    Fill a template's full conversation for one row. A system/user/assistant_message
+    column replaces the last message with that role; turn order is kept as is.
+    """
+    messages = [{"role": message["role"], "content": message["content"]} for message in template_messages]
+    for field, text in overrides.items():
+        role = field[:-len('_message')]
+        target = next((message for message in reversed(messages) if message["role"] == role), None)
+        if target is not None:
+            target["content"] = text
+        else:
+            messages.append({"role": role, "content": text})
+    if values:
+        for message in messages:
+            message["content"] = fill_placeholders(message["content"], values)
+    return messages
+
+def fill_template(template, row):
+    """
+    Build generate_completion arguments for one input row.
+    A user_message column replaces the template's user message; every other column
+    fills {column} / {{column}} / {{ column }} placeholders in the messages.
+    Templates with a full conversation are sent as a messages list.
+    """
+    params = {key: value for key, value in template.items() if key not in NON_PARAM_FIELDS}
+    overrides = {key: str(value) for key, value in row.items() if key in MESSAGE_FIELDS}
+    values = {key: str(value) for key, value in row.items() if key not in MESSAGE_FIELDS}
+
+    if template.get('messages'):
+        messages = {'messages': fill_messages(template['messages'], overrides, values)}
+    else:
+        messages = {field: template.get(field, '') or '' for field in MESSAGE_FIELDS}
+        messages.update(overrides)
+        messages = {field: fill_placeholders(text, values) for field, text in messages.items()}
+
+    return {
+        **messages,
+        'model': template.get('model', 'gpt-4o'),
+        'temperature': template.get('temperature', 0.7),
+        'max_tokens': template.get('max_tokens', 500),
+        **params
+    }
+
+class BatchJob:
+    """
+    One batch evaluation: run the previous and current versions of a template over
+    every input row and append one JSONL record per row to output_path.
+    Rows already in output_path are skipped, so re-running a job resumes it.
+    """
+
+    def __init__(self, template_id, input_path, output_path, previous_version=None, current_version=None,
+                 concurrency=BATCH_CONCURRENCY, job_id=None):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.template_id = template_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.previous_version = previous_version
+        self.current_version = current_version
+        self.concurrency = concurrency
+        self.status = {"state": "pending", "total": 0, "done": 0, "skipped": 0, "failed": 0,
+                       "started_at": None, "elapsed_seconds": None, "error": None}
+        self._status_lock = threading.Lock()
+
+    def _update(self, **changes):
+        with self._status_lock:
+            for key, value in changes.items():
+                if key in ('done', 'skipped', 'failed'):
+                    self.status[key] += value
+                else:
+                    self.status[key] = value
+
+    def get_status(self):
+        """Return job progress, including elapsed time while running."""
+        with self._status_lock:
+            status = dict(self.status)
+        if status["state"] == "running" and status["started_at"]:
+            status["elapsed_seconds"] = round(time.time() - status["started_at"], 2)
+        return {"job_id": self.job_id, "template_id": self.template_id, "output_path": self.output_path, **status}
+
+    def _resolve_versions(self):
+        """Load both template versions. Previous defaults to the version before current."""
+        current = get_cached_template(self.template_id, self.current_version)
+        if not current:
+            raise ValueError(f"Could not load template {self.template_id} version {self.current_version or 'latest'}")
+        previous_version = self.previous_version
+        if previous_version is None:
+            previous_version = max(1, int(current.get('version', 1)) - 1)
+        previous = get_cached_template(self.template_id, previous_version)
+        if not previous:
+            raise ValueError(f"Could not load template {self.template_id} version {previous_version}")
+        return previous, current
+
+    async def _run_side(self, loop, template, row):
+        # Per-model request/token limits are enforced inside generate_completion by the shared rate limiter
+        arguments = fill_template(template, row)
+        started = time.perf_counter()
+        response = await loop.run_in_executor(None, lambda: generate_completion(**arguments))
+        return {
+            "version": template.get('version'),
+            "model": arguments['model'],
+            "response": response,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": isinstance(response, str) and response.startswith("Error generating response:")
+        }
+
+    def _prepare(self):
+        """Load what every row needs before the first row runs."""
+        self._previous, self._current = self._resolve_versions()
+
+    async def _run_row(self, loop, row):
+        """Run one input row. Returns (fields for the output record, whether the row failed)."""
+        previous_result, current_result = await asyncio.gather(
+            self._run_side(loop, self._previous, row),
+            self._run_side(loop, self._current, row)
+        )
+        return {"previous": previous_result, "current": current_result}, previous_result["error"] or current_result["error"]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self._prepare()
+        done_rows = load_checkpoint(self.output_path)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        write_lock = asyncio.Lock()
+
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.output_path, 'a', encoding='utf-8') as output:
+            async def run_row(row_number, row):
+                async with semaphore:
+                    try:
+                        results, failed = await self._run_row(loop, row)
+                    except Exception as e:
+                        # A bad row is recorded as failed instead of stopping the whole job
+                        results, failed = {"message": str(e)}, True
+                record = {"row": row_number, "inputs": row, **results, "error": failed}
+                async with write_lock:
+                    output.write(json.dumps(record, separators=(',', ':')) + '\n')
+                    output.flush()
+                self._update(done=1, failed=1 if failed else 0)
+
+            # Feed rows through a bounded set of pending tasks so huge inputs aren't all scheduled at once
+            pending = set()
+            for row_number, row in enumerate(load_rows(self.input_path)):
+                self._update(total=row_number + 1)
+                if row_number in done_rows:
+                    self._update(skipped=1)
+                    continue
+                pending.add(asyncio.ensure_future(run_row(row_number, row)))
+                if len(pending) >= self.concurrency * 2:
+                    _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if pending:
+                await asyncio.gather(*pending)
+
+    def _finish(self):
+        """Called after every row has run."""
+
+    def run(self):
+        """Run the job to completion in the calling thread."""
+        started = time.perf_counter()
+        self._update(state="running", started_at=time.time())
+        logger.info(f"Batch job {self.job_id} started" + (f" for template {self.template_id}" if self.template_id else ""))
+        try:
+            asyncio.run(self._run())
+            self._finish()
+            self._update(state="finished")
+        except Exception as e:
+            logger.error(f"Batch job {self.job_id} failed: {str(e)}")
+            self._update(state="failed", error=str(e))
+        self._update(elapsed_seconds=round(time.perf_counter() - started, 2))
+        status = self.get_status()
+        logger.info(f"Batch job {self.job_id} {status['state']}: {status['done']} rows run, " +
+                    f"{status['skipped']} resumed, {status['failed']} failed in {status['elapsed_seconds']}s")
+        return status
+
+def prompt_from_row(row):
+    """The prompt of a JiJa batch row: its prompt column, else its user_message column."""
+    prompt = row.get('prompt') or row.get('user_message') or ''
+    if not str(prompt).strip():
+        raise ValueError("Row has no prompt or user_message column")
+    return str(prompt)
+
+def iter_latest_records(output_path):
+    """
+    Yield the last record written for each row of a results file, in row order.
+    Only file offsets are kept in memory, so large results stay cheap to read back.
+    """
+    offsets = {}
+    with open(output_path, 'rb') as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Ignore a line cut short by a crash
+            # A successful run of a row wins over an earlier (or later) failed one
+            if not record.get('error') or record['row'] not in offsets or offsets[record['row']][1]:
+                offsets[record['row']] = (offset, bool(record.get('error')))
+        for row in sorted(offsets):
+            f.seek(offsets[row][0])
+            yield json.loads(f.readline())
+
+class JijaBatchJob(BatchJob):
+    """
+    Batch JiJa comparison: for every prompt in the input, generate the JiJa simulation and a
+    plain ChatGPT response at the same time. Results are appended to output_path like any
+    batch job (so re-running resumes it), and a single consolidated markdown report is
+    written to report_path when the job finishes. The generation settings are saved next to
+    the results, and a resumed job keeps the ones it started with.
+    """
+
+    def __init__(self, input_path, output_path, report_path=None, temperature=None, max_tokens=None,
+                 concurrency=BATCH_CONCURRENCY, job_id=None):
+        super().__init__(None, input_path, output_path, concurrency=concurrency, job_id=job_id)
+        self.report_path = report_path or os.path.splitext(output_path)[0] + '_report.md'
+        self.settings_path = os.path.splitext(output_path)[0] + '_settings.json'
+        requested = {"temperature": temperature, "max_tokens": max_tokens}
+        settings = self._load_settings()
+        if settings is None:
+            settings = {name: default if requested[name] is None else requested[name]
+                        for name, default in JIJA_DEFAULT_SETTINGS.items()}
+        elif any(value is not None and value != settings.get(name) for name, value in requested.items()):
+            logger.warning(f"JiJa batch job {self.job_id} resumed with its original settings {settings}")
+        self.temperature = float(settings["temperature"])
+        self.max_tokens = int(settings["max_tokens"])
+
+    def _load_settings(self):
+        """The settings saved by an earlier run of this job, or None for a new job."""
+        if not os.path.exists(self.settings_path):
+            return None
+        with open(self.settings_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_status(self):
+        return {**super().get_status(), "kind": "jija", "report_path": self.report_path,
+                "temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    def _prepare(self):
+        if not os.path.exists(self.settings_path):
+            directory = os.path.dirname(self.settings_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.settings_path, 'w', encoding='utf-8') as f:
+                json.dump({"temperature": self.temperature, "max_tokens": self.max_tokens}, f)
+
+    async def _call(self, loop, function, **arguments):
+        started = time.perf_counter()
+        response = await loop.run_in_executor(None, lambda: function(**arguments))
+        return {
+            "response": response,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": isinstance(response, str) and response.startswith(("Error generating response:",
+                                                                        "Error calling JiJa simulation:"))
+        }
+
+    async def _run_row(self, loop, row):
+        prompt = prompt_from_row(row)
+        jija_result, chatgpt_result = await asyncio.gather(
+            self._call(loop, call_jija_comp_gpt, message=prompt,
+                       temperature=self.temperature, max_tokens=self.max_tokens),
+            self._call(loop, generate_completion, user_message=prompt, model=GPT_MODEL,
+                       temperature=self.temperature, max_tokens=self.max_tokens)
+        )
+        return {"jija": jija_result, "chatgpt": chatgpt_result}, jija_result["error"] or chatgpt_result["error"]
+
+    def _finish(self):
+        self.write_report()
+
+    def write_report(self):
+        """Write the consolidated comparison report from the results file. Returns its path."""
+        prompts = failed = 0
+        temporary_path = f"{self.report_path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as report:
+            report.write("# JiJa Batch Comparison\n\n")
+            report.write(f"## Date\n{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            report.write(f"## Settings\nModel: {GPT_MODEL}, temperature: {self.temperature}, max tokens: {self.max_tokens}\n\n")
+            if os.path.exists(self.output_path):
+                for record in iter_latest_records(self.output_path):
+                    prompts += 1
+                    failed += 1 if record.get('error') else 0
+                    inputs = record.get('inputs') or {}
+                    prompt = inputs.get('prompt') or inputs.get('user_message') or ''
+                    report.write(f"## Prompt {record['row'] + 1}\n```\n{prompt}\n```\n\n")
+                    for key, title in (("chatgpt", "ChatGPT"), ("jija", "JiJa")):
+                        result = record.get(key) or {}
+                        report.write(f"### {title} ({result.get('elapsed_ms', 0)} ms)\n{result.get('response', '')}\n\n")
+                    report.write("---\n\n")
+            report.write(f"## Summary\n{prompts} prompts compared, {failed} with errors\n")
+        os.replace(temporary_path, self.report_path)
+        logger.info(f"JiJa batch report written to {self.report_path}")
+        return self.report_path
+
+# Jobs started from the web app, by job id
+_jobs = {}
+
+def start_batch_job(template_id, input_path, output_path=None, previous_version=None, current_version=None,
+                    concurrency=BATCH_CONCURRENCY, job_id=None):
+    """Create a BatchJob and run it in a background thread."""
+    job_id = job_id or uuid.uuid4().hex[:12]
+    output_path = output_path or os.path.join(BATCH_DIR, f"{job_id}.jsonl")
+    job = BatchJob(template_id, input_path, output_path, previous_version, current_version, concurrency, job_id)
+    _jobs[job.job_id] = job
+    threading.Thread(target=job.run, name=f"batch-{job.job_id}", daemon=True).start()
+    return job
+
+def start_jija_batch_job(input_path, temperature=None, max_tokens=None, concurrency=BATCH_CONCURRENCY, job_id=None):
+    """
+    Create a JijaBatchJob and run it in a background thread. Passing the job_id of an
+    earlier job resumes it: its output file and generation settings are reused and
+    completed prompts are skipped.
+    """
+    job_id = job_id or uuid.uuid4().hex[:12]
+    job = JijaBatchJob(input_path, os.path.join(BATCH_DIR, f"{job_id}.jsonl"), temperature=temperature,
+                       max_tokens=max_tokens, concurrency=concurrency, job_id=job_id)
+    _jobs[job.job_id] = job
+    threading.Thread(target=job.run, name=f"batch-{job.job_id}", daemon=True).start()
+    return job
+
+def get_batch_job(job_id):
+    return _jobs.get(job_id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a PromptLayer template's previous and current versions "
+                                                 "(or JiJa and ChatGPT) over a dataset.")
+    parser.add_argument("--template-id", type=int, default=None, help="PromptLayer template ID")
+    parser.add_argument("--jija", action="store_true", help="Compare JiJa with plain ChatGPT for every prompt instead")
+    parser.add_argument("--input", required=True, help="CSV, JSONL or text file (one prompt per line) of input rows")
+    parser.add_argument("--output", required=True, help="JSONL results file (re-run with the same file to resume)")
+    parser.add_argument("--previous-version", type=int, default=None, help="Defaults to the version before current")
+    parser.add_argument("--current-version", type=int, default=None, help="Defaults to the latest version")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Rows run at the same time")
+    parser.add_argument("--report", default=None, help="JiJa report path (defaults to <output>_report.md)")
+    parser.add_argument("--temperature", type=float, default=None,
+                        help="JiJa comparison temperature (default 0.7; a resumed job keeps its own)")
+    parser.add_argument("--max-tokens", type=int, default=None,
+                        help="JiJa comparison max tokens (default 1000; a resumed job keeps its own)")
+    args = parser.parse_args()
+    if not args.jija and args.template_id is None:
+        parser.error("--template-id is required unless --jija is given")
+
+    configure_logging()
+    if args.jija:
+        job = JijaBatchJob(args.input, args.output, args.report, args.temperature, args.max_tokens, args.concurrency)
+    else:
+        job = BatchJob(args.template_id, args.input, args.output, args.previous_version,
+                       args.current_version, args.concurrency)
+    status = job.run()
+    print(json.dumps(status, indent=2))
+
+if __name__ == "__main__":
+    main()
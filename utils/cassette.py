@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+"""
+Record and replay of upstream HTTP traffic (OpenAI and PromptLayer) for offline profiling.
+
+With CASSETTE_MODE=record every request the app sends upstream is stored in CASSETTE_PATH
+together with its response, the time the headers arrived and the time and size of every body
+chunk as it came off the wire, so streamed completions keep their chunk boundaries.
+With CASSETTE_MODE=replay the same requests are answered from the file, without the network,
+at the recorded pace divided by CASSETTE_SPEED (0 replays without any waiting).
+
+The layer sits under the clients: an httpx transport under the OpenAI SDK and the async
+PromptLayer client, and a requests adapter under PooledHttpClient, so retries, rate limiting,
+timeouts and metrics above it behave as they do live.
+
+To summarise a cassette:
+
+    python -m utils.cassette [path]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from config import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_SPEED
+from utils.structured_logging import log_event
+
+logger = logging.getLogger(__name__)
+
+# Response headers that are not stored (they identify the account or the session, not the response)
+SKIPPED_HEADERS = {"set-cookie", "openai-organization", "x-request-id", "cf-ray"}
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request that is not in the cassette."""
+
+def request_key(method, url, body):
+    """
+    Identify a request by method, path, query and body. The host is left out so a cassette
+    recorded against one base URL replays against another, and headers are left out so API
+    keys never reach the file. JSON bodies are compared by content, not key order.
+    """
+    parts = urlsplit(url)
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    body = body or b""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        pass
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    return hashlib.sha256(method.upper().encode("utf-8") + b" " + target.encode("utf-8") + b"\n" + body).hexdigest()
+
+class Recording:
+    """One stored response: status, headers, body chunks with their offsets from the request start."""
+
+    __slots__ = ("status", "reason", "headers", "chunks", "headers_at", "duration")
+
+    def __init__(self, status, reason, headers, chunks, headers_at, duration):
+        self.status = status
+        self.reason = reason
+        self.headers = headers  # [(name, value)]
+        self.chunks = chunks  # [(offset_seconds, bytes)]
+        self.headers_at = headers_at
+        self.duration = duration
+
+    @property
+    def body(self):
+        return b"".join(chunk for _, chunk in self.chunks)
+
+class CassetteStore:
+    """
+    Recorded interactions in SQLite, indexed by request key. Bodies are stored zlib-compressed
+    in one blob with the chunk offsets and sizes alongside. A request recorded several times
+    replays its recordings in order, then keeps returning the last one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._positions = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    def _connect(self):
+        """Open the cassette on first use."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS interactions ("
+                "id INTEGER PRIMARY KEY, key TEXT NOT NULL, upstream TEXT NOT NULL, "
+                "method TEXT NOT NULL, url TEXT NOT NULL, status INTEGER NOT NULL, reason TEXT, "
+                "headers TEXT NOT NULL, body BLOB NOT NULL, chunks TEXT NOT NULL, "
+                "headers_at REAL NOT NULL, duration REAL NOT NULL, recorded_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_interactions_key ON interactions (key, id)")
+            self._db.commit()
+        return self._db
+
+    def record(self, key, upstream, method, url, recording):
+        """Append a recording for key."""
+        headers = [(name, value) for name, value in recording.headers if name.lower() not in SKIPPED_HEADERS]
+        chunks = [[round(offset, 6), len(chunk)] for offset, chunk in recording.chunks]
+        with self._lock:
+            try:
+                db = self._connect()
+                db.execute(
+                    "INSERT INTO interactions (key, upstream, method, url, status, reason, headers, body, chunks, "
+                    "headers_at, duration, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, upstream, method, url, recording.status, recording.reason, json.dumps(headers),
+                     zlib.compress(recording.body), json.dumps(chunks), recording.headers_at,
+                     recording.duration, time.time())
+                )
+                db.commit()
+                self.stats["recorded"] += 1
+            except sqlite3.Error as e:
+                logger.error(f"Cassette write failed: {str(e)}")
+
+    def next_recording(self, key):
+        """The next recording for key in replay order, or None."""
+        with self._lock:
+            db = self._connect()
+            position = self._positions.get(key, 0)
+            row = db.execute(
+                "SELECT status, reason, headers, body, chunks, headers_at, duration FROM interactions "
+                "WHERE key = ? ORDER BY id LIMIT 1 OFFSET ?", (key, position)
+            ).fetchone()
+            if row is None and position:
+                row = db.execute(
+                    "SELECT status, reason, headers, body, chunks, headers_at, duration FROM interactions "
+                    "WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)
+                ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._positions[key] = position + 1
+            self.stats["replayed"] += 1
+
+        status, reason, headers, body, chunk_sizes, headers_at, duration = row
+        body = zlib.decompress(body)
+        chunks, start = [], 0
+        for offset, size in json.loads(chunk_sizes):
+            chunks.append((offset, body[start:start + size]))
+            start += size
+        return Recording(status, reason, [tuple(pair) for pair in json.loads(headers)], chunks, headers_at, duration)
+
+    def rewind(self):
+        """Replay every request from its first recording again."""
+        with self._lock:
+            self._positions.clear()
+
+    def summary(self):
+        """Interactions, statuses and recorded time per upstream, method and path."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT upstream, method, url, status, duration, length(body) FROM interactions ORDER BY id"
+            ).fetchall()
+        routes = defaultdict(lambda: {"count": 0, "errors": 0, "seconds": 0.0, "compressed_bytes": 0})
+        for upstream, method, url, status, duration, size in rows:
+            route = routes[(upstream, method, urlsplit(url).path)]
+            route["count"] += 1
+            route["errors"] += status >= 400
+            route["seconds"] += duration
+            route["compressed_bytes"] += size
+        return routes
+
+cassette_store = CassetteStore(CASSETTE_PATH)
+
+def _missing(upstream, method, url):
+    log_event(logger, "cassette.miss", logging.WARNING, upstream=upstream, method=method, url=url)
+    return CassetteMiss(f"No recording of {method} {url} in {cassette_store.path}")
+
+def _replay_delay(started, offset):
+    """Seconds to wait so something recorded offset seconds after the request starts replays on time."""
+    if CASSETTE_SPEED <= 0:
+        return 0.0
+    return started + offset / CASSETTE_SPEED - time.perf_counter()
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Pass a response body through, noting when each chunk arrived, and store it on close."""
+
+    def __init__(self, stream, started, on_close):
+        self._stream = stream
+        self._started = started
+        self._on_close = on_close
+        self._chunks = []
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._chunks.append((time.perf_counter() - self._started, chunk))
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+        self._on_close(self._chunks)
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, started, on_close):
+        self._stream = stream
+        self._started = started
+        self._on_close = on_close
+        self._chunks = []
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._chunks.append((time.perf_counter() - self._started, chunk))
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+        self._on_close(self._chunks)
+
+class _ReplayStream(httpx.SyncByteStream):
+    """Yield recorded chunks at their recorded offsets (scaled by CASSETTE_SPEED)."""
+
+    def __init__(self, chunks, started):
+        self._chunks = chunks
+        self._started = started
+
+    def __iter__(self):
+        for offset, chunk in self._chunks:
+            delay = _replay_delay(self._started, offset)
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks, started):
+        self._chunks = chunks
+        self._started = started
+
+    async def __aiter__(self):
+        for offset, chunk in self._chunks:
+            delay = _replay_delay(self._started, offset)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
+
+def _store_on_close(upstream, request, key, response, started, headers_at):
+    """Callback storing a recorded httpx response once its body has been read."""
+    def store(chunks):
+        recording = Recording(response.status_code, response.reason_phrase, response.headers.multi_items(),
+                              chunks, headers_at, time.perf_counter() - started)
+        cassette_store.record(key, upstream, request.method, str(request.url), recording)
+    return store
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx transport recording through, or replaying instead of, the wrapped transport."""
+
+    def __init__(self, transport, upstream, mode=CASSETTE_MODE):
+        self.transport = transport
+        self.upstream = upstream
+        self.mode = mode
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        key = request_key(request.method, str(request.url), request.read())
+        if self.mode == "replay":
+            recording = cassette_store.next_recording(key)
+            if recording is None:
+                raise _missing(self.upstream, request.method, str(request.url))
+            delay = _replay_delay(started, recording.headers_at)
+            if delay > 0:
+                time.sleep(delay)
+            return httpx.Response(recording.status, headers=recording.headers,
+                                  stream=_ReplayStream(recording.chunks, started))
+
+        response = self.transport.handle_request(request)
+        headers_at = time.perf_counter() - started
+        on_close = _store_on_close(self.upstream, request, key, response, started, headers_at)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_RecordingStream(response.stream, started, on_close),
+                              extensions=response.extensions)
+
+    def close(self):
+        self.transport.close()
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of CassetteTransport."""
+
+    def __init__(self, transport, upstream, mode=CASSETTE_MODE):
+        self.transport = transport
+        self.upstream = upstream
+        self.mode = mode
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        key = request_key(request.method, str(request.url), await request.aread())
+        if self.mode == "replay":
+            recording = cassette_store.next_recording(key)
+            if recording is None:
+                raise _missing(self.upstream, request.method, str(request.url))
+            delay = _replay_delay(started, recording.headers_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return httpx.Response(recording.status, headers=recording.headers,
+                                  stream=_AsyncReplayStream(recording.chunks, started))
+
+        response = await self.transport.handle_async_request(request)
+        headers_at = time.perf_counter() - started
+        on_close = _store_on_close(self.upstream, request, key, response, started, headers_at)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_AsyncRecordingStream(response.stream, started, on_close),
+                              extensions=response.extensions)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class CassetteAdapter(HTTPAdapter):
+    """requests adapter recording through, or replaying instead of, the wrapped adapter."""
+
+    def __init__(self, adapter, upstream, mode=CASSETTE_MODE):
+        super().__init__()
+        self.adapter = adapter
+        self.upstream = upstream
+        self.mode = mode
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        key = request_key(request.method, request.url, request.body)
+        if self.mode == "replay":
+            recording = cassette_store.next_recording(key)
+            if recording is None:
+                raise _missing(self.upstream, request.method, request.url)
+            delay = _replay_delay(started, recording.duration)
+            if delay > 0:
+                time.sleep(delay)
+            response = requests.Response()
+            response.status_code = recording.status
+            response.reason = recording.reason
+            response.headers = CaseInsensitiveDict(recording.headers)
+            response.encoding = get_encoding_from_headers(response.headers)
+            response._content = recording.body
+            response._content_consumed = True
+            response.url = request.url
+            response.request = request
+            response.connection = self
+            return response
+
+        response = self.adapter.send(request, **kwargs)
+        headers_at = time.perf_counter() - started
+        # PromptLayer responses are small JSON documents: read the whole body here to time it
+        content = response.content
+        duration = time.perf_counter() - started
+        recording = Recording(response.status_code, response.reason, list(response.headers.items()),
+                              [(duration, content)], headers_at, duration)
+        cassette_store.record(key, self.upstream, request.method, request.url, recording)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+def install_requests_cassette(session, upstream):
+    """Wrap every adapter mounted on a requests.Session."""
+    for prefix, adapter in list(session.adapters.items()):
+        session.mount(prefix, CassetteAdapter(adapter, upstream))
+
+def openai_http_client(asynchronous=False):
+    """An httpx client for the OpenAI SDK with the SDK's default timeout and pool limits, behind the cassette."""
+    from openai._constants import DEFAULT_LIMITS, DEFAULT_TIMEOUT
+
+    if asynchronous:
+        return httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, transport=AsyncCassetteTransport(
+            httpx.AsyncHTTPTransport(limits=DEFAULT_LIMITS), "openai"))
+    return httpx.Client(timeout=DEFAULT_TIMEOUT, transport=CassetteTransport(
+        httpx.HTTPTransport(limits=DEFAULT_LIMITS), "openai"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a recorded cassette of upstream API traffic.")
+    parser.add_argument("path", nargs="?", default=CASSETTE_PATH)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    routes = CassetteStore(args.path).summary()
+    print(f"{'upstream':<12} {'method':<6} {'path':<40} {'count':>6} {'errors':>6} {'seconds':>9} {'kb':>8}")
+    for (upstream, method, path), route in sorted(routes.items()):
+        print(f"{upstream:<12} {method:<6} {path[:40]:<40} {route['count']:>6} {route['errors']:>6} "
+              f"{route['seconds']:>9.2f} {route['compressed_bytes'] / 1024:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    COMPLETION_CACHE_ENABLED,
+    COMPLETION_CACHE_PATH,
+    COMPLETION_CACHE_TTL,
+    COMPLETION_CACHE_MEMORY_ITEMS,
+    COMPLETION_CACHE_DISK_ITEMS,
+)
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(model, messages, temperature, max_tokens, **kwargs):
+    """
+    Build a content-addressed key for a completion request.
+    Every field that can change the output goes into the hash.
+    """
+    request_body = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "kwargs": kwargs
+    }
+    canonical = json.dumps(request_body, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def should_cache(temperature, use_cache=None):
+    """
+    Whether a generation is read from and written to the completion cache. An explicit
+    use_cache from the caller wins; otherwise only deterministic requests (temperature 0)
+    are cached, so sampled ones return a fresh response each time.
+    """
+    if not COMPLETION_CACHE_ENABLED:
+        return False
+    if use_cache is not None:
+        return bool(use_cache)
+    return not temperature
+
+class CompletionCache:
+    """
+    Two-tier completion cache: an in-memory LRU in front of a SQLite file.
+    Entries expire after ttl seconds; each tier evicts its least recently used
+    entries once it holds more than its size limit.
+    """
+
+    def __init__(self, path, ttl=86400, memory_items=256, disk_items=5000):
+        self.path = path
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _connect(self):
+        """Open the SQLite tier on first use."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_completions_last_access ON completions (last_access)")
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key, value, expires_at):
+        """Put an entry in the memory tier, evicting the least recently used if full."""
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, key):
+        """Return the cached completion for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            try:
+                db = self._connect()
+                row = db.execute("SELECT value, expires_at FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, expires_at = row
+                    if expires_at > now:
+                        db.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+                        db.commit()
+                        self._remember(key, value, expires_at)
+                        self.stats["disk_hits"] += 1
+                        return value
+                    db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Completion cache read failed: {str(e)}")
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """Store a completion in both tiers."""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self.stats["writes"] += 1
+            try:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                # Drop expired rows, then trim the least recently used rows over the size limit
+                db.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+                overflow = db.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - self.disk_items
+                if overflow > 0:
+                    db.execute(
+                        "DELETE FROM completions WHERE key IN "
+                        "(SELECT key FROM completions ORDER BY last_access ASC LIMIT ?)",
+                        (overflow,)
+                    )
+                    self.stats["evictions"] += overflow
+                db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Completion cache write failed: {str(e)}")
+
+    def clear(self):
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            try:
+                db = self._connect()
+                db.execute("DELETE FROM completions")
+                db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Completion cache clear failed: {str(e)}")
+
+    def get_stats(self):
+        """Return hit/miss counters and tier sizes."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+            try:
+                stats["disk_items"] = self._connect().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            except sqlite3.Error:
+                stats["disk_items"] = None
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["enabled"] = COMPLETION_CACHE_ENABLED
+        return stats
+
+# Shared cache used by utils.openai_api
+completion_cache = CompletionCache(
+    COMPLETION_CACHE_PATH,
+    ttl=COMPLETION_CACHE_TTL,
+    memory_items=COMPLETION_CACHE_MEMORY_ITEMS,
+    disk_items=COMPLETION_CACHE_DISK_ITEMS
+)
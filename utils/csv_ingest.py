@@ -0,0 +1,224 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from config import CSV_UPLOAD_CACHE_PATH, CSV_UPLOAD_CACHE_ITEMS, CSV_UPLOAD_MAX_FIELD_CHARS
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the upload at a time while it is hashed and spooled to disk
+CHUNK_SIZE = 1024 * 1024
+
+# Parsed rows written to SQLite per transaction, and read back per query when a whole upload is rendered
+INSERT_BATCH_SIZE = 1000
+READ_BATCH_SIZE = 1000
+
+# Separator between values in the rendered markdown (matches the JiJa Chat panel)
+VALUE_SEPARATOR = "\n\n---\n\n"
+
+# A single chat message can be far longer than the csv module's default field limit
+csv.field_size_limit(CSV_UPLOAD_MAX_FIELD_CHARS)
+
+class ChatCsvStore:
+    """
+    Parsed JiJa chat exports, keyed by the SHA-256 of the uploaded file and stored in SQLite.
+    Each upload keeps its sender/value rows so any page can be read back without re-parsing.
+    Once more than max_uploads are stored, the least recently used are dropped.
+    """
+
+    def __init__(self, path, max_uploads=50):
+        self.path = path
+        self.max_uploads = max_uploads
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        """Open the SQLite file on first use."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "upload_id TEXT PRIMARY KEY, filename TEXT, rows INTEGER NOT NULL, bytes INTEGER NOT NULL, "
+                "sender TEXT, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS upload_rows ("
+                "upload_id TEXT NOT NULL, row INTEGER NOT NULL, sender TEXT, value TEXT, "
+                "PRIMARY KEY (upload_id, row))"
+            )
+            self._db.commit()
+        return self._db
+
+    def get_upload(self, upload_id):
+        """Return an upload's summary (and mark it used), or None if it isn't stored."""
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT upload_id, filename, rows, bytes, sender, created_at FROM uploads WHERE upload_id = ?",
+                (upload_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE uploads SET last_access = ? WHERE upload_id = ?", (time.time(), upload_id))
+            db.commit()
+        return dict(zip(("upload_id", "filename", "rows", "bytes", "sender", "created_at"), row))
+
+    def get_rows(self, upload_id, offset, limit):
+        """Return rows [offset, offset + limit) of an upload as {"sender", "value"} dicts."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT sender, value FROM upload_rows WHERE upload_id = ? AND row >= ? ORDER BY row LIMIT ?",
+                (upload_id, offset, limit)
+            ).fetchall()
+        return [{"sender": sender, "value": value} for sender, value in rows]
+
+    def add_upload(self, upload_id, filename, size, rows):
+        """
+        Store an upload from an iterator of (sender, value) rows, writing them in batches
+        so the parsed file is never held in memory. Returns the stored summary.
+        """
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM upload_rows WHERE upload_id = ?", (upload_id,))
+            count = 0
+            first_sender = None
+            batch = []
+            try:
+                for sender, value in rows:
+                    if first_sender is None:
+                        first_sender = sender
+                    batch.append((upload_id, count, sender, value))
+                    count += 1
+                    if len(batch) >= INSERT_BATCH_SIZE:
+                        db.executemany("INSERT INTO upload_rows (upload_id, row, sender, value) VALUES (?, ?, ?, ?)", batch)
+                        batch = []
+                if batch:
+                    db.executemany("INSERT INTO upload_rows (upload_id, row, sender, value) VALUES (?, ?, ?, ?)", batch)
+            except Exception:
+                db.rollback()  # Don't leave a half-parsed upload behind
+                raise
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO uploads (upload_id, filename, rows, bytes, sender, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, filename, count, size, first_sender, now, now)
+            )
+            self._evict(db)
+            db.commit()
+        return {"upload_id": upload_id, "filename": filename, "rows": count, "bytes": size,
+                "sender": first_sender, "created_at": now}
+
+    def _evict(self, db):
+        """Drop the least recently used uploads over the size limit."""
+        stale = db.execute(
+            "SELECT upload_id FROM uploads ORDER BY last_access DESC LIMIT -1 OFFSET ?", (self.max_uploads,)
+        ).fetchall()
+        for (upload_id,) in stale:
+            db.execute("DELETE FROM upload_rows WHERE upload_id = ?", (upload_id,))
+            db.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+        if stale:
+            logger.info(f"Evicted {len(stale)} cached CSV uploads")
+
+# Shared store used by the JiJa upload routes
+chat_csv_store = ChatCsvStore(CSV_UPLOAD_CACHE_PATH, max_uploads=CSV_UPLOAD_CACHE_ITEMS)
+
+def iter_chat_rows(binary_file):
+    """
+    Stream (sender, value) pairs from a CSV file with "sender" and "value" columns (any case).
+    Quoted fields may span lines. Senders are trimmed; values are kept exactly as written.
+
+    Raises:
+        ValueError: if the header has no sender or value column
+    """
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", errors="replace", newline="")
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if not header:
+        raise ValueError("CSV file needs at least a header row and one data row")
+    columns = [column.strip().strip('"').lower() for column in header]
+    if "sender" not in columns or "value" not in columns:
+        raise ValueError('CSV must contain "sender" and "value" columns')
+    sender_index = columns.index("sender")
+    value_index = columns.index("value")
+    needed = max(sender_index, value_index)
+
+    for fields in reader:
+        if len(fields) <= needed:
+            continue  # Skip blank and short rows
+        yield fields[sender_index].strip(), fields[value_index]
+
+def ingest_chat_csv(stream, filename=None):
+    """
+    Hash and parse an uploaded chat export. The upload is read in chunks and spooled to a
+    temporary file, so memory use doesn't grow with the file size. A file that was uploaded
+    before is recognised by its hash and not parsed again.
+
+    Returns:
+        dict: The upload summary, with "cached" and "elapsed_ms"
+    """
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.TemporaryFile() as spool:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+        upload_id = digest.hexdigest()
+
+        summary = chat_csv_store.get_upload(upload_id)
+        cached = summary is not None
+        if not cached:
+            spool.seek(0)
+            summary = chat_csv_store.add_upload(upload_id, filename, size, iter_chat_rows(spool))
+            logger.info(f"Parsed CSV upload {upload_id[:12]} ({size} bytes, {summary['rows']} rows)")
+
+    summary["cached"] = cached
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return summary
+
+def get_chat_page(upload_id, page=1, page_size=50):
+    """
+    One page of a parsed upload: its rows and the page rendered as markdown.
+    Returns None if the upload isn't stored.
+    """
+    summary = chat_csv_store.get_upload(upload_id)
+    if summary is None:
+        return None
+    page = max(1, page)
+    items = chat_csv_store.get_rows(upload_id, (page - 1) * page_size, page_size)
+    return {
+        **summary,
+        "page": page,
+        "page_size": page_size,
+        "pages": max(1, -(-summary["rows"] // page_size)),
+        "items": items,
+        "markdown": VALUE_SEPARATOR.join(item["value"] for item in items)
+    }
+
+def iter_chat_markdown(upload_id):
+    """
+    Yield every value of a parsed upload, separated as in the JiJa Chat panel, reading
+    READ_BATCH_SIZE rows at a time so the whole upload is never held in memory.
+    Yields nothing if the upload isn't stored.
+    """
+    offset = 0
+    while True:
+        items = chat_csv_store.get_rows(upload_id, offset, READ_BATCH_SIZE)
+        for number, item in enumerate(items, offset):
+            yield (VALUE_SEPARATOR if number else "") + item["value"]
+        if len(items) < READ_BATCH_SIZE:
+            return
+        offset += len(items)
@@ -0,0 +1,221 @@
+import re
+import time
+
+# How texts are split before diffing
+TOKEN_PATTERNS = {
+    # Whitespace-separated words, keeping the whitespace runs as their own tokens
+    "word": re.compile(r"\s+|\S+"),
+    # GPT-style pre-tokenization: contractions, words and numbers with their leading space, punctuation runs
+    "token": re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d+| ?[^\s\w]+|\s+(?!\S)|\s+|_+"),
+}
+GRANULARITIES = ("line", "word", "token")
+
+# Gaps with no common unique token fall back to Myers; past this many edits the gap is reported as replaced
+MYERS_MAX_EDITS = 400
+
+# Patience recursion depth before gaps are handed straight to Myers
+PATIENCE_MAX_DEPTH = 64
+
+def tokenize(text, granularity="word"):
+    """Split text into tokens that join back into exactly the original text."""
+    if granularity == "line":
+        return text.splitlines(keepends=True)
+    if granularity not in TOKEN_PATTERNS:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    return TOKEN_PATTERNS[granularity].findall(text)
+
+def _emit(ops, tag, i1, i2, j1, j2):
+    """Append an opcode, merging it into the previous one when they are the same kind."""
+    if i1 == i2 and j1 == j2:
+        return
+    if ops and ops[-1][0] == tag:
+        ops[-1][2] = i2
+        ops[-1][4] = j2
+    else:
+        ops.append([tag, i1, i2, j1, j2])
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """
+    Patience anchors: tokens occurring exactly once in both ranges, as (i, j) pairs
+    forming the longest run that is increasing in both sequences.
+    """
+    in_a = {}
+    for i in range(alo, ahi):
+        in_a[a[i]] = -1 if a[i] in in_a else i
+    in_b = {}
+    for j in range(blo, bhi):
+        in_b[b[j]] = -1 if b[j] in in_b else j
+
+    # Pairs come out in a order (dict order is first occurrence); keep the longest increasing run of j
+    pairs = [(i, in_b[token]) for token, i in in_a.items() if i >= 0 and in_b.get(token, -1) >= 0]
+    if not pairs:
+        return []
+
+    tails = []      # tails[k]: index into pairs of the smallest last j of an increasing run of length k + 1
+    tail_js = []
+    previous = [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        low, high = 0, len(tail_js)
+        while low < high:
+            middle = (low + high) // 2
+            if tail_js[middle] < j:
+                low = middle + 1
+            else:
+                high = middle
+        previous[index] = tails[low - 1] if low else None
+        if low == len(tails):
+            tails.append(index)
+            tail_js.append(j)
+        else:
+            tails[low] = index
+            tail_js[low] = j
+
+    anchors = []
+    index = tails[-1]
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+def _myers(a, b, alo, ahi, blo, bhi, ops):
+    """
+    Myers' O(ND) shortest edit script for a[alo:ahi] -> b[blo:bhi].
+    Returns False without emitting anything if the script needs more than MYERS_MAX_EDITS edits.
+    """
+    n, m = ahi - alo, bhi - blo
+    max_d = min(n + m, MYERS_MAX_EDITS)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                _myers_backtrack(trace, n, m, alo, blo, ops)
+                return True
+    return False
+
+def _myers_backtrack(trace, n, m, alo, blo, ops):
+    """Walk the Myers trace back from (n, m) and emit the edit script in order."""
+    script = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        v = trace[d]  # v[k + d + 1] is the furthest x reached on diagonal k after d - 1 edits
+        k = x - y
+        if k == -d or (k != d and v[k - 1 + d + 1] < v[k + 1 + d + 1]):
+            previous_k = k + 1
+            previous_x = v[previous_k + d + 1]
+            previous_y = previous_x - previous_k
+            mid_x, mid_y = previous_x, previous_y + 1
+            edit = ("insert", previous_x, previous_x, previous_y, previous_y + 1)
+        else:
+            previous_k = k - 1
+            previous_x = v[previous_k + d + 1]
+            previous_y = previous_x - previous_k
+            mid_x, mid_y = previous_x + 1, previous_y
+            edit = ("delete", previous_x, previous_x + 1, previous_y, previous_y)
+        script.append(("equal", mid_x, x, mid_y, y))
+        script.append(edit)
+        x, y = previous_x, previous_y
+    script.append(("equal", 0, x, 0, y))
+    for tag, i1, i2, j1, j2 in reversed(script):
+        _emit(ops, tag, alo + i1, alo + i2, blo + j1, blo + j2)
+
+def _diff_range(a, b, alo, ahi, blo, bhi, ops, depth=0):
+    """Patience diff of a[alo:ahi] -> b[blo:bhi], with a common prefix/suffix fast path."""
+    # Fast path: strip the common prefix and suffix before doing any real work
+    start_a, start_b = alo, blo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    _emit(ops, "equal", start_a, alo, start_b, blo)
+
+    end_a, end_b = ahi, bhi
+    while ahi > alo and bhi > blo and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+
+    if alo == ahi or blo == bhi:
+        _emit(ops, "delete", alo, ahi, blo, blo)
+        _emit(ops, "insert", ahi, ahi, blo, bhi)
+    else:
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi) if depth < PATIENCE_MAX_DEPTH else []
+        if anchors:
+            for i, j in anchors:
+                _diff_range(a, b, alo, i, blo, j, ops, depth + 1)
+                _emit(ops, "equal", i, i + 1, j, j + 1)
+                alo, blo = i + 1, j + 1
+            _diff_range(a, b, alo, ahi, blo, bhi, ops, depth + 1)
+        elif not _myers(a, b, alo, ahi, blo, bhi, ops):
+            _emit(ops, "delete", alo, ahi, blo, blo)
+            _emit(ops, "insert", ahi, ahi, blo, bhi)
+
+    _emit(ops, "equal", ahi, end_a, bhi, end_b)
+
+def diff_sequences(a, b):
+    """
+    Opcodes turning sequence a into sequence b, as [tag, i1, i2, j1, j2] lists with tags
+    equal / delete / insert (like difflib, without replace: a change is a delete then an insert).
+    """
+    # Compare small ints instead of strings
+    ids = {}
+    a_ids = [ids.setdefault(token, len(ids)) for token in a]
+    b_ids = [ids.setdefault(token, len(ids)) for token in b]
+    ops = []
+    _diff_range(a_ids, b_ids, 0, len(a_ids), 0, len(b_ids), ops)
+    return ops
+
+def diff_texts(old, new, granularity="word"):
+    """
+    Diff two texts. Returns compact opcodes the UI renders directly: a list of
+    [op, text] pairs where op is "=" (unchanged), "-" (only in old) or "+" (only in new).
+    """
+    started = time.perf_counter()
+    a = tokenize(old or "", granularity)
+    b = tokenize(new or "", granularity)
+
+    opcodes = []
+    counts = {"equal": 0, "delete": 0, "insert": 0}
+    for tag, i1, i2, j1, j2 in diff_sequences(a, b):
+        if tag == "equal":
+            opcodes.append(["=", "".join(a[i1:i2])])
+            counts["equal"] += i2 - i1
+        elif tag == "delete":
+            opcodes.append(["-", "".join(a[i1:i2])])
+            counts["delete"] += i2 - i1
+        else:
+            opcodes.append(["+", "".join(b[j1:j2])])
+            counts["insert"] += j2 - j1
+
+    total = len(a) + len(b)
+    return {
+        "granularity": granularity,
+        "opcodes": opcodes,
+        "stats": {
+            "old_tokens": len(a),
+            "new_tokens": len(b),
+            "unchanged": counts["equal"],
+            "deleted": counts["delete"],
+            "inserted": counts["insert"],
+            "similarity": round(2.0 * counts["equal"] / total, 4) if total else 1.0,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    }
+
+# Template fields compared by diff_template_fields
+TEMPLATE_DIFF_FIELDS = ("system_message", "user_message", "assistant_message")
+
+def diff_template_fields(old, new, granularity="word", fields=TEMPLATE_DIFF_FIELDS):
+    """Diff each message field of two template versions (dicts as returned by get_template_details)."""
+    return {field: diff_texts(str(old.get(field) or ""), str(new.get(field) or ""), granularity) for field in fields}
@@ -0,0 +1,235 @@
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+from config import EXPORT_STORE_PATH, EXPORT_RETENTION_DAYS, EXPORT_MAX_ITEMS
+from utils.csv_ingest import chat_csv_store, iter_chat_markdown
+
+logger = logging.getLogger(__name__)
+
+# Characters per chunk when a rendered export is streamed to the client
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Parameters listed in the main section of a comparison report rather than under "Additional Parameters"
+MAIN_PARAMS = ['system_message', 'user_message', 'assistant_message', 'model', 'temperature', 'max_tokens']
+
+def _comparison_side(title, params, response):
+    """Markdown section for one side of a template comparison."""
+    return f"""## {title}
+- **Model**: {params.get('model', 'gpt-3.5-turbo')}
+- **Temperature**: {params.get('temperature', 0.7)}
+- **Max Tokens**: {params.get('max_tokens', 500)}
+
+### System Message
+```
+{params.get('system_message', '')}
+```
+
+### User Message
+```
+{params.get('user_message', '')}
+```
+
+### Assistant Message
+```
+{params.get('assistant_message', '')}
+```
+
+### Response
+```
+{response}
+```
+"""
+
+def render_comparison(data, created_at):
+    """Markdown for a template comparison export, yielded section by section."""
+    template_name = data.get('template_name', 'comparison')
+    left_params = data.get('left_params', {})
+    right_params = data.get('right_params', {})
+
+    yield f"""# Prompt Comparison: {template_name}
+
+## Date
+{datetime.datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M:%S')}
+
+"""
+    yield _comparison_side("Left Side (Previous)", left_params, data.get('left_response', ''))
+    yield "\n"
+    yield _comparison_side("Right Side (Current)", right_params, data.get('right_response', ''))
+
+    # Add additional parameters if any
+    additional_left = [f"- **{key}**: {value}\n" for key, value in left_params.items() if key not in MAIN_PARAMS]
+    additional_right = [f"- **{key}**: {value}\n" for key, value in right_params.items() if key not in MAIN_PARAMS]
+    if additional_left or additional_right:
+        yield "\n## Additional Parameters\n"
+        yield "\n### Left Side (Previous)\n" + "".join(additional_left)
+        yield "\n### Right Side (Current)\n" + "".join(additional_right)
+
+def render_markdown_comparison(data, created_at):
+    """
+    Markdown for a JiJa markdown comparison export, yielded section by section. When the
+    right side is a CSV upload (right_upload_id), all of its rows are streamed from the upload store.
+    """
+    left_content = data.get('left_content', '')
+    right_content = data.get('right_content', '')
+    right_upload_id = data.get('right_upload_id')
+    date = datetime.datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M:%S')
+
+    yield f"""# Markdown Comparison - JiJa
+
+## Date
+{date}
+
+## Left Side (New Version)
+```markdown
+{left_content}
+```
+
+## Right Side (JiJa)
+"""
+    if right_upload_id:
+        if chat_csv_store.get_upload(right_upload_id) is None:
+            yield f"*The uploaded JiJa chat ({right_upload_id}) is no longer stored*"
+        else:
+            yield "```markdown\n"
+            yield from iter_chat_markdown(right_upload_id)
+            yield "\n```"
+    # Right content that is already formatted (from CSV) is kept as rendered markdown
+    elif right_content.startswith('# JiJa Response'):
+        yield right_content
+    else:
+        yield f"```markdown\n{right_content}\n```"
+    yield "\n"
+
+# Export kinds: name -> (renderer, filename prefix)
+EXPORT_KINDS = {
+    "comparison": (render_comparison, lambda data: f"comparison_{data.get('template_name', 'comparison').replace(' ', '_')}"),
+    "markdown_comparison": (render_markdown_comparison, lambda data: "jija_comparison"),
+}
+
+class ExportStore:
+    """
+    Append-only archive of exports in SQLite. Each export is stored once as a zlib-compressed
+    JSON record of what was compared; markdown is rendered from it, section by section, when downloaded.
+    Exports older than retention_days, and the oldest beyond max_items, are removed as new ones arrive.
+    """
+
+    def __init__(self, path, retention_days=30, max_items=5000):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"writes": 0, "downloads": 0, "evictions": 0}
+
+    def _connect(self):
+        """Open the SQLite file on first use."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS exports ("
+                "export_id TEXT PRIMARY KEY, kind TEXT NOT NULL, filename TEXT NOT NULL, "
+                "created_at REAL NOT NULL, raw_bytes INTEGER NOT NULL, record BLOB NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_exports_filename ON exports (filename)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_exports_created_at ON exports (created_at)")
+            self._db.commit()
+        return self._db
+
+    def append(self, kind, data):
+        """Archive one export. Returns its id, download filename and sizes."""
+        if kind not in EXPORT_KINDS:
+            raise ValueError(f"Unknown export kind: {kind}")
+        created_at = time.time()
+        export_id = uuid.uuid4().hex
+        timestamp = datetime.datetime.fromtimestamp(created_at).strftime('%Y%m%d_%H%M%S')
+        # Keep the name safe to put in a Content-Disposition header
+        filename = re.sub(r'[^\w.-]', '_', f"{EXPORT_KINDS[kind][1](data)}_{timestamp}.md", flags=re.ASCII)
+        raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        record = zlib.compress(raw, 6)
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO exports (export_id, kind, filename, created_at, raw_bytes, record) VALUES (?, ?, ?, ?, ?, ?)",
+                (export_id, kind, filename, created_at, len(raw), record)
+            )
+            self._apply_retention(db, created_at)
+            db.commit()
+            self.stats["writes"] += 1
+        return {"export_id": export_id, "filename": filename, "raw_bytes": len(raw), "stored_bytes": len(record)}
+
+    def _apply_retention(self, db, now):
+        """Remove exports past the retention period, then the oldest over max_items."""
+        removed = db.execute("DELETE FROM exports WHERE created_at < ?", (now - self.retention_days * 86400,)).rowcount
+        removed += db.execute(
+            "DELETE FROM exports WHERE export_id IN "
+            "(SELECT export_id FROM exports ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.max_items,)
+        ).rowcount
+        if removed:
+            self.stats["evictions"] += removed
+            logger.info(f"Removed {removed} exports past retention")
+
+    def find(self, key):
+        """Look an export up by id, or by filename (the newest with that name). Returns (kind, filename, created_at, data) or None."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT kind, filename, created_at, record FROM exports WHERE export_id = ? OR filename = ? "
+                "ORDER BY export_id = ? DESC, created_at DESC LIMIT 1",
+                (key, key, key)
+            ).fetchone()
+        if row is None:
+            return None
+        kind, filename, created_at, record = row
+        return kind, filename, created_at, json.loads(zlib.decompress(record))
+
+    def render(self, key):
+        """
+        Render an export as markdown. Returns (filename, sections), where sections is an iterator
+        of markdown strings rendered as they are consumed, or None.
+        """
+        found = self.find(key)
+        if found is None:
+            return None
+        kind, filename, created_at, data = found
+        return filename, EXPORT_KINDS[kind][0](data, created_at)
+
+    def iter_download(self, sections):
+        """Yield rendered export sections as encoded chunks, so large exports stream out without being joined."""
+        with self._lock:
+            self.stats["downloads"] += 1
+        for section in sections:
+            for start in range(0, len(section), DOWNLOAD_CHUNK_SIZE):
+                yield section[start:start + DOWNLOAD_CHUNK_SIZE].encode('utf-8')
+
+    def list_exports(self, limit=50):
+        """The newest exports, without their content."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT export_id, kind, filename, created_at, raw_bytes, LENGTH(record) FROM exports "
+                "ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(("export_id", "kind", "filename", "created_at", "raw_bytes", "stored_bytes"), row)) for row in rows]
+
+    def get_stats(self):
+        """Counters plus the number and size of stored exports."""
+        with self._lock:
+            count, raw_bytes, stored_bytes = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(LENGTH(record)), 0) FROM exports"
+            ).fetchone()
+            stats = dict(self.stats)
+        stats.update({"count": count, "raw_bytes": raw_bytes, "stored_bytes": stored_bytes,
+                      "retention_days": self.retention_days, "max_items": self.max_items})
+        return stats
+
+# Shared store used by the export routes
+export_store = ExportStore(EXPORT_STORE_PATH, retention_days=EXPORT_RETENTION_DAYS, max_items=EXPORT_MAX_ITEMS)
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Readiness checks run at startup: name -> check function returning a truthy value when healthy
+_checks = {}
+_results = {}
+_results_lock = threading.Lock()
+_started_at = time.time()
+
+def run_readiness_check(name):
+    """Run one registered check and record whether it passed, how long it took and any error."""
+    started = time.perf_counter()
+    error = None
+    try:
+        ok = bool(_checks[name]())
+    except Exception as e:
+        ok = False
+        error = str(e)
+    result = {
+        "state": "ok" if ok else "failed",
+        "checked_at": time.time(),
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        "error": error
+    }
+    with _results_lock:
+        result["attempts"] = _results.get(name, {}).get("attempts", 0) + 1
+        _results[name] = result
+    if not ok:
+        logger.warning(f"Readiness check {name} failed" + (f": {error}" if error else ""))
+    return ok
+
+def run_readiness_checks(checks):
+    """Register checks and run them all now, in the calling thread. Returns True if every check passed."""
+    _register(checks)
+    return all([run_readiness_check(name) for name in checks])
+
+def _register(checks):
+    with _results_lock:
+        for name, check in checks.items():
+            _checks[name] = check
+            _results.setdefault(name, {"state": "pending", "checked_at": None, "latency_ms": None,
+                                       "error": None, "attempts": 0})
+
+def _readiness_loop(names, retry_interval):
+    pending = list(names)
+    while True:
+        pending = [name for name in pending if not run_readiness_check(name)]
+        if not pending:
+            logger.info("All readiness checks passed")
+            return
+        time.sleep(retry_interval)
+
+def start_readiness_checks(checks, retry_interval=30):
+    """
+    Register checks and run them in a background thread so startup doesn't wait on the network.
+    Failed checks are retried every retry_interval seconds until they pass.
+    """
+    _register(checks)
+    threading.Thread(target=_readiness_loop, args=(list(checks), retry_interval),
+                     name="readiness-checks", daemon=True).start()
+
+def get_health():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok", "uptime_seconds": round(time.time() - _started_at, 1)}
+
+def get_readiness():
+    """Readiness: every startup check has passed."""
+    with _results_lock:
+        checks = {name: dict(result) for name, result in _results.items()}
+    return {"ready": all(result["state"] == "ok" for result in checks.values()), "checks": checks}
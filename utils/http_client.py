@@ -0,0 +1,83 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class PooledHttpClient:
+    """
+    Shared HTTP client built on one requests.Session.
+    Keeps TCP/TLS connections warm in a sized pool, applies connect/read timeouts
+    to every call, retries 429/5xx and connection errors with jittered exponential
+    backoff, and caps how many requests run against each host at once.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=15, max_retries=3, backoff_base=0.5,
+                 backoff_max=8.0, pool_size=10, max_concurrency_per_host=8):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency_per_host = max_concurrency_per_host
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+
+    def _host_limit(self, url):
+        """Return the semaphore limiting concurrent requests to this URL's host."""
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_concurrency_per_host)
+            return self._host_limits[host]
+
+    def _backoff_delay(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header when present."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the pool. After the last retry the final response is
+        returned (so callers can still inspect the status) or the last error is raised.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        limit = self._host_limit(url)
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with limit:
+                    response = self.session.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying (attempt {attempt + 1}/{self.max_retries})")
+                # Release the connection back to the pool before waiting
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"{method} {url} failed: {str(e)}, retrying (attempt {attempt + 1}/{self.max_retries})")
+            time.sleep(self._backoff_delay(attempt, response))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
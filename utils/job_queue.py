@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from config import JOB_QUEUE_PATH, JOB_QUEUE_WORKERS, JOB_RETENTION, JOB_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Job states. Finished, failed and cancelled jobs never change again
+TERMINAL_STATES = ("finished", "failed", "cancelled")
+
+# Columns returned for a job, in table order
+JOB_COLUMNS = ("job_id", "kind", "state", "result", "error", "cancel_requested",
+               "created_at", "started_at", "finished_at")
+
+class JobQueue:
+    """
+    In-process job queue: a pool of worker threads runs registered handlers on JSON
+    payloads, and every job is recorded in SQLite so queued work survives a restart.
+
+    Several processes (server workers, or the debug reloader) can share the file. A job is
+    claimed with an atomic queued -> running update, and the claiming process renews a
+    lease on it every few seconds. A running job is only run again once its lease has
+    expired, i.e. the process that ran it has stopped.
+
+    A queued job can be cancelled outright. A running handler can't be interrupted, so
+    cancelling it marks the job cancelled and its result is dropped when it returns.
+    """
+
+    def __init__(self, path, workers=4, retention=86400, lease_seconds=60):
+        self.path = path
+        self.workers = workers
+        self.retention = retention
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._db = None
+        self._started = False
+
+    def _connect(self):
+        """Open the SQLite file on first use."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, state TEXT NOT NULL, "
+                "result TEXT, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, created_at)")
+            self._db.commit()
+        return self._db
+
+    def register(self, kind, handler):
+        """Register the function that runs jobs of a kind. It takes the payload and returns a JSON-able result."""
+        self._handlers[kind] = handler
+
+    def start(self):
+        """
+        Start the worker pool and the lease keeper once per process, and pick up queued
+        jobs and running jobs whose lease has expired. Call it from the server's entry point
+        or startup hook, not at import (submit() also starts it).
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            expired = self._requeue_expired()
+            leftover = [row[0] for row in self._connect().execute(
+                "SELECT job_id FROM jobs WHERE state = 'queued' ORDER BY created_at").fetchall()]
+        for job_id in leftover:
+            self._pending.put(job_id)
+        if leftover:
+            logger.info(f"Picked up {len(leftover)} queued jobs ({expired} whose process had stopped)")
+        for number in range(max(1, self.workers)):
+            threading.Thread(target=self._worker, name=f"job-worker-{number}", daemon=True).start()
+        threading.Thread(target=self._lease_keeper, name="job-lease-keeper", daemon=True).start()
+
+    def _requeue_expired(self):
+        """Put running jobs with an expired lease back in the queue (caller holds the lock). Returns their ids."""
+        db = self._connect()
+        cutoff = time.time() - self.lease_seconds
+        expired = [row[0] for row in db.execute(
+            "SELECT job_id FROM jobs WHERE state = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+            (cutoff,)).fetchall()]
+        for job_id in expired:
+            db.execute("UPDATE jobs SET state = 'queued', started_at = NULL, owner = NULL WHERE job_id = ? "
+                       "AND state = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)", (job_id, cutoff))
+        db.commit()
+        if expired:
+            logger.warning(f"Requeued {len(expired)} running jobs whose lease expired")
+        return expired
+
+    def _lease_keeper(self):
+        """Renew the leases of this process's running jobs, and take over jobs whose owner has stopped."""
+        while True:
+            time.sleep(max(1.0, self.lease_seconds / 3))
+            try:
+                with self._lock:
+                    db = self._connect()
+                    db.execute("UPDATE jobs SET heartbeat_at = ? WHERE state = 'running' AND owner = ?",
+                               (time.time(), self.owner))
+                    db.commit()
+                    expired = self._requeue_expired()
+                for job_id in expired:
+                    self._pending.put(job_id)
+            except sqlite3.Error as e:
+                logger.error(f"Job lease renewal failed: {str(e)}")
+
+    def submit(self, kind, payload):
+        """Queue a job and return its status."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self.start()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO jobs (job_id, kind, payload, state, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload), now)
+            )
+            # Forget old completed jobs
+            db.execute(f"DELETE FROM jobs WHERE state IN ({','.join('?' * len(TERMINAL_STATES))}) AND finished_at < ?",
+                       TERMINAL_STATES + (now - self.retention,))
+            db.commit()
+        self._pending.put(job_id)
+        logger.info(f"Queued {kind} job {job_id}")
+        return self.get(job_id)
+
+    def _row(self, job_id):
+        return self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+
+    @staticmethod
+    def _status(row, include_result=True):
+        """A job row as a status dict, with queue and run times."""
+        job = dict(zip(JOB_COLUMNS, row))
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        result = job.pop("result")
+        if include_result and job["state"] == "finished":
+            job["result"] = json.loads(result) if result is not None else None
+        now = time.time()
+        started_at, finished_at = job["started_at"], job["finished_at"]
+        job["queued_ms"] = round(((started_at or finished_at or now) - job["created_at"]) * 1000, 1)
+        job["run_ms"] = round(((finished_at or now) - started_at) * 1000, 1) if started_at else None
+        return job
+
+    def get(self, job_id, include_result=True):
+        """Return a job's status (and result once finished), or None for an unknown job."""
+        with self._lock:
+            row = self._row(job_id)
+        return self._status(row, include_result) if row else None
+
+    def list_jobs(self, limit=50):
+        """The most recent jobs, newest first, without their results."""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._status(row, include_result=False) for row in rows]
+
+    def get_stats(self):
+        """Job counts by state and the size of the worker pool."""
+        with self._lock:
+            counts = dict(self._connect().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        return {"workers": self.workers, "pending": self._pending.qsize(), "states": counts}
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are cancelled at once; running jobs are marked cancelled
+        and their result is discarded. Returns the job's status, or None for an unknown job.
+        """
+        now = time.time()
+        with self._changed:
+            db = self._connect()
+            db.execute("UPDATE jobs SET state = 'cancelled', cancel_requested = 1, finished_at = ? "
+                       "WHERE job_id = ? AND state IN ('queued', 'running')", (now, job_id))
+            db.commit()
+            self._changed.notify_all()
+            row = self._row(job_id)
+        return self._status(row) if row else None
+
+    def wait_for_change(self, job_id, state, timeout=15):
+        """Block until the job leaves state (or timeout passes). Returns the job's status."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                row = self._row(job_id)
+                if row is None or row[2] != state:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return self._status(row) if row else None
+
+    def _set_state(self, job_id, from_state, **fields):
+        """Move a job out of from_state. Returns False if it has left that state already (e.g. cancelled)."""
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._changed:
+            db = self._connect()
+            cursor = db.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ? AND state = ?",
+                                tuple(fields.values()) + (job_id, from_state))
+            db.commit()
+            self._changed.notify_all()
+        return cursor.rowcount == 1
+
+    def _worker(self):
+        while True:
+            job_id = self._pending.get()
+            with self._lock:
+                row = self._connect().execute("SELECT kind, payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            now = time.time()
+            if row is None or not self._set_state(job_id, "queued", state="running", started_at=now,
+                                                  owner=self.owner, heartbeat_at=now):
+                continue  # Cancelled (or removed) while it waited
+            kind, payload = row
+            try:
+                result = self._handlers[kind](json.loads(payload))
+                finished = self._set_state(job_id, "running", state="finished", finished_at=time.time(),
+                                           result=json.dumps(result))
+            except Exception as e:
+                logger.error(f"{kind} job {job_id} failed: {str(e)}")
+                finished = self._set_state(job_id, "running", state="failed", finished_at=time.time(), error=str(e))
+            if not finished:
+                logger.info(f"{kind} job {job_id} was cancelled while running; its result was dropped")
+
+# Shared queue used by the app's background routes
+job_queue = JobQueue(JOB_QUEUE_PATH, workers=JOB_QUEUE_WORKERS, retention=JOB_RETENTION, lease_seconds=JOB_LEASE_SECONDS)
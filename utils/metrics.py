@@ -0,0 +1,177 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+# Latency histogram buckets in seconds, from cache hits up to long generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A monotonically increasing count per label set."""
+    kind = "counter"
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set (Prometheus histogram)."""
+    kind = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _format_value(float(bound))
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {count}"
+
+class MetricsRegistry:
+    """Named metrics, rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description, label_names=()):
+        return self._register(Counter(name, description, label_names))
+
+    def histogram(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, description, label_names, buckets))
+
+    def render(self):
+        """All metrics as Prometheus text (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry served at /metrics
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to produce a response, per route, method and status",
+    ("route", "method", "status"))
+upstream_request_duration = registry.histogram(
+    "upstream_request_duration_seconds", "Latency of calls to OpenAI and PromptLayer, per operation and outcome",
+    ("upstream", "operation", "outcome"))
+openai_requests = registry.counter(
+    "openai_requests_total", "OpenAI API requests by model and outcome (ok, rate_limited, retried, error)",
+    ("model", "outcome"))
+openai_tokens = registry.counter(
+    "openai_tokens_total", "Tokens reported in response.usage, by model and kind (prompt, completion)",
+    ("model", "kind"))
+openai_time_to_first_token = registry.histogram(
+    "openai_time_to_first_token_seconds", "Time from sending a streamed request to its first content chunk",
+    ("model",))
+
+def record_http_request(route, method, status, seconds):
+    http_request_duration.observe(seconds, route=route, method=method, status=status)
+
+def record_upstream(upstream, operation, outcome, seconds):
+    upstream_request_duration.observe(seconds, upstream=upstream, operation=operation, outcome=outcome)
+
+def usage_count(usage, name):
+    """One count from an OpenAI usage object, or from the plain dict the client leaves on stream chunks."""
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return value or 0
+
+def record_token_usage(model, usage):
+    """Count the tokens in an OpenAI response.usage object (ignored when missing)."""
+    if usage is None:
+        return
+    openai_tokens.inc(usage_count(usage, "prompt_tokens"), model=model, kind="prompt")
+    openai_tokens.inc(usage_count(usage, "completion_tokens"), model=model, kind="completion")
+
+def timed_upstream(upstream, operation, failed=None):
+    """
+    Decorator recording each call's latency under upstream_request_duration_seconds.
+    The outcome is "error" when the call raises or failed(result) is true, otherwise "ok".
+    Works on plain and async functions.
+    """
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await function(*args, **kwargs)
+                    outcome = "error" if failed and failed(result) else "ok"
+                    return result
+                finally:
+                    record_upstream(upstream, operation, outcome, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = function(*args, **kwargs)
+                outcome = "error" if failed and failed(result) else "ok"
+                return result
+            finally:
+                record_upstream(upstream, operation, outcome, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+def render_metrics():
+    """Prometheus text for every registered metric."""
+    return registry.render()
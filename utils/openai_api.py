@@ -1,183 +1,558 @@
 import logging
-from openai import OpenAI
-from config import OPENAI_API_KEY
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import OPENAI_API_KEY, OPENAI_BASE_URL, CASSETTE_MODE, OPENAI_QUEUE_TIMEOUT, OPENAI_MAX_RETRIES
+from utils.completion_cache import completion_cache, make_cache_key, should_cache
+from utils.rate_limiter import get_limiter, estimate_tokens, retry_after_from_headers
+from utils.structured_logging import log_event
+from utils.single_flight import SingleFlight, should_coalesce
+from utils.template_normalizer import normalize_message_roles
+from utils.metrics import (
+    timed_upstream, record_upstream, record_token_usage, usage_count, openai_requests, openai_time_to_first_token
+)
 
-# Initialize OpenAI client with minimal parameters
-client = OpenAI(api_key=OPENAI_API_KEY)
+logger = logging.getLogger(__name__)
+
+# OpenAI client, created by get_client on first use so importing this module doesn't load the SDK
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the shared OpenAI client, creating it on first use."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+                # Retries are handled by create_chat_completion so 429s can feed the rate limiter
+                # In record or replay mode the SDK's HTTP traffic goes through the cassette (utils/cassette.py)
+                http_client = None
+                if CASSETTE_MODE != "off":
+                    from utils.cassette import openai_http_client
+                    http_client = openai_http_client()
+                client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0, http_client=http_client)
+    return client
+
+# Identical requests in flight at the same time share one OpenAI call (see should_coalesce)
+completion_flight = SingleFlight("generate_completion")
+jija_flight = SingleFlight("call_jija_comp_gpt")
+improvement_flight = SingleFlight("improve_prompt_field")
 
 # Standard GPT model - Used as default
 GPT_MODEL = "gpt-4o"
 
-def generate_completion(user_message="", system_message="You are a helpful AI assistant.", assistant_message="", model="gpt-4o", temperature=0.7, max_tokens=500, **kwargs):
+# Streams ask for a final usage chunk, so their token counts come from the API
+# (sent in extra_body: this openai client has no stream_options argument)
+STREAM_OPTIONS = {"include_usage": True}
+
+# System prompt to simulate JiJa Comp GPT behavior
+JIJA_SYSTEM_PROMPT = """You are JiJa, an AI assistant specializing in business comparisons, analysis, and metrics. 
+        Your primary function is to help users compare data, analyze business metrics, and provide insights.
+        
+        When responding to queries about comparisons:
+        1. Be concise and focus on the key differences
+        2. Present information in clear, structured formats (tables when relevant)
+        3. Highlight important metrics and quantifiable data
+        4. Provide context for why certain differences matter
+        5. Be objective and balanced in your analysis
+        
+        Your tone should be professional, analytical, and helpful. Provide direct answers that are easy to understand.
+        """
+
+def _release_when_done(stream, limiter):
+    """Hold the limiter slot until a streamed response has been fully read."""
+    try:
+        yield from stream
+    finally:
+        limiter.release()
+
+class ChatRequestAttempts:
     """
-    Generate a completion using OpenAI API with separated message fields.
-    Supports both standard models and custom GPTs.
+    Rate limiting, retries and metrics for one chat completion request, shared by
+    create_chat_completion and its async counterpart: they only make the call and wait.
     """
-    try:
-        # Check if this is a custom GPT (indicated by g- prefix in model ID)
-        is_custom_gpt = model.startswith("g-")
-        
-        messages = []
+
+    def __init__(self, request):
+        self.model = request["model"]
+        self.stream = bool(request.get("stream"))
+        self.limiter = get_limiter(self.model)
+        self.estimated = estimate_tokens(request.get("messages", []), request.get("max_tokens"))
+        self.deadline = time.monotonic() + OPENAI_QUEUE_TIMEOUT
+        self.retries = 0
+        self.started = None
+
+    def begin(self):
+        """Start timing an attempt that the limiter has let through."""
+        self.started = time.perf_counter()
+
+    def succeeded(self, response):
+        """Record a successful attempt. A non-streamed response frees the limiter slot and records its usage."""
+        # For streams this is the time to the response headers, not to the last chunk
+        record_upstream("openai", "chat_completion", "ok", time.perf_counter() - self.started)
+        openai_requests.inc(model=self.model, outcome="ok")
+        if not self.stream:
+            self.limiter.release()
+            record_token_usage(self.model, getattr(response, "usage", None))
+
+    def failed(self, error):
+        """
+        Record a failed attempt and free its limiter slot. Returns the seconds to wait before
+        trying again, or None if the error should be raised.
+        """
+        from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
         
-        # Add system message if provided (only for non-custom GPTs)
-        if system_message and not is_custom_gpt:
-            messages.append({"role": "system", "content": system_message})
+        if isinstance(error, RateLimitError):
+            # The limiter shrinks the model's concurrency and pauses it, so the retry just re-queues
+            record_upstream("openai", "chat_completion", "rate_limited", time.perf_counter() - self.started)
+            openai_requests.inc(model=self.model, outcome="rate_limited")
+            self.limiter.release(rate_limited=True, retry_after=retry_after_from_headers(error.response.headers))
+            return None if time.monotonic() >= self.deadline else 0
         
-        # Add user message if provided
-        if user_message:
-            messages.append({"role": "user", "content": user_message})
+        record_upstream("openai", "chat_completion", "error", time.perf_counter() - self.started)
+        self.limiter.release()
+        if isinstance(error, (APITimeoutError, APIConnectionError, InternalServerError)):
+            self.retries += 1
+            if self.retries <= OPENAI_MAX_RETRIES and time.monotonic() < self.deadline:
+                openai_requests.inc(model=self.model, outcome="retried")
+                logging.warning(f"OpenAI request failed ({str(error)}), retrying (attempt {self.retries}/{OPENAI_MAX_RETRIES})")
+                return random.uniform(0, min(8.0, 0.5 * (2 ** self.retries)))
+        openai_requests.inc(model=self.model, outcome="error")
+        return None
+
+def create_chat_completion(**request):
+    """
+    Call client.chat.completions.create through the process-wide rate limiter.
+    The request waits in a queue (up to OPENAI_QUEUE_TIMEOUT seconds) for request/token
+    capacity. A 429 shrinks the model's concurrency, pauses it for the time the response
+    headers ask for, and re-queues the request. Timeouts, connection errors and 5xx errors
+    are retried up to OPENAI_MAX_RETRIES times.
+    Every attempt is counted in openai_requests_total and timed under the "chat_completion"
+    operation; token usage is recorded for non-streamed responses.
+    """
+    openai_client = get_client()
+    attempts = ChatRequestAttempts(request)
+    
+    while True:
+        attempts.limiter.acquire(attempts.estimated, attempts.deadline)
+        attempts.begin()
+        try:
+            response = openai_client.chat.completions.create(**request)
+        except Exception as e:
+            delay = attempts.failed(e)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        attempts.succeeded(response)
+        return _release_when_done(response, attempts.limiter) if attempts.stream else response
+
+def build_messages(user_message="", system_message="", assistant_message="", model=GPT_MODEL):
+    """
+    Build the chat messages list from the separated message fields.
+    Custom GPTs (g- prefix) only receive the user message.
+    """
+    # Check if this is a custom GPT (indicated by g- prefix in model ID)
+    is_custom_gpt = model.startswith("g-")
+    
+    messages = []
+    
+    # Add system message if provided (only for non-custom GPTs)
+    if system_message and not is_custom_gpt:
+        messages.append({"role": "system", "content": system_message})
+    
+    # Add user message if provided
+    if user_message:
+        messages.append({"role": "user", "content": user_message})
+    
+    # Add assistant message if provided (only for non-custom GPTs)
+    if assistant_message and not is_custom_gpt:
+        messages.append({"role": "assistant", "content": assistant_message})
         
-        # Add assistant message if provided (only for non-custom GPTs)
-        if assistant_message and not is_custom_gpt:
-            messages.append({"role": "assistant", "content": assistant_message})
+    # If no messages were added, add a default user message
+    if not messages:
+        messages.append({"role": "user", "content": "Hello, can you help me?"})
+    
+    return messages
+
+# Roles a caller-supplied messages list may contain
+MESSAGE_ROLES = ("system", "user", "assistant")
+
+def validate_messages(messages):
+    """Check a caller-supplied chat messages list. Raises ValueError if it is malformed."""
+    if not isinstance(messages, list) or not messages:
+        raise ValueError("messages must be a non-empty list")
+    for message in messages:
+        if not isinstance(message, dict) or message.get("role") not in MESSAGE_ROLES:
+            raise ValueError(f"each message needs a role of {', '.join(MESSAGE_ROLES)}")
+        if not isinstance(message.get("content"), str):
+            raise ValueError("each message needs string content")
+
+def prepare_messages(messages, model=GPT_MODEL):
+    """
+    Return a full conversation ready to send, unchanged so few-shot turns keep their structure
+    (apart from PromptLayer-only roles, which are mapped or dropped). Custom GPTs (g- prefix)
+    only receive the user messages.
+    """
+    messages = normalize_message_roles(messages)
+    validate_messages(messages)
+    if model.startswith("g-"):
+        return [message for message in messages if message["role"] == "user"]
+    return messages
+
+def clean_generation_kwargs(kwargs):
+    """Remove problematic parameters that might cause issues with the OpenAI API."""
+    clean_kwargs = {}
+    for k, v in kwargs.items():
+        # Skip provider and Frequency Penalty parameters - they're not supported by OpenAI API
+        if k in ['provider', 'Frequency Penalty']:
+            continue
             
-        # If no messages were added, add a default user message
-        if not messages:
-            messages.append({"role": "user", "content": "Hello, can you help me?"})
-        
-        # Remove problematic parameters that might cause issues
-        clean_kwargs = {}
-        for k, v in kwargs.items():
-            # Skip provider and Frequency Penalty parameters - they're not supported by OpenAI API
-            if k in ['provider', 'Frequency Penalty']:
-                continue
-                
-            # Handle known parameters with proper types
-            if k in ['top_p', 'frequency_penalty', 'presence_penalty']:
-                if not isinstance(v, str) and v is not None:
-                    clean_kwargs[k] = float(v)
-            else:
-                clean_kwargs[k] = v
-        
-        logging.info(f"Generating completion with model: {model}")
-        logging.info(f"Parameters: temp={temperature}, max_tokens={max_tokens}")
-        
-        # Both custom GPTs and standard models use the same API call in v1.0.0+
-        logging.info(f"Using model: {model}")
+        # Handle known parameters with proper types
+        if k in ['top_p', 'frequency_penalty', 'presence_penalty']:
+            if not isinstance(v, str) and v is not None:
+                clean_kwargs[k] = float(v)
+        else:
+            clean_kwargs[k] = v
+    return clean_kwargs
+
+def request_key(request):
+    """Completion cache and single-flight key of a chat completion request."""
+    return make_cache_key(**request)
+
+def log_completion_request(request):
+    log_event(logger, "completion.request", model=request["model"], temperature=request["temperature"],
+              max_tokens=request["max_tokens"], messages=len(request["messages"]))
+
+def completion_text(response):
+    """The text of a non-streamed chat completion."""
+    return response.choices[0].message.content
+
+def prepare_generation(user_message, system_message, assistant_message, model, temperature, max_tokens, use_cache, messages, kwargs):
+    """
+    The chat completion request for a generate_completion or stream_completion call, and its
+    completion cache key (None when should_cache(temperature, use_cache) says not to cache).
+    Raises ValueError if messages is malformed.
+    """
+    if messages is not None:
+        messages = prepare_messages(messages, model)
+    else:
+        messages = build_messages(user_message, system_message, assistant_message, model)
+    request = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens,
+               **clean_generation_kwargs(kwargs)}
+    return request, request_key(request) if should_cache(temperature, use_cache) else None
+
+@timed_upstream("openai", "generate_completion", failed=lambda result: str(result).startswith("Error generating response:"))
+def generate_completion(user_message="", system_message="You are a helpful AI assistant.", assistant_message="", model="gpt-4o", temperature=0.7, max_tokens=500, use_cache=None, messages=None, coalesce=None, **kwargs):
+    """
+    Generate a completion using OpenAI API with separated message fields,
+    or with a full messages list (which takes precedence over the fields).
+    Supports both standard models and custom GPTs.
+    Identical requests are served from the completion cache as should_cache(temperature, use_cache) allows
+    (deterministic requests by default, sampled ones only with use_cache=True),
+    and identical requests already in flight are joined as should_coalesce(temperature, coalesce) allows.
+    """
+    try:
+        request, cache_key = prepare_generation(user_message, system_message, assistant_message, model,
+                                                temperature, max_tokens, use_cache, messages, kwargs)
+        if cache_key:
+            cached = completion_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"Completion cache hit for model: {model}")
+                return cached
         
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            **clean_kwargs
-        )
+        def complete():
+            log_completion_request(request)
+            # Both custom GPTs and standard models use the same API call in v1.0.0+
+            content = completion_text(create_chat_completion(**request))
+            if cache_key and content is not None:
+                completion_cache.set(cache_key, content)
+            return content
         
-        return response.choices[0].message.content
+        if should_coalesce(temperature, coalesce):
+            return completion_flight.do(cache_key or request_key(request), complete)
+        return complete()
     except Exception as e:
         logging.error(f"Error generating completion: {str(e)}")
         return f"Error generating response: {str(e)}"
 
-def call_jija_comp_gpt(message, temperature=0.7, max_tokens=1000):
+def stream_request(model, messages, temperature, max_tokens, kwargs):
+    """A streamed chat completion request, asking for the final usage chunk."""
+    kwargs = dict(kwargs)
+    return {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, "stream": True,
+            "extra_body": {"stream_options": STREAM_OPTIONS, **(kwargs.pop("extra_body", None) or {})}, **kwargs}
+
+class StreamProgress:
+    """
+    What stream_chat_completion and its async counterpart track while reading a stream:
+    time to first token, content chunks, finish reason and usage. done_event records the
+    metrics and builds the final event.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.chunks = 0
+        self.usage = None
+        self.finish_reason = None
+
+    def delta(self, chunk):
+        """The text of one stream chunk, or None for chunks without any."""
+        # With include_usage the last chunk has no choices, only the usage of the whole stream
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return None
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        delta = choice.delta.content if choice.delta else None
+        if not delta:
+            return None
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            openai_time_to_first_token.observe(self.first_token_at - self.started, model=self.model)
+        self.chunks += 1
+        return delta
+
+    def done_event(self, outcome):
+        finished = time.perf_counter()
+        record_upstream("openai", "stream_chat_completion", outcome, finished - self.started)
+        record_token_usage(self.model, self.usage)
+        tokens = usage_count(self.usage, "completion_tokens") if self.usage else None
+        generation_seconds = finished - (self.first_token_at or finished)
+        return {
+            "done": True,
+            "model": self.model,
+            "finish_reason": self.finish_reason,
+            "ttft_ms": round((self.first_token_at - self.started) * 1000, 1) if self.first_token_at else None,
+            "total_ms": round((finished - self.started) * 1000, 1),
+            "chunks": self.chunks,
+            "tokens": tokens,
+            "tokens_per_sec": round(tokens / generation_seconds, 1) if tokens and generation_seconds > 0 else None
+        }
+
+def stream_error_event(error):
+    logging.error(f"Error streaming completion: {str(error)}")
+    return {"error": f"Error generating response: {str(error)}"}
+
+def stream_chat_completion(model, messages, temperature=0.7, max_tokens=500, **kwargs):
+    """
+    Stream a chat completion from OpenAI.
+    
+    Yields {"delta": text} for each content chunk, then one final event with
+    {"done": True, ...timing}. Errors are yielded as {"error": message}.
+    chunks counts the content chunks; tokens and tokens_per_sec come from the usage the API
+    reports at the end of the stream, and are None when it reports none.
+    """
+    progress = StreamProgress(model)
+    try:
+        logging.info(f"Streaming completion with model: {model}")
+        for chunk in create_chat_completion(**stream_request(model, messages, temperature, max_tokens, kwargs)):
+            delta = progress.delta(chunk)
+            if delta:
+                yield {"delta": delta}
+        outcome = "ok"
+    except Exception as e:
+        outcome = "error"
+        yield stream_error_event(e)
+    yield progress.done_event(outcome)
+
+def cached_stream_events(model, cached, started):
+    """The events of a streamed generation served from the completion cache: one delta and the done event."""
+    logging.info(f"Completion cache hit for streamed model: {model}")
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return [{"delta": cached},
+            {"done": True, "model": model, "cached": True, "finish_reason": "stop",
+             "ttft_ms": elapsed_ms, "total_ms": elapsed_ms, "chunks": 1, "tokens": None, "tokens_per_sec": None}]
+
+class StreamCollector:
+    """Gathers a streamed generation's text so a stream that finished without errors can be cached."""
+
+    def __init__(self):
+        self.parts = []
+        self.failed = False
+
+    def add(self, event):
+        """Note one stream event. Returns the whole text once the stream has finished cleanly, else None."""
+        if "delta" in event:
+            self.parts.append(event["delta"])
+        elif "error" in event:
+            self.failed = True
+        elif event.get("done") and not self.failed:
+            return "".join(self.parts)
+        return None
+
+def stream_completion(user_message="", system_message="You are a helpful AI assistant.", assistant_message="", model="gpt-4o", temperature=0.7, max_tokens=500, use_cache=None, messages=None, coalesce=None, **kwargs):
+    """
+    Streaming counterpart of generate_completion. Yields the same events as stream_chat_completion.
+    A cache hit is sent as a single delta; a finished stream is written to the cache.
+    Streams are never coalesced (coalesce is accepted so the same parameters work for both).
+    """
+    try:
+        request, cache_key = prepare_generation(user_message, system_message, assistant_message, model,
+                                                temperature, max_tokens, use_cache, messages, kwargs)
+    except Exception as e:
+        logging.error(f"Error preparing streamed completion: {str(e)}")
+        yield {"error": f"Error generating response: {str(e)}"}
+        return
+    
+    if cache_key:
+        started = time.perf_counter()
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            yield from cached_stream_events(model, cached, started)
+            return
+    
+    logging.info(f"Parameters: temp={temperature}, max_tokens={max_tokens}")
+    collector = StreamCollector()
+    for event in stream_chat_completion(**request):
+        text = collector.add(event)
+        if cache_key and text is not None:
+            completion_cache.set(cache_key, text)
+        yield event
+
+def jija_request(message, temperature, max_tokens):
+    """The chat completion request that simulates JiJa Comp GPT with GPT_MODEL and JIJA_SYSTEM_PROMPT."""
+    return {
+        "model": GPT_MODEL,
+        "messages": [
+            {"role": "system", "content": JIJA_SYSTEM_PROMPT},
+            {"role": "user", "content": message}
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+
+@timed_upstream("openai", "call_jija_comp_gpt", failed=lambda result: str(result).startswith("Error calling JiJa simulation:"))
+def call_jija_comp_gpt(message, temperature=0.7, max_tokens=1000, coalesce=None):
     """
     Simulates JiJa Comp GPT with a standard GPT-4o model using a system prompt.
+    Identical calls already in flight are joined as should_coalesce(temperature, coalesce) allows.
     """
     try:
         logging.info(f"Calling JiJa Comp simulation with message: {message[:100]}...")
+        request = jija_request(message, temperature, max_tokens)
         
-        # Create a system prompt to simulate JiJa Comp GPT behavior
-        system_prompt = """You are JiJa, an AI assistant specializing in business comparisons, analysis, and metrics. 
-        Your primary function is to help users compare data, analyze business metrics, and provide insights.
+        def complete():
+            return completion_text(create_chat_completion(**request))
         
-        When responding to queries about comparisons:
-        1. Be concise and focus on the key differences
-        2. Present information in clear, structured formats (tables when relevant)
-        3. Highlight important metrics and quantifiable data
-        4. Provide context for why certain differences matter
-        5. Be objective and balanced in your analysis
-        
-        Your tone should be professional, analytical, and helpful. Provide direct answers that are easy to understand.
-        """
-        
-        # Create a formatted prompt that includes all message types
-        response = client.chat.completions.create(
-            model=GPT_MODEL,  # Use GPT-4o model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        
-        return response.choices[0].message.content
+        if should_coalesce(temperature, coalesce):
+            return jija_flight.do(request_key(request), complete)
+        return complete()
     except Exception as e:
         logging.error(f"Error calling JiJa simulation: {str(e)}")
         return f"Error calling JiJa simulation: {str(e)}"
 
-def suggest_prompt_improvements(system_message="", user_message="", assistant_message="", model="gpt-3.5-turbo"):
+def stream_jija_comp_gpt(message, temperature=0.7, max_tokens=1000):
     """
-    Generate suggestions for improving prompts (system, user, and assistant messages).
+    Streaming counterpart of call_jija_comp_gpt.
     """
-    try:
-        if not model:
-            model = "gpt-3.5-turbo"  # Default model if none provided
+    logging.info(f"Streaming JiJa Comp simulation with message: {message[:100]}...")
+    yield from stream_chat_completion(**jija_request(message, temperature, max_tokens))
+
+# Per-field improvement prompts. Each asks for a JSON object so the answer parses in one pass
+FIELD_IMPROVEMENT_PROMPTS = {
+    "system": """
+            I need to improve a system message for an AI prompt. The system message sets the overall behavior and instructions for the AI.
             
-        # Validate inputs to prevent blank requests
-        if not any([system_message, user_message, assistant_message]):
-            logging.error("No message content provided for suggestions")
-            return """
-            SYSTEM: You are a helpful AI assistant that provides clear and concise responses.
-            USER: Please help me with my task.
-            ASSISTANT: I'd be happy to help you with your task. What specific information or assistance do you need?
-            """
+            Current system message:
+            {system_message}
             
-        # Create a formatted prompt that includes all message types
-        suggestion_prompt = f"""
-        I'm going to provide you with prompt components. Please analyze them and suggest 
-        SIGNIFICANT improvements to make them more effective, clear, and likely to generate better results.
-        
-        Current System Message:
-        {system_message}
-        
-        Current User Message:
-        {user_message}
-        
-        Current Assistant Message:
-        {assistant_message}
-        
-        Please suggest substantial and creative improvements to these prompts, focusing on:
-        1. Clarity and specificity - make instructions much clearer and more detailed
-        2. Structure and organization - improve how the information is structured
-        3. Adding any missing context or instructions that would help
-        4. Improving tone and language for better results
-        5. Adding new capabilities or instructions that weren't in the original
-        
-        Your improvements should be substantial - not just minor edits!
-        
-        Return the improved prompts in this format:
-        SYSTEM: [improved system message]
-        USER: [improved user message]
-        ASSISTANT: [improved assistant message]
-        
-        Don't include any explanations, just the improved messages.
-        """
-        
-        logging.info(f"Generating prompt improvement suggestions with model: {model}")
-        logging.info(f"System msg length: {len(system_message)}, User msg length: {len(user_message)}, Assistant msg length: {len(assistant_message)}")
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": suggestion_prompt}],
-            temperature=0.8,
-            max_tokens=2000
-        )
-        
-        suggestion = response.choices[0].message.content
-        
-        # Validate output format
-        if not ("SYSTEM:" in suggestion and "USER:" in suggestion and "ASSISTANT:" in suggestion):
-            logging.warning("Suggestion response does not contain proper format. Reformatting...")
-            # Add proper formatting if missing
-            lines = suggestion.strip().split('\n')
-            formatted_suggestion = f"SYSTEM: {system_message or lines[0]}\nUSER: {user_message or lines[min(1, len(lines)-1)]}\nASSISTANT: {assistant_message or lines[min(2, len(lines)-1)]}"
-            return formatted_suggestion
-        
-        return suggestion
+            Please suggest a significantly improved version of this system message that is more effective, clear, and specific.
+            Your improvements should be substantial and creative, not minor tweaks.
+            Return ONLY a JSON object of the form {{"improved": "<improved system message>"}} with no additional commentary.
+            """,
+    "user": """
+            I need to improve a user message for an AI prompt. The user message is the specific query or instruction.
+            
+            Current system context: {system_message}
+            Current user message:
+            {user_message}
+            
+            Please suggest a significantly improved version of this user message that is more clear, specific, and likely to get a better response.
+            Your improvements should be substantial and creative, not minor tweaks.
+            Return ONLY a JSON object of the form {{"improved": "<improved user message>"}} with no additional commentary.
+            """,
+    "assistant": """
+            I need to improve an assistant message for an AI prompt. The assistant message is the example response or previous message from the AI.
+            
+            Current system context: {system_message}
+            Current user context: {user_message}
+            Current assistant message:
+            {assistant_message}
+            
+            Please suggest a significantly improved version of this assistant message that better sets up the conversation or provides a better example.
+            Your improvements should be substantial and creative, not minor tweaks.
+            Return ONLY a JSON object of the form {{"improved": "<improved assistant message>"}} with no additional commentary.
+            """
+}
+
+# Pool for running the per-field improvements side by side
+_improvement_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="prompt-improvement")
+
+def improvement_request(field, system_message, user_message, assistant_message, model):
+    """
+    The JSON-mode request that suggests an improved version of one prompt field, and the
+    field's current text (what a failed suggestion falls back to).
+    """
+    original = {"system": system_message, "user": user_message, "assistant": assistant_message}[field]
+    suggestion_prompt = FIELD_IMPROVEMENT_PROMPTS[field].format(
+        system_message=system_message,
+        user_message=user_message,
+        assistant_message=assistant_message
+    )
+    request = {
+        "model": model,
+        "messages": [{"role": "user", "content": suggestion_prompt}],
+        "temperature": 0.8,
+        "max_tokens": 800,
+        "response_format": {"type": "json_object"}
+    }
+    return request, original
+
+def parse_improvement(response, original):
+    """The improved text from a JSON-mode suggestion, or original if it has none."""
+    improved = json.loads(completion_text(response)).get("improved", "")
+    return improved.strip() if isinstance(improved, str) and improved.strip() else original
+
+@timed_upstream("openai", "improve_prompt_field")
+def improve_prompt_field(field, system_message="", user_message="", assistant_message="", model="gpt-3.5-turbo", coalesce=None):
+    """
+    Suggest an improved version of one prompt field ("system", "user" or "assistant").
+    Uses JSON mode so the suggestion (multi-line or not) comes back as a single string.
+    Returns the original text if the call fails. Suggestions are sampled, so identical
+    calls in flight are only joined when coalescing is requested (or COALESCE_SAMPLED is set).
+    """
+    request, original = improvement_request(field, system_message, user_message, assistant_message, model)
+    
+    def complete():
+        return parse_improvement(create_chat_completion(**request), original)
+    
+    try:
+        if should_coalesce(request["temperature"], coalesce):
+            return improvement_flight.do(request_key(request), complete)
+        return complete()
     except Exception as e:
-        logging.error(f"Error suggesting improvements: {str(e)}")
-        return f"""
-        SYSTEM: {system_message}
-        USER: {user_message}
-        ASSISTANT: {assistant_message}
-        """
\ No newline at end of file
+        logging.error(f"Error improving {field} message: {str(e)}")
+        return original
+
+def iter_prompt_improvements(fields, system_message="", user_message="", assistant_message="", model="gpt-3.5-turbo", coalesce=None):
+    """
+    Improve several prompt fields concurrently.
+    Yields (field, improved_text) pairs in the order they finish.
+    """
+    futures = {
+        _improvement_executor.submit(improve_prompt_field, field, system_message, user_message, assistant_message, model, coalesce): field
+        for field in fields
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+@timed_upstream("openai", "improve_prompt_fields")
+def improve_prompt_fields(fields, system_message="", user_message="", assistant_message="", model="gpt-3.5-turbo", coalesce=None):
+    """Improve several prompt fields concurrently and return {field: improved_text}."""
+    return dict(iter_prompt_improvements(fields, system_message, user_message, assistant_message, model, coalesce))
@@ -1,7 +1,19 @@
-import requests
 import logging
-import json
-from config import PROMPTLAYER_API_KEY
+import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    PROMPTLAYER_API_KEY, PROMPTLAYER_BASE_URL, TEMPLATE_CACHE_TTL, TEMPLATE_CACHE_MAX_STALE, TEMPLATE_CACHE_REFRESH_INTERVAL,
+    TEMPLATE_CACHE_ACTIVE_WINDOW,
+    PROMPTLAYER_CONNECT_TIMEOUT, PROMPTLAYER_READ_TIMEOUT, PROMPTLAYER_MAX_RETRIES,
+    PROMPTLAYER_POOL_SIZE, PROMPTLAYER_MAX_CONCURRENCY, TEMPLATE_FETCH_MODE, CASSETTE_MODE, COALESCE_ENABLED
+)
+from utils.http_client import PooledHttpClient
+from utils.metrics import record_upstream
+from utils.single_flight import SingleFlight
+from utils.structured_logging import log_event
+from utils.template_normalizer import normalize_template
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -10,7 +22,19 @@ logger = logging.getLogger(__name__)
 # API constants
 API_KEY = PROMPTLAYER_API_KEY
 WORKSPACE_ID = 17053  # Specific workspace ID
-BASE_URL = "https://api.promptlayer.com"
+BASE_URL = PROMPTLAYER_BASE_URL
+
+# Shared client so every PromptLayer call reuses warm connections and has timeouts and retries
+http_client = PooledHttpClient(
+    connect_timeout=PROMPTLAYER_CONNECT_TIMEOUT,
+    read_timeout=PROMPTLAYER_READ_TIMEOUT,
+    max_retries=PROMPTLAYER_MAX_RETRIES,
+    pool_size=PROMPTLAYER_POOL_SIZE,
+    max_concurrency_per_host=PROMPTLAYER_MAX_CONCURRENCY
+)
+if CASSETTE_MODE != "off":
+    from utils.cassette import install_requests_cassette
+    install_requests_cassette(http_client.session, "promptlayer")
 
 def get_headers():
     """Return headers for API requests."""
@@ -23,13 +47,198 @@ def check_api_connection():
     """Check if the PromptLayer API is accessible."""
     try:
         # Try a basic API endpoint
-        response = requests.get(f"{BASE_URL}/prompt-templates", headers=get_headers())
+        response = http_client.get(f"{BASE_URL}/prompt-templates", headers=get_headers())
         return response.status_code == 200
     except Exception as e:
         logger.error(f"API connection check failed: {str(e)}")
         return False
 
+# Template cache: key -> {"value": ..., "fetched_at": ...}
+# Keys are ("list",) for the template list and ("details", template_id, version) for processed templates
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+_refreshing_keys = set()
+_template_loaders = {}
+_template_access = {}  # key -> when it was last read
+_last_eviction = 0.0
+_template_cache_stats = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0,
+                         "evictions": 0}
+# Concurrent cache misses for the same key share one load
+template_flight = SingleFlight("template_fetch")
+
+def _refresh_template_entry(key):
+    """Reload one cache entry. Failed loads keep the old value."""
+    loader = _template_loaders.get(key)
+    try:
+        if loader is None:
+            return None
+        value = loader()
+        if value:
+            with _template_cache_lock:
+                _template_cache[key] = {"value": value, "fetched_at": time.time()}
+                _template_cache_stats["refreshes"] += 1
+        else:
+            with _template_cache_lock:
+                _template_cache_stats["refresh_failures"] += 1
+        return value
+    except Exception as e:
+        logger.error(f"Error refreshing template cache entry {key}: {str(e)}")
+        with _template_cache_lock:
+            _template_cache_stats["refresh_failures"] += 1
+        return None
+    finally:
+        with _template_cache_lock:
+            _refreshing_keys.discard(key)
+
+def _refresh_in_background(key):
+    """Start a background refresh for key unless one is already running."""
+    with _template_cache_lock:
+        if key in _refreshing_keys:
+            return
+        _refreshing_keys.add(key)
+    threading.Thread(target=_refresh_template_entry, args=(key,), daemon=True).start()
+
+def lookup_template_cache(key, loader):
+    """
+    Return a copy of the cached value for key, or None on a miss.
+    Entries older than TEMPLATE_CACHE_TTL are still served (up to TEMPLATE_CACHE_MAX_STALE)
+    while loader refreshes them in the background.
+    """
+    now = time.time()
+    global _last_eviction
+    with _template_cache_lock:
+        # Lookups evict too (at most once per TTL), so the cache stays bounded without the refresher
+        if now - _last_eviction >= TEMPLATE_CACHE_TTL:
+            _last_eviction = now
+            _evict_template_entries(now)
+        _template_loaders[key] = loader
+        _template_access[key] = now
+        entry = _template_cache.get(key)
+        if entry is not None:
+            age = now - entry["fetched_at"]
+            if age < TEMPLATE_CACHE_TTL:
+                _template_cache_stats["fresh_hits"] += 1
+                return copy.deepcopy(entry["value"])
+            if age < TEMPLATE_CACHE_MAX_STALE:
+                _template_cache_stats["stale_hits"] += 1
+                stale_value = copy.deepcopy(entry["value"])
+            else:
+                stale_value = None
+        else:
+            stale_value = None
+        if stale_value is None:
+            _template_cache_stats["misses"] += 1
+    
+    if stale_value is not None:
+        logger.info(f"Serving stale template cache entry {key} while refreshing")
+        _refresh_in_background(key)
+    return stale_value
+
+def store_template_cache(key, value):
+    """Store a freshly loaded value. Empty/None results are never cached."""
+    if value:
+        with _template_cache_lock:
+            _template_cache[key] = {"value": copy.deepcopy(value), "fetched_at": time.time()}
+
+def _cached_template_fetch(key, loader):
+    """Return the cached value for key, loading it with loader on a miss."""
+    cached = lookup_template_cache(key, loader)
+    if cached is not None:
+        return cached
+    
+    def load():
+        with _template_cache_lock:
+            _refreshing_keys.add(key)
+        return _refresh_template_entry(key)
+    
+    value = template_flight.do(key, load) if COALESCE_ENABLED else load()
+    return copy.deepcopy(value)
+
+def invalidate_template_cache(template_id=None):
+    """
+    Drop cached templates. With a template_id only that template's entries are removed,
+    otherwise the whole cache (including the template list) is cleared.
+    Returns the number of entries removed.
+    """
+    with _template_cache_lock:
+        if template_id is None:
+            keys = list(_template_cache.keys())
+        else:
+            keys = [key for key in _template_cache if key[0] == "details" and str(key[1]) == str(template_id)]
+        for key in keys:
+            del _template_cache[key]
+            _template_loaders.pop(key, None)
+            _template_access.pop(key, None)
+    logger.info(f"Invalidated {len(keys)} template cache entries")
+    return len(keys)
+
+def get_template_cache_stats():
+    """Return template cache counters and the age of each entry."""
+    now = time.time()
+    with _template_cache_lock:
+        stats = dict(_template_cache_stats)
+        stats["entries"] = {
+            ":".join(str(part) for part in key): round(now - entry["fetched_at"], 1)
+            for key, entry in _template_cache.items()
+        }
+    return stats
+
+def _evict_template_entries(now):
+    """
+    Drop entries too old to be served (older than TEMPLATE_CACHE_MAX_STALE) and loaders of
+    keys not read for that long, so keys nobody asks for any more stop costing memory.
+    Caller holds _template_cache_lock.
+    """
+    evicted = 0
+    for key in set(_template_cache) | set(_template_loaders):
+        entry = _template_cache.get(key)
+        expired = entry is not None and now - entry["fetched_at"] >= TEMPLATE_CACHE_MAX_STALE
+        idle = now - _template_access.get(key, 0) >= TEMPLATE_CACHE_MAX_STALE
+        if expired or (entry is None and idle):
+            _template_cache.pop(key, None)
+            _template_loaders.pop(key, None)
+            _template_access.pop(key, None)
+            evicted += 1
+    _template_cache_stats["evictions"] += evicted
+    return evicted
+
+def _template_refresh_loop():
+    """
+    Refresh entries shortly before they go stale, so users rarely see a stale or cold entry.
+    Only entries read within TEMPLATE_CACHE_ACTIVE_WINDOW are refreshed; the rest age out.
+    """
+    while True:
+        time.sleep(TEMPLATE_CACHE_REFRESH_INTERVAL)
+        now = time.time()
+        with _template_cache_lock:
+            _evict_template_entries(now)
+            due = [key for key, entry in _template_cache.items()
+                   if now - entry["fetched_at"] >= TEMPLATE_CACHE_TTL - TEMPLATE_CACHE_REFRESH_INTERVAL
+                   and now - _template_access.get(key, 0) < TEMPLATE_CACHE_ACTIVE_WINDOW]
+        for key in due:
+            _refresh_in_background(key)
+
+_refresher_started = False
+
+def start_template_refresher():
+    """Start the proactive refresh thread once per process. Disabled when the interval is 0."""
+    global _refresher_started
+    if _refresher_started or TEMPLATE_CACHE_REFRESH_INTERVAL <= 0:
+        return
+    _refresher_started = True
+    threading.Thread(target=_template_refresh_loop, name="template-refresher", daemon=True).start()
+    logger.info(f"Template cache refresher started (every {TEMPLATE_CACHE_REFRESH_INTERVAL}s)")
+
 def get_all_templates():
+    """
+    Get all prompt templates, served from the template cache.
+    
+    Returns:
+        list: A list of template objects
+    """
+    return _cached_template_fetch(("list",), fetch_all_templates) or []
+
+def fetch_all_templates():
     """
     Get all prompt templates from PromptLayer API.
     
@@ -39,7 +248,7 @@ def get_all_templates():
     try:
         # Use the main API endpoint for templates
         url = f"{BASE_URL}/prompt-templates"
-        response = requests.get(url, headers=get_headers())
+        response = http_client.get(url, headers=get_headers())
         
         logger.info(f"API URL: {url}")
         logger.info(f"Response Status: {response.status_code}")
@@ -87,325 +296,356 @@ def get_all_templates():
 
 def process_specific_template(template_data):
     """Process a specific template from direct API response"""
-    try:
-        logger.info(f"Processing specific template: {template_data.get('prompt_name', 'Unknown')}")
-        logger.info(f"Template data keys: {list(template_data.keys())}")
-        
-        # Initialize message fields
-        system_message = ""
-        user_message = ""
-        assistant_message = ""
-        
-        # Extract basic template info
-        version = template_data.get("version", 1)
-        template_id = template_data.get("id", "unknown")
-        
-        # Extract model information
-        model = "gpt-3.5-turbo"  # Default
-        provider = "openai"      # Default
-        temperature = 0.7        # Default
-        max_tokens = 500         # Default
-        top_p = 1.0
-        frequency_penalty = 0.0
-        presence_penalty = 0.0
-        
-        # Extract from metadata if available
-        metadata = template_data.get("metadata", {})
-        if metadata and "model" in metadata:
-            model_info = metadata["model"]
-            model = model_info.get("name", model)
-            
-            # Extract provider information
-            provider = model_info.get("provider", "openai")
-            
-            # Get parameters if available
-            if "parameters" in model_info:
-                params = model_info["parameters"]
-                temperature = params.get("temperature", temperature)
-                top_p = params.get("top_p", top_p)
-                frequency_penalty = params.get("frequency_penalty", frequency_penalty)
-                presence_penalty = params.get("presence_penalty", presence_penalty)
-                if "max_tokens" in params:
-                    max_tokens = params.get("max_tokens")
-                    
-            logger.info(f"Model from metadata: {model}, Provider: {provider}")
-            logger.info(f"Params from metadata: temp={temperature}, top_p={top_p}, freq_penalty={frequency_penalty}, pres_penalty={presence_penalty}")
-        
-        # Handle different template formats
-        
-        # Format 1: Direct system, user, assistant fields
-        if "system_message" in template_data and "user_message" in template_data:
-            logger.info("Found direct message fields in template")
-            system_message = template_data.get("system_message", "")
-            user_message = template_data.get("user_message", "")
-            assistant_message = template_data.get("assistant_message", "")
-            logger.info(f"Direct fields - System: {system_message[:30]}..., User: {user_message[:30]}...")
-            
-        # Format 2: Prompt template with messages
-        elif "prompt_template" in template_data:
-            prompt_template = template_data["prompt_template"]
-            logger.info(f"Processing prompt_template with keys: {list(prompt_template.keys())}")
-            
-            # Extract messages if available
-            if "messages" in prompt_template:
-                messages = prompt_template["messages"]
-                logging.info(f"Found {len(messages)} messages in template")
-                
-                # Log message structure for debugging
-                for i, msg in enumerate(messages):
-                    logging.info(f"Message {i} role: {msg.get('role', 'unknown')}")
-                    if "content" in msg:
-                        content_type = type(msg["content"]).__name__
-                        logging.info(f"Message {i} content type: {content_type}")
-                        if content_type == "list" and len(msg["content"]) > 0:
-                            item_type = type(msg["content"][0]).__name__
-                            logging.info(f"Message {i} content item type: {item_type}")
-                
-                for msg in messages:
-                    role = msg.get("role")
-                    
-                    # Extract content from message - handle newer ChatGPT API format
-                    content_text = ""
-                    if "content" in msg:
-                        content = msg["content"]
-                        # Handle content as a string
-                        if isinstance(content, str):
-                            content_text = content
-                        # Handle content as a list of objects (newer ChatGPT API format)
-                        elif isinstance(content, list):
-                            for content_item in content:
-                                if isinstance(content_item, str):
-                                    content_text += content_item
-                                elif isinstance(content_item, dict):
-                                    # Regular format with direct text property
-                                    if "text" in content_item:
-                                        content_text += content_item["text"]
-                                    # Newer ChatGPT API format with type and text properties
-                                    elif "type" in content_item and content_item["type"] == "text" and "text" in content_item:
-                                        content_text += content_item["text"]
-                        
-                        logging.info(f"Extracted {role} message: {content_text[:50]}...")
-                    
-                    # Assign to appropriate message field
-                    if role == "system":
-                        system_message = content_text
-                    elif role == "user":
-                        user_message = content_text
-                    elif role == "assistant":
-                        assistant_message = content_text
+    return normalize_template(template_data).to_dict()
+
+def template_request_payload(version=None):
+    """Setup the payload as required by the prompt template endpoint."""
+    return {
+        "version": version if version else None,  # Set to None to get latest version
+        "workspace_id": WORKSPACE_ID,
+        "label": "",
+        "provider": "openai",
+        "input_variables": {},
+        "metadata_filters": {}
+    }
+
+def fetch_template_by_id(template_id, version=None):
+    """Approach 1: Direct template endpoint with POST."""
+    template_url = f"{BASE_URL}/prompt-templates/{template_id}"
+    
+    # Make the POST request
+    template_response = http_client.post(template_url, json=template_request_payload(version), headers=get_headers())
+    
+    if template_response.status_code == 200:
+        template_data = template_response.json()
         
-        # Format 3: Look for llm_kwargs which contains model and messages - newer format
-        elif "llm_kwargs" in template_data:
-            logger.info("Found llm_kwargs format (newer ChatGPT API format)")
-            llm_kwargs = template_data["llm_kwargs"]
-            
-            # Extract model parameters
-            if "model" in llm_kwargs:
-                model = llm_kwargs["model"]
-            if "temperature" in llm_kwargs:
-                temperature = llm_kwargs["temperature"]
-            if "max_tokens" in llm_kwargs:
-                max_tokens = llm_kwargs.get("max_tokens", 1000)
-            if "top_p" in llm_kwargs:
-                top_p = llm_kwargs.get("top_p", 1.0)
-            if "frequency_penalty" in llm_kwargs:
-                frequency_penalty = llm_kwargs.get("frequency_penalty", 0.0)
-            if "presence_penalty" in llm_kwargs:
-                presence_penalty = llm_kwargs.get("presence_penalty", 0.0)
-                
-            # Process messages
-            if "messages" in llm_kwargs:
-                messages = llm_kwargs["messages"]
-                logger.info(f"Found {len(messages)} messages in llm_kwargs")
-                
-                for msg in messages:
-                    role = msg.get("role")
-                    content = msg.get("content")
-                    content_text = ""
-                    
-                    # Handle content as a string or list
-                    if isinstance(content, str):
-                        content_text = content
-                    elif isinstance(content, list):
-                        for content_item in content:
-                            if isinstance(content_item, str):
-                                content_text += content_item
-                            elif isinstance(content_item, dict):
-                                # Regular format with direct text property
-                                if "text" in content_item:
-                                    content_text += content_item["text"]
-                                # Newer ChatGPT API format with type and text properties
-                                elif "type" in content_item and content_item["type"] == "text" and "text" in content_item:
-                                    content_text += content_item["text"]
-                    
-                    # Assign to appropriate message field
-                    if role == "system":
-                        system_message = content_text
-                        logger.info(f"Found system message in llm_kwargs: {content_text[:50]}...")
-                    elif role == "user":
-                        # Append user messages together with newlines if there are multiple
-                        if user_message:
-                            user_message += "\n\n"
-                        user_message += content_text
-                        logger.info(f"Found user message in llm_kwargs: {content_text[:50]}...")
-                    elif role == "assistant":
-                        assistant_message = content_text
-                        logger.info(f"Found assistant message in llm_kwargs: {content_text[:50]}...")
-                
-        # Format 4: Handle direct prompt field
-        elif "prompt" in template_data:
-            logger.info("Found direct prompt field")
-            user_message = template_data.get("prompt", "")
-            system_message = "You are a helpful AI assistant."
-            logger.info(f"Using prompt as user message: {user_message[:50]}...")
+        if "template" in template_data:
+            template = template_data["template"]
+            log_event(logger, "template.fetched", template_id=template_id, version=version, strategy="by_id",
+                      keys=list(template.keys()))
             
-        # Log what we found
-        logger.info(f"Final user message length: {len(user_message)}")
-        logger.info(f"Final system message length: {len(system_message)}")
-        
-        # If we still have no user message, try to extract it from other fields
-        if not user_message:
-            logger.warning("No user message found in normal fields, looking in complete template")
-            # Try to extract from any text fields
-            for key, value in template_data.items():
-                if isinstance(value, str) and len(value) > 20 and not user_message:
-                    logger.info(f"Found potential user message in field '{key}'")
-                    user_message = value
-                    break
-        
-        # Default model if none is specified
-        if not model:
-            model = "gpt-4o"
-        
-        # Create the final template object
-        template_details = {
-            "system_message": system_message,
-            "user_message": user_message,
-            "assistant_message": assistant_message,
-            "model": model,
-            "provider": provider if 'provider' in locals() else "openai",  # Use detected provider or default to openai
-            "temperature": float(temperature),
-            "max_tokens": int(max_tokens),
-            "top_p": float(top_p),
-            "frequency_penalty": float(frequency_penalty),
-            "presence_penalty": float(presence_penalty),
-            "version": version,
-            "id": template_id,
-            "Frequency Penalty": float(frequency_penalty),  # Renamed parameter for display
-        }
+            # Process this template
+            return process_specific_template(template)
+        else:
+            log_event(logger, "template.missing_key", logging.WARNING, template_id=template_id,
+                      keys=list(template_data.keys()))
+    else:
+        log_event(logger, "template.fetch_failed", logging.WARNING, template_id=template_id, strategy="by_id",
+                  status=template_response.status_code, body=template_response.text)
+    return None
+
+def fetch_template_from_workspace(template_id, version=None):
+    """Approach 2: Workspace prompt endpoint (always the latest version)."""
+    workspace_url = f"{BASE_URL}/workspace/{WORKSPACE_ID}/prompt/{template_id}"
+    
+    workspace_response = http_client.get(workspace_url, headers=get_headers())
+    
+    if workspace_response.status_code == 200:
+        workspace_data = workspace_response.json()
+        log_event(logger, "template.fetched", template_id=template_id, strategy="workspace", keys=list(workspace_data.keys()))
         
-        logger.info(f"Successfully processed specific template with version {version}")
-        logger.info(f"User message length: {len(user_message)}")
-        logger.info(f"System message length: {len(system_message)}")
+        # Process the workspace response
+        return process_specific_template(workspace_data)
+    
+    log_event(logger, "template.fetch_failed", logging.WARNING, template_id=template_id, strategy="workspace",
+              status=workspace_response.status_code)
+    return None
+
+def fetch_template_index():
+    """
+    Download the full template list and index the raw templates by ID (as a string).
+    
+    Returns:
+        dict: template ID -> raw template, or None if the list could not be fetched
+    """
+    all_templates_url = f"{BASE_URL}/prompt-templates"
+    logger.info(f"Building template index from: {all_templates_url}")
+    
+    all_templates_response = http_client.get(all_templates_url, headers=get_headers())
+    
+    if all_templates_response.status_code == 200:
+        all_templates_data = all_templates_response.json()
         
-        return template_details
+        if "items" in all_templates_data:
+            templates = all_templates_data["items"]
+            logger.info(f"Indexed {len(templates)} templates")
+            return {str(template.get("id", "")): template for template in templates if template.get("id")}
+    
+    logger.warning(f"Failed to build template index, status: {all_templates_response.status_code}")
+    return None
+
+def fetch_template_from_index(template_id, version=None):
+    """Approach 3: Look the template up in the cached ID index instead of scanning a fresh list."""
+    index = _cached_template_fetch(("index",), fetch_template_index) or {}
+    template = index.get(str(template_id))
+    if template:
+        log_event(logger, "template.fetched", template_id=template_id, strategy="index")
+        return process_specific_template(template)
+    return None
+
+# Lookup strategies in order of preference
+TEMPLATE_FETCH_STRATEGIES = [fetch_template_by_id, fetch_template_from_workspace, fetch_template_from_index]
+
+def _strategies_for(version):
+    """Only the POST endpoint honours a version; the others always return the latest."""
+    return TEMPLATE_FETCH_STRATEGIES if version is None else [fetch_template_by_id]
+
+# Pool used to race the network strategies against each other
+_template_fetch_executor = ThreadPoolExecutor(max_workers=PROMPTLAYER_MAX_CONCURRENCY, thread_name_prefix="template-fetch")
+
+def _try_strategy(strategy, template_id, version):
+    """Run one lookup strategy, turning errors into a miss. Its latency is recorded as a hit, miss or error."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = strategy(template_id, version)
+        outcome = "hit" if result else "miss"
+        return result
     except Exception as e:
-        logger.error(f"Error processing specific template: {str(e)}")
-        # Return default values
-        return {
-            "system_message": "You are a helpful AI assistant.",
-            "user_message": "Please provide information about this topic.",
-            "assistant_message": "",
-            "model": "gpt-4o",
-            "provider": "openai",
-            "temperature": 0.7,
-            "max_tokens": 500,
-            "top_p": 1.0,
-            "frequency_penalty": 0.0,
-            "presence_penalty": 0.0,
-            "version": 1,
-            "id": "unknown",
-            "Frequency Penalty": 0.0  # Renamed parameter
-        }
+        logger.error(f"{strategy.__name__} failed for template {template_id}: {str(e)}")
+        return None
+    finally:
+        record_upstream("promptlayer", strategy.__name__, outcome, time.perf_counter() - started)
+
+def _race_template_strategies(template_id, version):
+    """
+    Send the network strategies at the same time and return the first valid result.
+    Strategies that have not started yet are cancelled; results that arrive later are dropped.
+    The cached index is only consulted once both network strategies have missed.
+    """
+    strategies = _strategies_for(version)
+    futures = [_template_fetch_executor.submit(_try_strategy, strategy, template_id, version)
+               for strategy in strategies if strategy is not fetch_template_from_index]
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            if result:
+                return result
+    finally:
+        for future in futures:
+            future.cancel()
+    if fetch_template_from_index in strategies:
+        return _try_strategy(fetch_template_from_index, template_id, version)
+    return None
 
 def get_template_directly(template_id, version=None):
     """Get template directly using the POST method which is the correct way to get templates from PromptLayer"""
     try:
-        # Try multiple API approaches to maximize chances of success
-        template_data = None
-        
-        # Approach 1: Direct template endpoint with POST
-        template_url = f"{BASE_URL}/prompt-templates/{template_id}"
-        logger.info(f"Approach 1: Getting template details for ID {template_id} using POST: {template_url}")
-        
-        # Setup the payload as required by the API
-        payload = {
-            "version": version if version else None,  # Set to None to get latest version
-            "workspace_id": WORKSPACE_ID,
-            "label": "",
-            "provider": "openai",
-            "input_variables": {},
-            "metadata_filters": {}
-        }
-        
-        # Make the POST request
-        template_response = requests.post(template_url, json=payload, headers=get_headers())
-        logger.info(f"Template API response status: {template_response.status_code}")
-        
-        if template_response.status_code == 200:
-            template_data = template_response.json()
-            logger.info(f"Template API response keys: {list(template_data.keys())}")
-            
-            if "template" in template_data:
-                template = template_data["template"]
-                logger.info(f"Found template with keys: {list(template.keys())}")
-                
-                # Enhanced debugging for all templates
-                logger.info(f"Template {template_id} data structure: {json.dumps(template, indent=2)[:1000]}...")
-                
-                # Process this template
-                return process_specific_template(template)
-            else:
-                logger.warning(f"No template key in response for template {template_id}")
+        if TEMPLATE_FETCH_MODE == "race":
+            result = _race_template_strategies(template_id, version)
         else:
-            logger.warning(f"Approach 1 failed for template {template_id}, status: {template_response.status_code}")
-            logger.info(f"Response content: {template_response.text[:500]}...")
-        
-        # Approach 2: Try workspace endpoint
-        workspace_url = f"{BASE_URL}/workspace/{WORKSPACE_ID}/prompt/{template_id}"
-        logger.info(f"Approach 2: Getting template through workspace endpoint: {workspace_url}")
-        
-        workspace_response = requests.get(workspace_url, headers=get_headers())
-        logger.info(f"Workspace API response status: {workspace_response.status_code}")
-        
-        if workspace_response.status_code == 200:
-            workspace_data = workspace_response.json()
-            logger.info(f"Workspace API response keys: {list(workspace_data.keys())}")
-            
-            # Process the workspace response
-            return process_specific_template(workspace_data)
-        else:
-            logger.warning(f"Approach 2 failed for template {template_id}, status: {workspace_response.status_code}")
-        
-        # Approach 3: Try getting all templates and filtering
-        all_templates_url = f"{BASE_URL}/prompt-templates"
-        logger.info(f"Approach 3: Checking all templates: {all_templates_url}")
-        
-        all_templates_response = requests.get(all_templates_url, headers=get_headers())
-        
-        if all_templates_response.status_code == 200:
-            all_templates_data = all_templates_response.json()
-            
-            if "items" in all_templates_data:
-                templates = all_templates_data["items"]
-                logger.info(f"Found {len(templates)} templates in API response")
-                
-                # Find the template with the right ID
-                for template in templates:
-                    # Convert both to same type (string) for comparison
-                    template_id_str = str(template_id)
-                    current_id_str = str(template.get("id", ""))
-                    
-                    if current_id_str == template_id_str:
-                        logger.info(f"Found template {template_id} in all templates list")
-                        return process_specific_template(template)
+            # Try multiple API approaches one after the other
+            result = None
+            for strategy in _strategies_for(version):
+                result = _try_strategy(strategy, template_id, version)
+                if result:
+                    break
         
-        logger.warning(f"All approaches failed for template {template_id}")
-        return None
+        if not result:
+            logger.warning(f"All approaches failed for template {template_id}")
+        return result
     except Exception as e:
         logger.error(f"Error getting template directly: {str(e)}")
         return None
 
+def get_cached_template(template_id, version=None):
+    """Get a processed template through the template cache."""
+    return _cached_template_fetch(
+        ("details", template_id, version),
+        lambda: get_template_directly(template_id, version)
+    )
+
+# Progress of the most recent warm-up run
+_warmup_status = {"state": "idle", "total": 0, "done": 0, "failed": 0, "started_at": None, "elapsed_seconds": None}
+_warmup_lock = threading.Lock()
+
+def warm_template_cache(limit=None, concurrency=4):
+    """
+    Fill the template cache: fetch the template list, then fetch and process each
+    template (the first `limit` if given) with bounded concurrency.
+    
+    Returns:
+        dict: The final warm-up status
+    """
+    with _warmup_lock:
+        if _warmup_status["state"] == "running":
+            return dict(_warmup_status)
+        _warmup_status.update({"state": "running", "total": 0, "done": 0, "failed": 0,
+                               "started_at": time.time(), "elapsed_seconds": None})
+    
+    started = time.perf_counter()
+    try:
+        templates = get_all_templates()
+        if limit:
+            templates = templates[:limit]
+        with _warmup_lock:
+            _warmup_status["total"] = len(templates)
+        logger.info(f"Warming template cache with {len(templates)} templates")
+        
+        def warm_one(template):
+            template_id = int(template["id"]) if str(template["id"]).isdigit() else template["id"]
+            ok = bool(get_cached_template(template_id))
+            with _warmup_lock:
+                _warmup_status["done"] += 1
+                if not ok:
+                    _warmup_status["failed"] += 1
+        
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="template-warmup") as executor:
+            list(executor.map(warm_one, templates))
+        
+        state = "finished"
+    except Exception as e:
+        logger.error(f"Template cache warm-up failed: {str(e)}")
+        state = "failed"
+    
+    with _warmup_lock:
+        _warmup_status["state"] = state
+        _warmup_status["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+        logger.info(f"Template cache warm-up {state}: {_warmup_status['done']}/{_warmup_status['total']} " +
+                    f"templates in {_warmup_status['elapsed_seconds']}s ({_warmup_status['failed']} failed)")
+        return dict(_warmup_status)
+
+def start_template_warmup(limit=None, concurrency=4):
+    """Run warm_template_cache in a background thread. Does nothing if a warm-up is already running."""
+    with _warmup_lock:
+        if _warmup_status["state"] == "running":
+            return False
+    threading.Thread(target=warm_template_cache, args=(limit, concurrency),
+                     name="template-warmup", daemon=True).start()
+    return True
+
+def get_warmup_status():
+    """Return warm-up progress, including elapsed time for a run in progress."""
+    with _warmup_lock:
+        status = dict(_warmup_status)
+    if status["state"] == "running" and status["started_at"]:
+        status["elapsed_seconds"] = round(time.time() - status["started_at"], 2)
+    return status
+
+# Hardcoded values for known templates, used when they can't be fetched through the API
+KNOWN_TEMPLATES = {
+    # Special SRL template with ID 41888 (manually verified content from PromptLayer)
+    41888: {
+        "system_message": "You are an elite business strategy consultant with decades of experience across multiple industries, specializing in guiding startups and small businesses from ideation through scaling. You are advising an entrepreneur whose business mission statement is Our mission is to enrich the lives of pets and their owners by providing high-quality, sustainable products that promote health and well-being while protecting our planet. based on cross-industry best practices. This entrepreneur has a list of jobs to be done given in the form of comma-separated values as follows: Conduct Supplier Research, Distribute Customer Feedback Surveys Create campaigns Foster meaningful relationships with owners/pets by creating a loyal community around brand. Host pet events and meetups to educate pet owners on wellness and sustainability",
+        "user_message": "SRL. Please suggest the 3 most important quantifiable business objectives (QOs) for the next 3 months that I can use to track my progress towards accomplishing my mission and distribute 100 points among these QOs as per their importance towards my mission.  Output your result in the form of a table with  the following columns: QO name, target value, deadline (date) and points allocated to that QO.\n\nYears in business : less than 2 years.  Industry experience: 4 months.",
+        "assistant_message": "",
+        "model": "gpt-4o",
+        "provider": "openai",
+        "temperature": 1.0,
+        "max_tokens": 1000,
+        "top_p": 1.0,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0,
+        "version": 17,
+        "Frequency Penalty": 0.0
+    },
+    # Top 10 Jobs Template with ID 43936
+    43936: {
+        "system_message": "You're an experienced product manager and business strategist specializing in improving job-to-be-done analyses for various industries, especially for small businesses and startups.",
+        "user_message": "Please review my Jobs to be Done (JTBD) for my pet products business and suggest improvements to make them more specific, actionable, and customer-focused. Here are my current JTBDs:\n\n1. Conduct supplier research\n2. Distribute customer feedback surveys\n3. Create marketing campaigns\n4. Foster relationships with pet owners\n5. Host educational events\n\nFor each JTBD, please:\n1. Rewrite it to be more specific and outcome-focused\n2. Explain why this improvement matters\n3. Suggest a metric to track progress\n\nOur mission is to enrich the lives of pets and their owners by providing high-quality, sustainable products that promote health and well-being while protecting our planet.",
+        "assistant_message": "",
+        "model": "gpt-4o",
+        "provider": "openai",
+        "temperature": 0.7,
+        "max_tokens": 1000,
+        "top_p": 1.0,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0,
+        "version": 1,
+        "Frequency Penalty": 0.0
+    },
+    # Template with ID 40000 (generic fallback for testing)
+    40000: {
+        "system_message": "You are a helpful assistant with expertise in product management, marketing, and business strategy.",
+        "user_message": "Give me 5 strategies to improve customer retention for my sustainable pet products business.",
+        "assistant_message": "",
+        "model": "gpt-4o",
+        "provider": "openai",
+        "temperature": 0.7,
+        "max_tokens": 1000,
+        "top_p": 1.0,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0,
+        "version": 1,
+        "Frequency Penalty": 0.0
+    }
+}
+
+def parse_template_id(template_name):
+    """Extract the numeric template ID from a display name such as "Top 10 Jobs id 43936"."""
+    if " id " in template_name:
+        id_match = template_name.split(" id ")
+        if len(id_match) > 1 and id_match[1].strip().isdigit():
+            template_id = int(id_match[1].strip())
+            logger.info(f"Extracted template ID: {template_id} from name: {template_name}")
+            return template_id
+    return None
+
+def missing_id_template_details(template_name):
+    """Template details returned when the name carries no template ID."""
+    logger.error(f"No template ID found in name: {template_name}")
+    return {
+        "system_message": "You are a helpful AI assistant.",
+        "user_message": f"No template ID found in: {template_name}. Please select a template with an ID.",
+        "assistant_message": "",
+        "model": "gpt-4o",
+        "provider": "openai",
+        "temperature": 0.7,
+        "max_tokens": 500,
+        "top_p": 1.0,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0,
+        "version": 1,
+        "id": "unknown",
+        "Frequency Penalty": 0.0
+    }
+
+def fallback_template_details(template_id):
+    """Template details used when the template could not be fetched from the API."""
+    # If it's a known template, use the hardcoded values
+    if template_id in KNOWN_TEMPLATES:
+        logger.info(f"Using hardcoded values for known template ID {template_id}")
+        template_data = KNOWN_TEMPLATES[template_id].copy()
+        template_data["id"] = template_id
+        return template_data
+        
+    # If all else fails, return a default template
+    logger.error(f"Could not retrieve template ID {template_id}")
+    return {
+        "system_message": "You are a helpful AI assistant.",
+        "user_message": f"Could not retrieve template ID {template_id}. Please try again or select a different template.",
+        "assistant_message": "",
+        "model": "gpt-4o",
+        "provider": "openai",
+        "temperature": 0.7,
+        "max_tokens": 500,
+        "top_p": 1.0,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0,
+        "version": 1,
+        "id": template_id,
+        "Frequency Penalty": 0.0
+    }
+
+def error_template_details(error):
+    """Template details returned when fetching a template raised an error."""
+    logger.error(f"Error fetching template details: {str(error)}")
+    return {
+        "system_message": "You are a helpful AI assistant.",
+        "user_message": f"Error fetching template: {str(error)}",
+        "assistant_message": "",
+        "model": "gpt-4o",
+        "provider": "openai",
+        "temperature": 0.7,
+        "max_tokens": 500,
+        "top_p": 1.0,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0,
+        "version": 1,
+        "id": "unknown",
+        "Frequency Penalty": 0.0
+    }
+
 def get_template_details(template_name):
     """
     Get specific template details from PromptLayer API.
@@ -418,133 +658,22 @@ def get_template_details(template_name):
     """
     try:
         # Check if the template_name indicates a specific ID (e.g., "Top 10 Jobs id 43936")
-        template_id = None
+        template_id = parse_template_id(template_name)
         version = None
         
-        # Parse ID from name if available
-        id_match = None
-        if " id " in template_name:
-            id_match = template_name.split(" id ")
-            if len(id_match) > 1 and id_match[1].strip().isdigit():
-                template_id = int(id_match[1].strip())
-                logger.info(f"Extracted template ID: {template_id} from name: {template_name}")
-        
         # If we don't have a template ID, we can't proceed
         if not template_id:
-            logger.error(f"No template ID found in name: {template_name}")
-            return {
-                "system_message": "You are a helpful AI assistant.",
-                "user_message": f"No template ID found in: {template_name}. Please select a template with an ID.",
-                "assistant_message": "",
-                "model": "gpt-4o",
-                "provider": "openai",
-                "temperature": 0.7,
-                "max_tokens": 500,
-                "top_p": 1.0,
-                "frequency_penalty": 0.0,
-                "presence_penalty": 0.0,
-                "version": 1,
-                "id": "unknown",
-                "Frequency Penalty": 0.0
-            }
+            return missing_id_template_details(template_name)
             
-        # Get the template directly from PromptLayer API - this is the correct way
+        # Get the template directly from PromptLayer API (through the template cache) - this is the correct way
         logger.info(f"Fetching template ID {template_id} directly from PromptLayer API")
-        direct_template = get_template_directly(template_id)
+        direct_template = get_cached_template(template_id, version)
         
         # If we successfully got the template, return it
         if direct_template:
             logger.info(f"Successfully retrieved template ID {template_id}")
             return direct_template
-            
-        # If we couldn't get the template through the API, use hardcoded values for known templates
-        KNOWN_TEMPLATES = {
-            # Special SRL template with ID 41888 (manually verified content from PromptLayer)
-            41888: {
-                "system_message": "You are an elite business strategy consultant with decades of experience across multiple industries, specializing in guiding startups and small businesses from ideation through scaling. You are advising an entrepreneur whose business mission statement is Our mission is to enrich the lives of pets and their owners by providing high-quality, sustainable products that promote health and well-being while protecting our planet. based on cross-industry best practices. This entrepreneur has a list of jobs to be done given in the form of comma-separated values as follows: Conduct Supplier Research, Distribute Customer Feedback Surveys Create campaigns Foster meaningful relationships with owners/pets by creating a loyal community around brand. Host pet events and meetups to educate pet owners on wellness and sustainability",
-                "user_message": "SRL. Please suggest the 3 most important quantifiable business objectives (QOs) for the next 3 months that I can use to track my progress towards accomplishing my mission and distribute 100 points among these QOs as per their importance towards my mission.  Output your result in the form of a table with  the following columns: QO name, target value, deadline (date) and points allocated to that QO.\n\nYears in business : less than 2 years.  Industry experience: 4 months.",
-                "assistant_message": "",
-                "model": "gpt-4o",
-                "provider": "openai",
-                "temperature": 1.0,
-                "max_tokens": 1000,
-                "top_p": 1.0,
-                "frequency_penalty": 0.0,
-                "presence_penalty": 0.0,
-                "version": 17,
-                "Frequency Penalty": 0.0
-            },
-            # Top 10 Jobs Template with ID 43936
-            43936: {
-                "system_message": "You're an experienced product manager and business strategist specializing in improving job-to-be-done analyses for various industries, especially for small businesses and startups.",
-                "user_message": "Please review my Jobs to be Done (JTBD) for my pet products business and suggest improvements to make them more specific, actionable, and customer-focused. Here are my current JTBDs:\n\n1. Conduct supplier research\n2. Distribute customer feedback surveys\n3. Create marketing campaigns\n4. Foster relationships with pet owners\n5. Host educational events\n\nFor each JTBD, please:\n1. Rewrite it to be more specific and outcome-focused\n2. Explain why this improvement matters\n3. Suggest a metric to track progress\n\nOur mission is to enrich the lives of pets and their owners by providing high-quality, sustainable products that promote health and well-being while protecting our planet.",
-                "assistant_message": "",
-                "model": "gpt-4o",
-                "provider": "openai",
-                "temperature": 0.7,
-                "max_tokens": 1000,
-                "top_p": 1.0,
-                "frequency_penalty": 0.0,
-                "presence_penalty": 0.0,
-                "version": 1,
-                "Frequency Penalty": 0.0
-            },
-            # Template with ID 40000 (generic fallback for testing)
-            40000: {
-                "system_message": "You are a helpful assistant with expertise in product management, marketing, and business strategy.",
-                "user_message": "Give me 5 strategies to improve customer retention for my sustainable pet products business.",
-                "assistant_message": "",
-                "model": "gpt-4o",
-                "provider": "openai",
-                "temperature": 0.7,
-                "max_tokens": 1000,
-                "top_p": 1.0,
-                "frequency_penalty": 0.0,
-                "presence_penalty": 0.0,
-                "version": 1,
-                "Frequency Penalty": 0.0
-            }
-        }
-        
-        # If it's a known template, use the hardcoded values
-        if template_id in KNOWN_TEMPLATES:
-            logger.info(f"Using hardcoded values for known template ID {template_id}")
-            template_data = KNOWN_TEMPLATES[template_id].copy()
-            template_data["id"] = template_id
-            return template_data
-            
-        # If all else fails, return a default template
-        logger.error(f"Could not retrieve template ID {template_id}")
-        return {
-            "system_message": "You are a helpful AI assistant.",
-            "user_message": f"Could not retrieve template ID {template_id}. Please try again or select a different template.",
-            "assistant_message": "",
-            "model": "gpt-4o",
-            "provider": "openai",
-            "temperature": 0.7,
-            "max_tokens": 500,
-            "top_p": 1.0,
-            "frequency_penalty": 0.0,
-            "presence_penalty": 0.0,
-            "version": 1,
-            "id": template_id,
-            "Frequency Penalty": 0.0
-        }
         
+        return fallback_template_details(template_id)
     except Exception as e:
-        logger.error(f"Error fetching template details: {str(e)}")
-        return {
-            "system_message": "You are a helpful AI assistant.",
-            "user_message": f"Error fetching template: {str(e)}",
-            "assistant_message": "",
-            "model": "gpt-4o",
-            "provider": "openai",
-            "temperature": 0.7,
-            "max_tokens": 500,
-            "top_p": 1.0,
-            "frequency_penalty": 0.0,
-            "presence_penalty": 0.0,
-            "version": 1,
-            "id": "unknown",
-            "Frequency Penalty": 0.0
-        }
\ No newline at end of file
+        return error_template_details(e)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+
+from config import OPENAI_DEFAULT_RPM, OPENAI_DEFAULT_TPM, OPENAI_MODEL_LIMITS, OPENAI_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+class RateLimitTimeout(Exception):
+    """Raised when a queued request could not be admitted before its deadline."""
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to per_minute units."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount units are available (requests larger than the bucket wait for a full bucket)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+class ModelLimiter:
+    """
+    Admission control for one model: a requests-per-minute bucket, a tokens-per-minute
+    bucket and an adaptive concurrency limit. The limit halves on every 429 and grows back
+    by roughly one slot per round of successful requests (AIMD).
+    """
+
+    def __init__(self, model, rpm, tpm, max_concurrency):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.stats = {"admitted": 0, "rate_limited": 0, "timeouts": 0, "queued": 0}
+        self._condition = threading.Condition()
+
+    def _try_admit(self, estimated_tokens, now):
+        """
+        Admit the request if capacity allows (caller holds the condition).
+        Returns None once admitted, otherwise the seconds until bucket capacity refills
+        (0 when only the concurrency limit is in the way).
+        """
+        wait = max(
+            self.blocked_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(estimated_tokens, now)
+        )
+        if wait <= 0 and self.in_flight < int(self.concurrency_limit):
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return None
+        return max(wait, 0.0)
+
+    def acquire(self, estimated_tokens, deadline):
+        """Block until the request may be sent. Raises RateLimitTimeout once deadline (monotonic) passes."""
+        with self._condition:
+            queued = False
+            while True:
+                now = time.monotonic()
+                wait = self._try_admit(estimated_tokens, now)
+                if wait is None:
+                    return
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"Timed out waiting for {self.model} rate limit capacity")
+                if not queued:
+                    queued = True
+                    self.stats["queued"] += 1
+                # Wake up when capacity refills, or earlier if a release frees a concurrency slot
+                self._condition.wait(min(wait, remaining) if wait > 0 else remaining)
+
+    async def acquire_async(self, estimated_tokens, deadline):
+        """Event-loop friendly acquire: waits with asyncio.sleep instead of blocking a thread."""
+        queued = False
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                wait = self._try_admit(estimated_tokens, now)
+                if wait is None:
+                    return
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"Timed out waiting for {self.model} rate limit capacity")
+                if not queued:
+                    queued = True
+                    self.stats["queued"] += 1
+            # Concurrency slots free up without a known time, so poll for those
+            await asyncio.sleep(min(wait, remaining) if wait > 0 else min(0.05, remaining))
+
+    def release(self, rate_limited=False, retry_after=None):
+        """Return a concurrency slot and adapt the limit to how the request went."""
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                pause = retry_after if retry_after is not None else 1.0
+                self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+                logger.warning(f"Rate limited on {self.model}: concurrency now {int(self.concurrency_limit)}, pausing {pause:.2f}s")
+            else:
+                self.concurrency_limit = min(float(self.max_concurrency),
+                                             self.concurrency_limit + 1.0 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                **self.stats,
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.concurrency_limit),
+                "requests_available": int(self.requests.tokens),
+                "tokens_available": int(self.tokens.tokens),
+                "paused_for": round(max(0.0, self.blocked_until - now), 2)
+            }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(model):
+    """Return the process-wide limiter for model, creating it from config on first use."""
+    with _limiters_lock:
+        if model not in _limiters:
+            rpm, tpm = OPENAI_MODEL_LIMITS.get(model, (OPENAI_DEFAULT_RPM, OPENAI_DEFAULT_TPM))
+            _limiters[model] = ModelLimiter(model, rpm, tpm, OPENAI_MAX_CONCURRENCY)
+        return _limiters[model]
+
+def get_limiter_stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {model: limiter.get_stats() for model, limiter in limiters.items()}
+
+def estimate_tokens(messages, max_tokens):
+    """Rough token cost of a request: ~4 characters per prompt token plus the completion budget."""
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    return prompt_chars // 4 + 4 * len(messages) + (max_tokens or 0)
+
+def _parse_duration(value):
+    """Parse OpenAI reset headers such as '1s', '250ms' or '6m0s' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    matched = False
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds if matched else None
+
+def retry_after_from_headers(headers):
+    """Work out how long to back off from the headers of a 429 response."""
+    if headers is None:
+        return None
+    milliseconds = _parse_duration(headers.get("retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000.0
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        seconds = _parse_duration(headers.get(name))
+        if seconds is not None:
+            return seconds
+    return None
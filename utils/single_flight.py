@@ -0,0 +1,90 @@
+import asyncio
+import copy
+import threading
+
+from config import COALESCE_ENABLED, COALESCE_SAMPLED
+from utils.metrics import registry
+
+coalesced_requests = registry.counter(
+    "singleflight_requests_total", "Calls through single-flight by operation and role (leader, coalesced)",
+    ("operation", "role"))
+
+def should_coalesce(temperature, coalesce=None):
+    """
+    Whether a generation may share an identical in-flight request's result. An explicit
+    coalesce from the caller wins; otherwise deterministic requests (temperature 0) are
+    coalesced, and sampled ones only when COALESCE_SAMPLED is set.
+    """
+    if not COALESCE_ENABLED:
+        return False
+    if coalesce is not None:
+        return bool(coalesce)
+    return COALESCE_SAMPLED or not temperature
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Merge identical concurrent calls: the first caller for a key runs the function and
+    every caller that arrives while it runs waits for, and gets a copy of, its result
+    (or its exception). Nothing is kept once the call finishes.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        coalesced_requests.inc(operation=self.operation, role="leader" if leader else "coalesced")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+class AsyncSingleFlight:
+    """
+    Async counterpart of SingleFlight. The call runs as its own task, so a caller that is
+    cancelled (e.g. a client that disconnects) doesn't cancel it for the others.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self._calls = {}
+
+    async def do(self, key, function):
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        task = self._calls.get(call_key)
+        leader = task is None
+        if leader:
+            task = self._calls[call_key] = loop.create_task(function())
+            task.add_done_callback(lambda _: self._calls.pop(call_key, None))
+        coalesced_requests.inc(operation=self.operation, role="leader" if leader else "coalesced")
+
+        result = await asyncio.shield(task)
+        return result if leader else copy.deepcopy(result)
@@ -0,0 +1,150 @@
+import atexit
+import itertools
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_ASYNC, LOG_FIELD_MAX_CHARS, LOG_SAMPLE_RATES, LOG_SAMPLE_DEFAULT
+from utils.metrics import registry
+
+# Format of the classic text log lines
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Items kept from a list or dict event field (the rest are summarised as a count)
+MAX_FIELD_ITEMS = 20
+
+# Records waiting for the writer thread. When it falls this far behind, new records are dropped
+LOG_QUEUE_SIZE = 10000
+
+dropped_records = registry.counter(
+    "log_records_dropped_total", "Log records dropped because the async log queue was full")
+
+def truncate_field(value, limit=LOG_FIELD_MAX_CHARS, depth=0):
+    """
+    Cap an event field before it is serialized: long strings are cut to limit characters,
+    lists and dicts to MAX_FIELD_ITEMS items, and anything nested deeper than two levels
+    is replaced by its size.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= limit else f"{value[:limit]}...(+{len(value) - limit} chars)"
+    if isinstance(value, dict):
+        if depth >= 2:
+            return f"<{len(value)} keys>"
+        capped = {str(key): truncate_field(item, limit, depth + 1)
+                  for key, item in itertools.islice(value.items(), MAX_FIELD_ITEMS)}
+        if len(value) > MAX_FIELD_ITEMS:
+            capped["..."] = f"+{len(value) - MAX_FIELD_ITEMS} keys"
+        return capped
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if depth >= 2:
+            return f"<{len(value)} items>"
+        capped = [truncate_field(item, limit, depth + 1) for item in itertools.islice(value, MAX_FIELD_ITEMS)]
+        if len(value) > MAX_FIELD_ITEMS:
+            capped.append(f"+{len(value) - MAX_FIELD_ITEMS} items")
+        return capped
+    return truncate_field(str(value), limit, depth)
+
+class LogEvent:
+    """An event name and its fields. The text form is only built if a handler formats the record."""
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        return " ".join([self.event] + [f"{key}={json.dumps(value, default=str)}" for key, value in self.fields.items()])
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """
+    Log a named event with structured fields, e.g. log_event(logger, "generation.request", model=model).
+
+    Nothing is done when the level is disabled. INFO and DEBUG events are sampled at the
+    rate configured for the event in LOG_SAMPLE_RATES (sampled events carry sample_rate).
+    Fields are truncated before anything is serialized, so passing a large payload costs
+    at most LOG_FIELD_MAX_CHARS per string.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        rate = LOG_SAMPLE_RATES.get(event, LOG_SAMPLE_DEFAULT)
+        if rate < 1.0:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+    fields = {key: truncate_field(value) for key, value in fields.items()}
+    logger.log(level, "%s", LogEvent(event, fields), extra={"event": event, "event_fields": fields}, stacklevel=2)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message or event, and the event's fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry["event"] = event
+            entry.update(record.event_fields)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Hand records to the writer thread without formatting them first (QueueHandler
+    formats in the caller by default), and drop records rather than block when the
+    queue is full.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records.inc()
+
+_listener = None
+
+def _stop_listener():
+    """Flush queued records (called at exit and before reconfiguring)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, use_queue=LOG_ASYNC):
+    """
+    Set up the root logger: text or JSON lines on stderr, written by a background
+    thread when use_queue is true so request threads only pay for an enqueue.
+    Replaces any handlers configured earlier.
+    """
+    _stop_listener()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    if use_queue:
+        global _listener
+        records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _listener = QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        root.addHandler(DeferredQueueHandler(records))
+    else:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+atexit.register(_stop_listener)
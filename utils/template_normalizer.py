@@ -0,0 +1,209 @@
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Roles that have their own field in the template details sent to the UI
+MESSAGE_ROLES = ("system", "user", "assistant")
+
+# Model parameters read from metadata.model.parameters and llm_kwargs, with their defaults and types
+MODEL_PARAMETERS = (
+    ("temperature", 0.7, float),
+    ("max_tokens", 500, int),
+    ("top_p", 1.0, float),
+    ("frequency_penalty", 0.0, float),
+    ("presence_penalty", 0.0, float),
+)
+
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful AI assistant."
+
+# PromptLayer roles sent to OpenAI as another role
+ROLE_ALIASES = {"developer": "system"}
+
+# PromptLayer roles with no plain-text chat equivalent (tool results, template placeholders); left out of the conversation
+DROPPED_ROLES = ("function", "tool", "placeholder")
+
+_TemplateRecordBase = namedtuple("_TemplateRecordBase", [
+    "id", "version", "model", "provider", "temperature", "max_tokens", "top_p",
+    "frequency_penalty", "presence_penalty", "messages",
+    "system_message", "user_message", "assistant_message"
+])
+
+class TemplateRecord(_TemplateRecordBase):
+    """
+    Immutable, normalized PromptLayer template.
+    messages is the full ordered conversation as a tuple of (role, content) pairs;
+    system/user/assistant_message are the single-field view used by the comparison UI.
+    """
+    __slots__ = ()
+
+    def to_dict(self):
+        """Template details in the shape returned by get_template_details."""
+        return {
+            "system_message": self.system_message,
+            "user_message": self.user_message,
+            "assistant_message": self.assistant_message,
+            "model": self.model,
+            "provider": self.provider,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "top_p": self.top_p,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty,
+            "version": self.version,
+            "id": self.id,
+            "Frequency Penalty": self.frequency_penalty,  # Renamed parameter for display
+            "messages": [{"role": role, "content": content} for role, content in self.messages],
+        }
+
+DEFAULT_TEMPLATE_RECORD = TemplateRecord(
+    id="unknown", version=1, model="gpt-4o", provider="openai", temperature=0.7, max_tokens=500,
+    top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0,
+    messages=(("system", DEFAULT_SYSTEM_MESSAGE), ("user", "Please provide information about this topic.")),
+    system_message=DEFAULT_SYSTEM_MESSAGE,
+    user_message="Please provide information about this topic.",
+    assistant_message=""
+)
+
+def flatten_content(content):
+    """Message content as plain text: strings pass through, content part lists are joined."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            item if isinstance(item, str) else item.get("text", "") if isinstance(item, dict) else ""
+            for item in content
+        )
+    return ""
+
+def normalize_message_roles(messages):
+    """
+    A {"role", "content"} messages list with ROLE_ALIASES mapped and DROPPED_ROLES removed,
+    so conversations taken from PromptLayer can be sent to OpenAI. Anything else is left as is.
+    """
+    if not isinstance(messages, list):
+        return messages
+    normalized = []
+    for message in messages:
+        if isinstance(message, dict):
+            if message.get("role") in DROPPED_ROLES:
+                continue
+            if message.get("role") in ROLE_ALIASES:
+                message = {**message, "role": ROLE_ALIASES[message["role"]]}
+        normalized.append(message)
+    return normalized
+
+def _extract_messages(messages):
+    """Ordered (role, text) pairs from a chat messages list, with PromptLayer-only roles mapped or dropped."""
+    return tuple(
+        (ROLE_ALIASES.get(message["role"], message["role"]), flatten_content(message.get("content")))
+        for message in messages or () if message.get("role") and message["role"] not in DROPPED_ROLES
+    )
+
+def _extract_direct_fields(template_data):
+    """Format 1: direct system_message / user_message / assistant_message fields."""
+    messages = tuple(
+        (role, template_data.get(f"{role}_message") or "")
+        for role in MESSAGE_ROLES if template_data.get(f"{role}_message")
+    )
+    return messages, None
+
+def _extract_prompt_template(template_data):
+    """Format 2: prompt_template.messages."""
+    return _extract_messages(template_data["prompt_template"].get("messages")), None
+
+def _extract_llm_kwargs(template_data):
+    """Format 3: llm_kwargs holding the model, its parameters and the messages."""
+    llm_kwargs = template_data["llm_kwargs"]
+    return _extract_messages(llm_kwargs.get("messages")), llm_kwargs
+
+def _extract_prompt(template_data):
+    """Format 4: a single prompt field, used as the user message."""
+    return (("system", DEFAULT_SYSTEM_MESSAGE), ("user", template_data.get("prompt", "") or "")), None
+
+# Format detection table, checked in order. Each row is (required keys, extractor, user message separator):
+# a separator joins every user message into user_message, None keeps only the last one.
+TEMPLATE_FORMATS = (
+    (frozenset(("system_message", "user_message")), _extract_direct_fields, None),
+    (frozenset(("prompt_template",)), _extract_prompt_template, None),
+    (frozenset(("llm_kwargs",)), _extract_llm_kwargs, "\n\n"),
+    (frozenset(("prompt",)), _extract_prompt, None),
+)
+
+def _model_settings(template_data, llm_kwargs):
+    """Model, provider and parameters: defaults, then metadata.model, then llm_kwargs."""
+    settings = {name: default for name, default, _ in MODEL_PARAMETERS}
+    model = "gpt-3.5-turbo"
+    provider = "openai"
+
+    metadata = template_data.get("metadata")
+    model_info = metadata.get("model") if isinstance(metadata, dict) else None
+    if model_info:
+        model = model_info.get("name", model)
+        provider = model_info.get("provider", provider)
+        parameters = model_info.get("parameters") or {}
+        for name in settings:
+            if name in parameters:
+                settings[name] = parameters[name]
+
+    if llm_kwargs:
+        model = llm_kwargs.get("model", model)
+        for name in settings:
+            if name in llm_kwargs:
+                settings[name] = llm_kwargs[name]
+
+    for name, _, convert in MODEL_PARAMETERS:
+        settings[name] = convert(settings[name])
+    return model or "gpt-4o", provider, settings
+
+def normalize_template(template_data):
+    """
+    Normalize a raw PromptLayer template into a TemplateRecord in a single pass.
+    Malformed templates produce DEFAULT_TEMPLATE_RECORD.
+    """
+    try:
+        messages, llm_kwargs, user_separator = (), None, None
+        for required_keys, extractor, separator in TEMPLATE_FORMATS:
+            if required_keys.issubset(template_data.keys()):
+                messages, llm_kwargs = extractor(template_data)
+                user_separator = separator
+                break
+
+        # Single-field view: the last message of each role (or every user message joined)
+        fields = {role: "" for role in MESSAGE_ROLES}
+        user_parts = []
+        for role, content in messages:
+            if role == "user" and user_separator is not None:
+                # Messages without text (content None or empty) would only add stray separators
+                if content:
+                    user_parts.append(content)
+            elif role in fields:
+                fields[role] = content
+        if user_parts:
+            fields["user"] = user_separator.join(user_parts)
+
+        # Templates in an unknown shape: use the first long text field as the user message
+        if not fields["user"]:
+            fallback = next((value for value in template_data.values() if isinstance(value, str) and len(value) > 20), None)
+            if fallback:
+                logger.warning("No user message found in template, using the first long text field")
+                fields["user"] = fallback
+                messages += (("user", fallback),)
+
+        model, provider, settings = _model_settings(template_data, llm_kwargs)
+        record = TemplateRecord(
+            id=template_data.get("id", "unknown"),
+            version=template_data.get("version", 1),
+            model=model,
+            provider=provider,
+            messages=messages,
+            system_message=fields["system"],
+            user_message=fields["user"],
+            assistant_message=fields["assistant"],
+            **settings
+        )
+        logger.debug(f"Normalized template {record.id} version {record.version}: {len(messages)} messages")
+        return record
+    except Exception as e:
+        logger.error(f"Error processing specific template: {str(e)}")
+        return DEFAULT_TEMPLATE_RECORD
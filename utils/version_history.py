@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import TEMPLATE_VERSION_INDEX_PATH, TEMPLATE_VERSION_FETCH_CONCURRENCY
+from utils.diff_engine import diff_template_fields, TEMPLATE_DIFF_FIELDS
+from utils.promptlayer_api import (
+    BASE_URL, http_client, get_headers, template_request_payload, process_specific_template, get_cached_template
+)
+from utils.template_normalizer import MODEL_PARAMETERS
+
+logger = logging.getLogger(__name__)
+
+# Template settings compared alongside the message fields in a version diff
+VERSION_DIFF_PARAMETERS = ("model",) + tuple(name for name, _, _ in MODEL_PARAMETERS)
+
+class TemplateVersionIndex:
+    """
+    Local index of processed template versions keyed by (template_id, version), stored in SQLite.
+    A published version never changes, so entries don't expire. Versions the API answers
+    with a 404 are recorded as missing (template NULL) so they aren't requested again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        """Open the SQLite file on first use."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS template_versions ("
+                "template_id TEXT NOT NULL, version INTEGER NOT NULL, template TEXT, fetched_at REAL NOT NULL, "
+                "PRIMARY KEY (template_id, version))"
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, template_id, version):
+        """Return the indexed template for one version, or None if it isn't indexed (or is missing)."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT template FROM template_versions WHERE template_id = ? AND version = ?",
+                (str(template_id), int(version))
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def get_many(self, template_id, versions):
+        """Return {version: template} for the requested versions that are indexed."""
+        versions = [int(version) for version in versions]
+        if not versions:
+            return {}
+        placeholders = ",".join("?" * len(versions))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT version, template FROM template_versions WHERE template_id = ? "
+                f"AND version IN ({placeholders}) AND template IS NOT NULL",
+                [str(template_id)] + versions
+            ).fetchall()
+        return {version: json.loads(template) for version, template in rows}
+
+    def put(self, template_id, version, template):
+        """Index one version. template=None records that the version does not exist."""
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO template_versions (template_id, version, template, fetched_at) VALUES (?, ?, ?, ?)",
+                (str(template_id), int(version), json.dumps(template) if template is not None else None, time.time())
+            )
+            db.commit()
+
+    def versions(self, template_id):
+        """Return (indexed versions, versions known to be missing) for a template, both sorted."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT version, template IS NOT NULL FROM template_versions WHERE template_id = ? ORDER BY version",
+                (str(template_id),)
+            ).fetchall()
+        return [version for version, found in rows if found], [version for version, found in rows if not found]
+
+    def remove(self, template_id=None):
+        """Drop one template's versions, or the whole index. Returns the number of rows removed."""
+        with self._lock:
+            db = self._connect()
+            if template_id is None:
+                cursor = db.execute("DELETE FROM template_versions")
+            else:
+                cursor = db.execute("DELETE FROM template_versions WHERE template_id = ?", (str(template_id),))
+            db.commit()
+        return cursor.rowcount
+
+# Shared index used by the version history routes
+version_index = TemplateVersionIndex(TEMPLATE_VERSION_INDEX_PATH)
+
+# One sync per template at a time; concurrent callers wait for it and then read the index
+_sync_locks = {}
+_sync_locks_guard = threading.Lock()
+
+def _sync_lock(template_id):
+    with _sync_locks_guard:
+        return _sync_locks.setdefault(str(template_id), threading.Lock())
+
+def _fetch_version(template_id, version):
+    """
+    Fetch one version from the API. Returns (version, template, answered): answered is True for
+    a final answer, the template or a 404 (the version doesn't exist, template None). Anything
+    else (5xx, 429, auth errors, network errors, a different version in the payload) returns
+    answered False so the version is not indexed and a later lookup tries again.
+    """
+    try:
+        response = http_client.post(f"{BASE_URL}/prompt-templates/{template_id}",
+                                    json=template_request_payload(version), headers=get_headers())
+    except Exception as e:
+        logger.error(f"Error fetching template {template_id} version {version}: {str(e)}")
+        return version, None, False
+    if response.status_code == 404:
+        return version, None, True
+    if response.status_code != 200:
+        logger.warning(f"Template {template_id} version {version} returned {response.status_code}, will retry later")
+        return version, None, False
+
+    try:
+        payload = response.json()
+        template_data = payload["template"]
+        template = process_specific_template(template_data)
+    except Exception as e:
+        logger.error(f"Unexpected response for template {template_id} version {version}: {str(e)}")
+        return version, None, False
+
+    reported = template_data.get("version", payload.get("version"))
+    if reported is not None and str(reported) != str(version):
+        logger.warning(f"Asked for template {template_id} version {version} but got version {reported}")
+        return version, None, False
+    # The payload confirms the version (or doesn't report one, and the normalizer would default it to 1)
+    template["version"] = version
+    template["id"] = template_id
+    return version, template, True
+
+def latest_version(template_id):
+    """Latest version number of a template, from the template cache."""
+    template = get_cached_template(template_id)
+    if not template:
+        return None
+    try:
+        return int(template.get("version") or 0) or None
+    except (TypeError, ValueError):
+        return None
+
+def sync_template_versions(template_id, latest=None, concurrency=TEMPLATE_VERSION_FETCH_CONCURRENCY):
+    """
+    Make sure versions 1..latest of a template are in the index, fetching the ones that
+    aren't concurrently. Versions that failed with an error are retried on the next sync.
+
+    Returns:
+        dict: latest version, indexed and missing versions, how many were fetched and the time taken
+    """
+    started = time.perf_counter()
+    latest = int(latest) if latest else latest_version(template_id)
+    if not latest:
+        return {"template_id": template_id, "latest": None, "versions": [], "missing": [],
+                "fetched": 0, "failed": [], "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    with _sync_lock(template_id):
+        indexed, missing = version_index.versions(template_id)
+        known = set(indexed) | set(missing)
+        to_fetch = [version for version in range(1, latest + 1) if version not in known]
+        failed = []
+        if to_fetch:
+            logger.info(f"Fetching {len(to_fetch)} versions of template {template_id}")
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(to_fetch))),
+                                    thread_name_prefix="template-versions") as executor:
+                for version, template, answered in executor.map(lambda v: _fetch_version(template_id, v), to_fetch):
+                    if answered:
+                        version_index.put(template_id, version, template)
+                    else:
+                        failed.append(version)
+            indexed, missing = version_index.versions(template_id)
+
+    return {
+        "template_id": template_id,
+        "latest": latest,
+        "versions": [version for version in indexed if version <= latest],
+        "missing": [version for version in missing if version <= latest],
+        "fetched": len(to_fetch) - len(failed),
+        "failed": failed,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def get_template_version(template_id, version):
+    """One version of a template, from the index or (once) from the API."""
+    template = version_index.get(template_id, version)
+    if template is not None:
+        return template
+    version, template, answered = _fetch_version(template_id, int(version))
+    if answered:
+        version_index.put(template_id, version, template)
+    return template
+
+def _parameter_changes(old, new):
+    """Template settings that differ between two versions, as name -> [old, new]."""
+    return {name: [old.get(name), new.get(name)] for name in VERSION_DIFF_PARAMETERS if old.get(name) != new.get(name)}
+
+def diff_template_versions(template_id, versions, granularity="word", fields=TEMPLATE_DIFF_FIELDS):
+    """
+    Diff a sequence of versions of one template: each version against the next, in the order
+    given, plus the first against the last when more than two versions are requested.
+    Versions not yet indexed are fetched once; everything after that is served from the index.
+
+    Raises:
+        KeyError: if a requested version does not exist
+    """
+    versions = [int(version) for version in versions]
+    templates = version_index.get_many(template_id, versions)
+    absent = [version for version in dict.fromkeys(versions) if version not in templates]
+    if absent:
+        with ThreadPoolExecutor(max_workers=max(1, min(TEMPLATE_VERSION_FETCH_CONCURRENCY, len(absent))),
+                                thread_name_prefix="template-versions") as executor:
+            for version, template in zip(absent, executor.map(lambda v: get_template_version(template_id, v), absent)):
+                if template is not None:
+                    templates[version] = template
+    not_found = [version for version in absent if version not in templates]
+    if not_found:
+        raise KeyError(f"Template {template_id} has no version {', '.join(str(v) for v in not_found)}")
+
+    pairs = list(zip(versions, versions[1:]))
+    if len(versions) > 2:
+        pairs.append((versions[0], versions[-1]))
+    return {
+        "template_id": template_id,
+        "versions": versions,
+        "granularity": granularity,
+        "diffs": [
+            {
+                "from": old_version,
+                "to": new_version,
+                "parameters": _parameter_changes(templates[old_version], templates[new_version]),
+                "fields": diff_template_fields(templates[old_version], templates[new_version], granularity, fields)
+            }
+            for old_version, new_version in pairs
+        ]
+    }